@@ -0,0 +1,188 @@
+"""
+Benchmark the supervisor dashboard queries with and without composite indexes
+
+Fills a scratch SQLite database with synthetic help requests, then times the
+dashboard, requests and stats queries before and after the indexes added by
+schema migration 1, printing SQLite's query plan for each.
+
+Usage: python benchmarks/dashboard_queries.py [--rows 1000000] [--knowledge 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.orm import Session
+
+from src.database import (
+    Base, HelpRequest, KnowledgeEntry,
+    REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED,
+)
+from src.migrations import MIGRATIONS
+
+# Before migration 1 the tables only had their primary key column indexes
+BASELINE_INDEXES = {"ix_help_requests_id", "ix_knowledge_entries_id"}
+
+QUERIES = {
+    "pending requests": select(HelpRequest).where(
+        HelpRequest.status == REQUEST_STATUS_PENDING
+    ).order_by(HelpRequest.created_at.desc()),
+    "recent resolved": select(HelpRequest).where(
+        HelpRequest.status == REQUEST_STATUS_RESOLVED
+    ).order_by(HelpRequest.resolved_at.desc()).limit(10),
+    "recent knowledge": select(KnowledgeEntry).where(
+        KnowledgeEntry.is_active == True
+    ).order_by(KnowledgeEntry.created_at.desc()).limit(20),
+    "stats counts": None,
+}
+
+
+def populate(engine, rows: int, knowledge: int):
+    """Insert synthetic requests: ~0.1% pending, 85% resolved, the rest unresolved"""
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            created_at = start + timedelta(seconds=i * 30)
+            roll = rng.random()
+            if roll < 0.001:
+                status, resolved_at = REQUEST_STATUS_PENDING, None
+            elif roll < 0.85:
+                status, resolved_at = REQUEST_STATUS_RESOLVED, created_at + timedelta(minutes=rng.randint(1, 30))
+            else:
+                status, resolved_at = REQUEST_STATUS_UNRESOLVED, created_at + timedelta(minutes=30)
+            batch.append({
+                "customer_phone": f"555-{rng.randrange(10000):04d}",
+                "customer_name": f"Customer {i}",
+                "question": f"Synthetic question {i}",
+                "status": status,
+                "created_at": created_at,
+                "resolved_at": resolved_at,
+            })
+            if len(batch) == 50000:
+                conn.execute(insert(HelpRequest), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(HelpRequest), batch)
+
+        conn.execute(insert(KnowledgeEntry), [
+            {
+                "question": f"Synthetic question {i}",
+                "answer": f"Answer {i}",
+                "created_at": start + timedelta(minutes=i),
+                "is_active": rng.random() < 0.9,
+            }
+            for i in range(knowledge)
+        ])
+
+
+def create_baseline_schema(engine):
+    """Create the tables, then drop every index added by migrations since the baseline"""
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in (HelpRequest.__table__, KnowledgeEntry.__table__):
+            for index in table.indexes:
+                if index.name not in BASELINE_INDEXES:
+                    index.drop(conn)
+
+
+def index_names(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name IN ('help_requests', 'knowledge_entries') AND sql IS NOT NULL ORDER BY name"
+        )).scalars().all()
+
+
+def run_query(session: Session, name: str):
+    if name == "stats counts":
+        for status in (REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED):
+            session.scalar(select(func.count()).select_from(HelpRequest).where(HelpRequest.status == status))
+        session.scalar(select(func.count()).select_from(KnowledgeEntry).where(KnowledgeEntry.is_active == True))
+    else:
+        session.execute(QUERIES[name]).scalars().all()
+
+
+def query_plan(engine, name: str) -> str:
+    if QUERIES[name] is None:
+        statement = select(func.count()).select_from(HelpRequest).where(HelpRequest.status == REQUEST_STATUS_RESOLVED)
+    else:
+        statement = QUERIES[name]
+    compiled = statement.compile(engine, compile_kwargs={"literal_binds": True})
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return "; ".join(row[-1] for row in rows)
+
+
+def time_queries(engine, repeats: int):
+    results = {}
+    with Session(engine) as session:
+        for name in QUERIES:
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                run_query(session, name)
+                samples.append(time.perf_counter() - start)
+            results[name] = statistics.median(samples) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard queries")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--knowledge", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print("Dashboard Query Benchmark")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        create_baseline_schema(engine)
+        print(f"Baseline indexes: {', '.join(index_names(engine))}")
+
+        print(f"Populating {args.rows:,} help requests and {args.knowledge:,} knowledge entries...")
+        start = time.perf_counter()
+        populate(engine, args.rows, args.knowledge)
+        print(f"Populated in {time.perf_counter() - start:.1f}s")
+
+        before = time_queries(engine, args.repeats)
+        plans_before = {name: query_plan(engine, name) for name in QUERIES}
+
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            for step in MIGRATIONS[0][2]:
+                conn.execute(text(step))
+        print(f"Created indexes in {time.perf_counter() - start:.1f}s")
+        print(f"Indexes after migration 1: {', '.join(index_names(engine))}")
+
+        after = time_queries(engine, args.repeats)
+        plans_after = {name: query_plan(engine, name) for name in QUERIES}
+
+        print(f"\n   {'query':<20}{'before ms':>12}{'after ms':>12}")
+        for name in QUERIES:
+            print(f"   {name:<20}{before[name]:>12.2f}{after[name]:>12.2f}")
+        total_before = sum(before.values())
+        total_after = sum(after.values())
+        print(f"   {'dashboard total':<20}{total_before:>12.2f}{total_after:>12.2f}")
+
+        print("\nQuery plans (before -> after):")
+        for name in QUERIES:
+            print(f"   {name}:")
+            print(f"      {plans_before[name]}")
+            print(f"      {plans_after[name]}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Benchmark concurrent writers and dashboard readers on SQLite
+
+Starts N writer processes (the voice agent creating and resolving help
+requests) and M reader processes (supervisor dashboards polling) against a
+scratch database, once with SQLite's default settings and once with the
+tuned profile from Settings (WAL, synchronous=NORMAL, busy_timeout, mmap and
+a larger page cache). Reports throughput, latency and "database is locked"
+errors for each.
+
+With the default 5 second busy timeout both profiles wait out every lock
+conflict, so neither reports errors and they differ only in throughput and
+latency, which vary between machines. A short --busy-timeout-ms (e.g. 50)
+turns long waits into errors: in rollback journal mode readers and writers
+block each other and both fail, while in WAL mode readers never wait and
+only writers contending with each other can fail.
+
+Usage: python benchmarks/db_concurrency.py [--writers 4] [--readers 8] [--seconds 10] [--busy-timeout-ms 5000]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from src.config import Settings
+from src.database import (
+    Base, HelpRequest, KnowledgeEntry, create_db_engine,
+    REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED,
+)
+
+
+def profile_settings(name: str, busy_timeout_ms: int) -> Settings:
+    """Settings for a benchmark profile: SQLite's own defaults, or the app's tuned ones"""
+    config = Settings()
+    if name == "default":
+        config.SQLITE_JOURNAL_MODE = "DELETE"
+        config.SQLITE_SYNCHRONOUS = "FULL"
+        config.SQLITE_MMAP_SIZE = 0
+        config.SQLITE_CACHE_SIZE = -2000
+    # Both profiles wait equally long for locks, so only the journal settings differ
+    config.SQLITE_BUSY_TIMEOUT_MS = busy_timeout_ms
+    # Slow statement logs would interleave with the results
+    config.DB_SLOW_QUERY_MS = float("inf")
+    config.DB_LOG_SAMPLE_RATE = 0
+    return config
+
+
+def is_lock_error(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def writer(url: str, profile: str, seconds: float, seed: int, results, busy_timeout_ms: int):
+    """Create a help request, then resolve an older pending one, until time is up"""
+    engine = create_db_engine(url, profile_settings(profile, busy_timeout_ms), echo=False)
+    rng = random.Random(seed)
+    ops, errors, latencies = 0, 0, []
+    deadline = time.perf_counter() + seconds
+    with Session(engine) as session:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                session.add(HelpRequest(
+                    customer_phone=f"+1555{rng.randrange(10 ** 7):07d}",
+                    customer_name="Benchmark",
+                    question=f"Question {rng.random()}"
+                ))
+                session.commit()
+
+                pending = session.execute(select(HelpRequest).where(
+                    HelpRequest.status == REQUEST_STATUS_PENDING
+                ).order_by(HelpRequest.created_at).limit(1)).scalars().first()
+                if pending:
+                    pending.status = REQUEST_STATUS_RESOLVED
+                    pending.supervisor_response = "Answered"
+                    pending.resolved_at = datetime.utcnow()
+                session.commit()
+                ops += 1
+                latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                session.rollback()
+                if not is_lock_error(e):
+                    raise
+                errors += 1
+    engine.dispose()
+    results.put(("writer", ops, errors, latencies))
+
+
+def reader(url: str, profile: str, seconds: float, seed: int, results, busy_timeout_ms: int):
+    """Run the supervisor dashboard queries in a loop until time is up"""
+    engine = create_db_engine(url, profile_settings(profile, busy_timeout_ms), echo=False)
+    ops, errors, latencies = 0, 0, []
+    deadline = time.perf_counter() + seconds
+    with Session(engine) as session:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                session.execute(select(HelpRequest).where(
+                    HelpRequest.status == REQUEST_STATUS_PENDING
+                ).order_by(HelpRequest.created_at.desc()).limit(50)).scalars().all()
+                session.execute(select(HelpRequest).where(
+                    HelpRequest.status == REQUEST_STATUS_RESOLVED
+                ).order_by(HelpRequest.resolved_at.desc()).limit(10)).scalars().all()
+                session.execute(select(func.count()).select_from(HelpRequest).where(
+                    HelpRequest.status == REQUEST_STATUS_PENDING
+                )).scalar()
+                session.execute(select(KnowledgeEntry).where(
+                    KnowledgeEntry.is_active == True
+                ).order_by(KnowledgeEntry.created_at.desc()).limit(20)).scalars().all()
+                session.rollback()
+                ops += 1
+                latencies.append(time.perf_counter() - start)
+            except OperationalError as e:
+                session.rollback()
+                if not is_lock_error(e):
+                    raise
+                errors += 1
+    engine.dispose()
+    results.put(("reader", ops, errors, latencies))
+
+
+def run_profile(profile: str, directory: str, args) -> dict:
+    url = f"sqlite:///{os.path.join(directory, f'{profile}.db')}"
+    engine = create_db_engine(url, profile_settings(profile, args.busy_timeout_ms), echo=False)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=writer, args=(url, profile, args.seconds, i, results, args.busy_timeout_ms))
+        for i in range(args.writers)
+    ] + [
+        multiprocessing.Process(target=reader, args=(url, profile, args.seconds, i, results, args.busy_timeout_ms))
+        for i in range(args.readers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {}
+    for role in ("writer", "reader"):
+        rows = [row for row in collected if row[0] == role]
+        latencies = sorted(latency for row in rows for latency in row[3])
+        summary[role] = {
+            "ops": sum(row[1] for row in rows),
+            "errors": sum(row[2] for row in rows),
+            "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent SQLite writers and readers")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    # 5000 matches the timeout Python's sqlite3 module uses by default
+    parser.add_argument("--busy-timeout-ms", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("Database Concurrency Benchmark")
+    print("=" * 50)
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:g}s per profile, "
+          f"{args.busy_timeout_ms} ms busy timeout")
+
+    with tempfile.TemporaryDirectory() as directory:
+        summaries = {profile: run_profile(profile, directory, args) for profile in ("default", "tuned")}
+
+    for role in ("writer", "reader"):
+        print(f"\n   {role + 's':<10}{'ops/s':>10}{'lock errors':>14}{'p50 ms':>10}{'p99 ms':>10}")
+        for profile, summary in summaries.items():
+            stats = summary[role]
+            print(f"   {profile:<10}{stats['ops'] / args.seconds:>10.1f}{stats['errors']:>14}"
+                  f"{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark the CPU cost of idle voice calls
+
+Holds N simulated calls open with nobody speaking and measures process CPU
+time, first for the agent's event-driven call loop and then for the previous
+design, which woke every call once a second to check its state. Uses local
+fake LiveKit objects, so no server is needed.
+
+Usage: python benchmarks/idle_calls_cpu.py [--calls 500] [--seconds 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.voice_agent import SalonVoiceAgent, CallSession
+
+
+class FakeRoom:
+    def __init__(self, name: str, identity: str):
+        self.name = name
+        self.remote_participants = [SimpleNamespace(identity=identity, name=None)]
+        self.handlers = {}
+
+    def on(self, event: str, handler):
+        self.handlers[event] = handler
+
+    def hang_up(self):
+        self.handlers["participant_disconnected"](self.remote_participants[0])
+
+
+class FakeJobContext:
+    def __init__(self, room: FakeRoom):
+        self.room = room
+
+    async def wait_for_participant_connected(self):
+        pass
+
+
+class SilentAssistant:
+    def __init__(self, agent, session):
+        pass
+
+    def on(self, event: str, handler):
+        pass
+
+    async def start(self, room):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+async def polling_call(session: CallSession):
+    """The previous call loop: check the call's state once a second"""
+    while not session.ended:
+        if session.current_request is not None:
+            break
+        await asyncio.sleep(1)
+
+
+async def measure(seconds: float) -> float:
+    """CPU seconds used by this process over a wall clock interval"""
+    await asyncio.sleep(0.5)  # let calls settle
+    cpu_start = time.process_time()
+    await asyncio.sleep(seconds)
+    return time.process_time() - cpu_start
+
+
+async def event_driven(calls: int, seconds: float) -> float:
+    agent = SalonVoiceAgent(assistant_factory=SilentAssistant, max_concurrent_calls=calls)
+    rooms = [FakeRoom(f"room-{index}", f"+1555{index:07d}") for index in range(calls)]
+    tasks = [asyncio.create_task(agent.handle_voice_call(FakeJobContext(room))) for room in rooms]
+    cpu = await measure(seconds)
+    for room in rooms:
+        room.hang_up()
+    await asyncio.gather(*tasks)
+    return cpu
+
+
+async def polling(calls: int, seconds: float) -> float:
+    sessions = [CallSession(f"room-{index}", f"+1555{index:07d}") for index in range(calls)]
+    tasks = [asyncio.create_task(polling_call(session)) for session in sessions]
+    cpu = await measure(seconds)
+    for session in sessions:
+        session.ended = True
+    await asyncio.gather(*tasks)
+    return cpu
+
+
+async def baseline(seconds: float) -> float:
+    return await measure(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark idle voice call CPU")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print("Idle Call CPU Benchmark")
+    print("=" * 50)
+    print(f"{args.calls} idle calls, {args.seconds:g}s each")
+
+    results = {
+        "no calls": asyncio.run(baseline(args.seconds)),
+        "polling (1s)": asyncio.run(polling(args.calls, args.seconds)),
+        "event-driven": asyncio.run(event_driven(args.calls, args.seconds)),
+    }
+    print(f"\n   {'call loop':<16}{'CPU ms/s':>10}{'CPU %':>8}")
+    for name, cpu in results.items():
+        print(f"   {name:<16}{cpu / args.seconds * 1000:>10.2f}{cpu / args.seconds * 100:>8.2f}")
+    print(f"\n   Polling wakes {args.calls} calls per second; event-driven calls wake only on call events")
+
+
+if __name__ == "__main__":
+    main()
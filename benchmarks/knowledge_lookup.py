@@ -0,0 +1,113 @@
+"""
+Benchmark knowledge base lookups
+
+Compares the original per-entry Jaccard loop against the inverted index and
+the NumPy hashed-vector backend on synthetic salon questions.
+
+Usage: python benchmarks/knowledge_lookup.py [--sizes 1000 10000 100000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.knowledge_index import STOPWORDS, KnowledgeIndex
+
+SUBJECTS = ["haircut", "coloring", "highlights", "manicure", "pedicure", "facial", "massage",
+            "waxing", "blowout", "perm", "extensions", "eyebrows", "lashes", "bridal", "kids"]
+TEMPLATES = [
+    "How much does a {} cost {}?",
+    "Do you offer {} {}?",
+    "How long does a {} take {}?",
+    "Can I book a {} {}?",
+    "Is there a discount on {} {}?",
+    "What products do you use for {} {}?",
+]
+# Synthetic vocabulary for the details that make each question distinct
+VOCABULARY = [f"word{i}" for i in range(5000)]
+
+
+def make_question(rng: random.Random) -> str:
+    """Generate a synthetic customer question"""
+    details = " ".join(rng.sample(VOCABULARY, rng.randint(2, 4)))
+    return rng.choice(TEMPLATES).format(rng.choice(SUBJECTS), details)
+
+
+def questions_match(question1: str, question2: str) -> bool:
+    """The original Jaccard overlap check from KnowledgeBase.get_answer"""
+    words1 = set(question1.split()) - STOPWORDS
+    words2 = set(question2.split()) - STOPWORDS
+    overlap = len(words1.intersection(words2))
+    total_words = len(words1.union(words2))
+    return overlap / total_words > 0.5 if total_words > 0 else False
+
+
+def baseline_lookup(entries, question):
+    question_lower = question.lower().strip()
+    for entry_question, answer in entries:
+        if questions_match(question_lower, entry_question.lower()):
+            return answer
+    return None
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.99)] * 1000
+
+
+def time_lookups(lookup, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        lookup(query)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def run(size: int, query_count: int):
+    rng = random.Random(size)
+    rows = [(entry_id, make_question(rng), f"answer {entry_id}") for entry_id in range(1, size + 1)]
+    # Half the queries repeat a known question, half are new
+    queries = [rng.choice(rows)[1] for _ in range(query_count // 2)]
+    queries += [make_question(rng) for _ in range(query_count - len(queries))]
+
+    print(f"\n{size:,} entries")
+    print(f"   {'backend':<12}{'build s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+
+    entries = [(question, answer) for _, question, answer in rows]
+    p50, p99 = time_lookups(lambda query: baseline_lookup(entries, query), queries)
+    print(f"   {'loop':<12}{'-':>10}{p50:>10.3f}{p99:>10.3f}")
+
+    backends = [("inverted", KnowledgeIndex)]
+    try:
+        from src.knowledge_vectors import HashedKnowledgeIndex
+        backends.append(("numpy", HashedKnowledgeIndex))
+    except ImportError:
+        print("   numpy not installed, skipping the numpy backend")
+
+    for name, index_class in backends:
+        index = index_class()
+        start = time.perf_counter()
+        index.build(rows)
+        build_time = time.perf_counter() - start
+        p50, p99 = time_lookups(lambda query: index.search(query, 1, 0.6), queries)
+        print(f"   {name:<12}{build_time:>10.2f}{p50:>10.3f}{p99:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark knowledge base lookups")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    print("Knowledge Lookup Benchmark")
+    print("=" * 50)
+    for size in args.sizes:
+        run(size, args.queries)
+
+
+if __name__ == "__main__":
+    main()
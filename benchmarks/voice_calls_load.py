@@ -0,0 +1,296 @@
+"""
+Load test SalonVoiceAgent with many simultaneous calls on one event loop
+
+Runs N calls through a single agent using a local fake LiveKit JobContext,
+room and voice assistant, so no LiveKit server or OpenAI key is needed.
+Every caller asks a question of its own. Questions about opening hours are
+answered from the knowledge base, looked up while the caller is still
+talking: half ask it word for word and take the fast path straight to TTS,
+half phrase it loosely and go through a simulated LLM that calls the
+knowledge base tool. The remaining questions go to the LLM, which hands them
+to a simulated supervisor whose answers are relayed back into the calls on
+hold. Speech goes through the TTS audio cache with a local stub provider,
+so answers given on many calls are synthesized once. Afterwards each
+escalated help request and relayed answer is checked against the call that
+made it, so any state leaking between calls shows up as a mismatch.
+
+Usage: python benchmarks/voice_calls_load.py [--calls 200] [--escalate-every 2] [--prewarm]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set
+
+# Use a scratch database; must be set before the app modules read settings.
+# voice_calls_threads.py imports this module for the same reason
+_directory = os.environ.setdefault("VOICE_LOAD_DIR", tempfile.mkdtemp())
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'voice_load.db')}"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import select
+
+from src.answer_relay import answer_relay
+from src.database import init_db, get_db_session, HelpRequest, REQUEST_STATUS_PENDING
+from src.notifications import NotificationDispatcher
+from src.outbox import timeout_message
+from src.supervisor_notifier import SupervisorNotifier
+from src.tts_cache import TTS_CACHE_LOOKUPS, StubTTS, create_tts_cache
+from src.voice_agent import SalonVoiceAgent, ESCALATION_PHRASE, KB_ANSWERS
+
+
+class EventEmitter:
+    def __init__(self):
+        self._handlers = {}
+
+    def on(self, event: str, handler):
+        self._handlers.setdefault(event, []).append(handler)
+
+    def emit(self, event: str, *args):
+        for handler in self._handlers.get(event, []):
+            handler(*args)
+
+
+class FakeRoom(EventEmitter):
+    """Room with one remote caller"""
+
+    def __init__(self, name: str, identity: str):
+        super().__init__()
+        self.name = name
+        self.remote_participants = [SimpleNamespace(identity=identity, name=f"Caller {identity}")]
+        self.assistant_started = asyncio.Event()
+        self.assistant = None
+        self.heard = asyncio.Queue()
+
+    def hang_up(self):
+        self.emit("participant_disconnected", self.remote_participants[0])
+
+
+class FakeJobContext:
+    def __init__(self, room: FakeRoom):
+        self.room = room
+
+    async def wait_for_participant_connected(self):
+        await asyncio.sleep(0)
+
+
+class FakeAssistant(EventEmitter):
+    """Streams interim transcripts, tries the fast path, then a fake LLM that looks up or escalates"""
+
+    def __init__(self, agent: SalonVoiceAgent, session, reply_delay: float, word_seconds: float = 0.05,
+                 endpoint_seconds: float = 0.3, interim: bool = True):
+        super().__init__()
+        self.agent = agent
+        self.session = session
+        self.reply_delay = reply_delay
+        self.word_seconds = word_seconds
+        self.endpoint_seconds = endpoint_seconds
+        self.interim = interim
+        self.closed = False
+
+    async def start(self, room: FakeRoom):
+        self.room = room
+        room.assistant = self
+        room.assistant_started.set()
+
+    async def say(self, text: str):
+        # The caller hears the answer from its first audio chunk
+        heard_at = None
+        async for _ in self.agent.tts.stream(text):
+            heard_at = heard_at or time.perf_counter()
+        self.room.heard.put_nowait((text, heard_at))
+
+    async def hear(self, text: str):
+        # Interim transcripts arrive word by word while the caller talks, as from
+        # the streaming STT that create_livekit_stt wraps
+        words = text.split()
+        for count in range(1, len(words) + 1):
+            await asyncio.sleep(self.word_seconds)
+            if self.interim:
+                self.agent.prefetch_answer(self.session, " ".join(words[:count]))
+        self.room.done_speaking = time.perf_counter()
+        # The final transcript comes once the STT is sure the caller has stopped
+        await asyncio.sleep(self.endpoint_seconds)
+        self.emit("user_speech_committed", SimpleNamespace(content=text))
+
+        answer = await self.agent.answer_from_knowledge(self.session, text)
+        if answer:
+            await self.say(answer)
+            return
+
+        # Stands in for the LLM round trip, including its knowledge base tool call
+        await asyncio.sleep(self.reply_delay)
+        answer = await self.agent.knowledge_base.get_answer(text)
+        if answer:
+            await self.say(answer)
+            return
+        reply = f"I don't have that information right now. Let me {ESCALATION_PHRASE} who can help you better."
+        self.emit("agent_speech_committed", SimpleNamespace(content=reply))
+
+    async def aclose(self):
+        self.closed = True
+
+
+def question_for(index: int, escalate: bool) -> str:
+    if escalate:
+        # A code of its own, so answers learned from earlier calls don't match it
+        code = hashlib.sha1(str(index).encode()).hexdigest()
+        return f"Call {index}: do you sell gift card {code[:6]} {code[6:12]}?"
+    # Asked word for word every other time, so it scores above VOICE_FAST_PATH_SCORE
+    return "What are your hours?" if index % 4 < 2 else f"Call {index}: what are your hours?"
+
+
+async def caller(index: int, room: FakeRoom, escalate: bool, talk_seconds: float, hold_seconds: float = 60):
+    """One customer: ask a question, hold for the supervisor if needed, hang up"""
+    await room.assistant_started.wait()
+    question = question_for(index, escalate)
+    await room.assistant.hear(question)
+    try:
+        room.answer, heard_at = await asyncio.wait_for(room.heard.get(), hold_seconds)
+        room.answer_seconds = heard_at - room.done_speaking
+    except asyncio.TimeoutError:
+        # Never answered; counted as a mismatch
+        room.answer, room.answer_seconds = None, hold_seconds
+    if not escalate:
+        await asyncio.sleep(talk_seconds)
+    room.hang_up()
+
+
+async def supervisor(expected: int, think_seconds: float):
+    """Answer each escalated request once it appears, through the live relay"""
+    answered = set()
+    while len(answered) < expected:
+        async with get_db_session() as db:
+            pending = (await db.execute(select(HelpRequest).where(
+                HelpRequest.status == REQUEST_STATUS_PENDING
+            ))).scalars().all()
+        for request in pending:
+            if request.id not in answered and request.id in answer_relay:
+                answered.add(request.id)
+                asyncio.get_running_loop().call_later(
+                    think_seconds, answer_relay.deliver, request.id, f"Answer for {request.question.split(':')[0]}"
+                )
+        await asyncio.sleep(0.05)
+
+
+def phone_for(index: int) -> str:
+    return f"+1555{index:07d}"
+
+
+def count_mismatches(answers: Dict[int, Optional[str]], escalating: Set[int], requests: List[HelpRequest],
+                     timed_out: Set[int] = frozenset()) -> int:
+    """Calls whose help requests or answers belong to some other call"""
+    mismatches = 0
+    by_phone = {}
+    for request in requests:
+        by_phone.setdefault(request.customer_phone, []).append(request)
+    for index, answer in answers.items():
+        made = by_phone.get(phone_for(index), [])
+        expected = 1 if index in escalating else 0
+        if len(made) != expected or any(not r.question.startswith(f"Call {index}:") for r in made):
+            mismatches += 1
+        elif index in timed_out and answer != timeout_message():
+            mismatches += 1
+        elif index in timed_out:
+            continue
+        elif index in escalating and answer != f"Thanks for holding. Answer for Call {index}":
+            mismatches += 1
+        elif index not in escalating and "Monday-Friday" not in (answer or ""):
+            mismatches += 1
+    return mismatches
+
+
+async def run(args):
+    await init_db()
+    dispatcher = NotificationDispatcher(channels=[])
+    dispatcher.start()
+    peak = 0
+
+    agent = SalonVoiceAgent(
+        supervisor_notifier=SupervisorNotifier(dispatcher),
+        assistant_factory=lambda agent, session: FakeAssistant(
+            agent, session, args.reply_delay, endpoint_seconds=args.endpoint_seconds, interim=not args.no_prefetch
+        ),
+        max_concurrent_calls=args.max_concurrent,
+        tts=create_tts_cache(StubTTS(latency=args.tts_latency), _directory, 64)
+    )
+    await agent.knowledge_base.initialize()
+    if args.prewarm:
+        await agent.prewarm_tts()
+
+    async def watch_sessions():
+        nonlocal peak
+        while True:
+            peak = max(peak, len(agent.sessions))
+            await asyncio.sleep(0.05)
+
+    escalating = {index for index in range(args.calls) if index % args.escalate_every == 0}
+    rooms = {index: FakeRoom(f"room-{index}", phone_for(index)) for index in range(args.calls)}
+
+    watcher = asyncio.create_task(watch_sessions())
+    start = time.perf_counter()
+    await asyncio.gather(supervisor(len(escalating), args.think_seconds), *(
+        task
+        for index, room in rooms.items()
+        for task in (
+            agent.handle_voice_call(FakeJobContext(room)),
+            caller(index, room, index in escalating, args.talk_seconds),
+        )
+    ))
+    elapsed = time.perf_counter() - start
+    watcher.cancel()
+    await dispatcher.stop()
+
+    async with get_db_session() as db:
+        requests = (await db.execute(select(HelpRequest))).scalars().all()
+
+    mismatches = count_mismatches({index: room.answer for index, room in rooms.items()}, escalating, requests)
+
+    print("Voice Call Load Test")
+    print("=" * 50)
+    print(f"   calls:                {args.calls}")
+    print(f"   peak concurrent:      {peak}")
+    print(f"   escalated:            {len(requests)} (expected {len(escalating)})")
+    print(f"   answers relayed live: {answer_relay.delivered_count}")
+    print(f"   fast path answers:    {KB_ANSWERS.value(prefetched='true'):g} prefetched, "
+          f"{KB_ANSWERS.value(prefetched='false'):g} looked up at end of speech")
+    for label, fast in (("fast path", True), ("LLM + KB tool", False)):
+        answered = [
+            room.answer_seconds * 1000 for index, room in rooms.items()
+            if index not in escalating and question_for(index, False).startswith("What") == fast
+        ]
+        if answered:
+            print(f"   {label + ' answer:':<22}p50 {statistics.median(answered):.1f} ms, max {max(answered):.1f} ms "
+                  f"after speech ends")
+    print(f"   TTS cache:            {TTS_CACHE_LOOKUPS.value(result='hit'):g} hits, "
+          f"{TTS_CACHE_LOOKUPS.value(result='miss'):g} misses, {agent.tts.provider.calls} synthesized")
+    print(f"   calls with mismatch:  {mismatches}")
+    print(f"   sessions left open:   {len(agent.sessions)}")
+    print(f"   wall time:            {elapsed:.2f}s")
+    print("\n✅ No interference between calls" if not mismatches and not agent.sessions else "\n❌ Calls interfered")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test concurrent voice calls")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--escalate-every", type=int, default=2, help="every Nth caller asks something unknown")
+    parser.add_argument("--reply-delay", type=float, default=0.2, help="simulated assistant response time")
+    parser.add_argument("--max-concurrent", type=int, default=None, help="defaults to VOICE_MAX_CONCURRENT_CALLS")
+    parser.add_argument("--think-seconds", type=float, default=0.5, help="simulated supervisor answer time")
+    parser.add_argument("--endpoint-seconds", type=float, default=0.3, help="simulated STT end-of-speech delay")
+    parser.add_argument("--no-prefetch", action="store_true", help="don't send interim transcripts")
+    parser.add_argument("--tts-latency", type=float, default=0.4, help="simulated speech synthesis time")
+    parser.add_argument("--prewarm", action="store_true", help="synthesize knowledge base answers before the calls")
+    parser.add_argument("--talk-seconds", type=float, default=1.5, help="how long answered callers stay on")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
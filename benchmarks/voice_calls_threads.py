@@ -0,0 +1,160 @@
+"""
+Load test voice calls the way LiveKit runs them, a thread and event loop per call
+
+The worker is set up by voice_agent.prewarm_process, and each call runs
+voice_agent.entrypoint on a thread and event loop of its own, as LiveKit's
+thread job executor does, against the same fake room and voice assistant as
+voice_calls_load.py. Every call shares the one agent, its knowledge base and
+TTS cache. The supervisor web app runs on the main thread and answers
+escalated requests through its HTTP endpoint, or times some of them out,
+while the worker follows its event stream. Afterwards each help request and
+answer is checked against the call that made it.
+
+Usage: python benchmarks/voice_calls_threads.py [--calls 50] [--threads 20] [--timeout-every 3]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Set
+
+# Sets up the scratch database
+from voice_calls_load import (
+    _directory, FakeAssistant, FakeJobContext, FakeRoom, caller, count_mismatches, phone_for
+)
+
+import httpx
+import uvicorn
+from sqlalchemy import select
+
+from simple_main import create_app
+from src import voice_agent
+from src.answer_relay import answer_relay
+from src.config import settings
+from src.database import init_db, get_db_session, HelpRequest, REQUEST_STATUS_PENDING
+from src.knowledge_base import KnowledgeBase
+
+
+def run_call(index: int, escalate: bool, options: dict) -> dict:
+    """One call on its own thread and event loop, as LiveKit's thread executor runs a job"""
+    async def call():
+        room = FakeRoom(f"room-{index}", phone_for(index))
+        await asyncio.gather(
+            voice_agent.entrypoint(FakeJobContext(room)),
+            caller(index, room, escalate, options["talk_seconds"], options["hold_seconds"]),
+        )
+        return room
+
+    room = asyncio.run(call())
+    return {"answer": room.answer, "answer_seconds": room.answer_seconds}
+
+
+async def supervisor(client: httpx.AsyncClient, expected: int, think_seconds: float, timed_out: Set[int]):
+    """Answer each escalated request through the supervisor app once it appears, or time it out"""
+    answered = set()
+    while len(answered) < expected:
+        async with get_db_session() as db:
+            pending = (await db.execute(select(HelpRequest).where(
+                HelpRequest.status == REQUEST_STATUS_PENDING
+            ))).scalars().all()
+        for request in pending:
+            if request.id not in answered:
+                answered.add(request.id)
+                await asyncio.sleep(think_seconds)
+                call = request.question.split(':')[0]
+                if int(call.split()[1]) in timed_out:
+                    await client.post(f"/supervisor/timeout/{request.id}")
+                else:
+                    await client.post(f"/supervisor/respond/{request.id}", data={"response": f"Answer for {call}"})
+        await asyncio.sleep(0.05)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run(args):
+    await init_db()
+    await KnowledgeBase().initialize()
+
+    port = free_port()
+    settings.SUPERVISOR_EVENTS_URL = f"http://127.0.0.1:{port}/supervisor/api/events"
+    settings.TTS_PROVIDER = "stub"
+    settings.TTS_CACHE_DIR = os.path.join(_directory, "tts")
+
+    server = uvicorn.Server(uvicorn.Config(create_app(), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    # Worker startup, then every call shares the one agent
+    await asyncio.to_thread(voice_agent.prewarm_process, None)
+    agent = voice_agent.agent
+    agent.assistant_factory = lambda agent, session: FakeAssistant(
+        agent, session, args.reply_delay, endpoint_seconds=args.endpoint_seconds
+    )
+
+    escalating = {index for index in range(args.calls) if index % args.escalate_every == 0}
+    timed_out = {index for index in escalating if args.timeout_every and index % args.timeout_every == 0}
+    options = {"talk_seconds": args.talk_seconds, "hold_seconds": args.hold_seconds}
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    # A thread and event loop for every call, as LiveKit's thread executor runs jobs
+    with ThreadPoolExecutor(args.threads) as pool:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            answered = asyncio.create_task(supervisor(client, len(escalating), args.think_seconds, timed_out))
+            results = await asyncio.gather(*(
+                loop.run_in_executor(pool, run_call, index, index in escalating, options)
+                for index in range(args.calls)
+            ))
+            answered.cancel()
+    elapsed = time.perf_counter() - start
+    # The worker keeps its event stream open, so shutdown cannot wait for connections to close
+    server.should_exit = server.force_exit = True
+    await serving
+
+    async with get_db_session() as db:
+        requests = (await db.execute(select(HelpRequest))).scalars().all()
+
+    mismatches = count_mismatches(
+        {index: result["answer"] for index, result in enumerate(results)}, escalating, requests, timed_out
+    )
+    on_hold = [results[index]["answer_seconds"] * 1000 for index in escalating]
+
+    print("Voice Call Load Test (a thread and event loop per call)")
+    print("=" * 50)
+    print(f"   calls:                {args.calls}")
+    print(f"   threads at once:      {args.threads}")
+    print(f"   escalated:            {len(requests)} (expected {len(escalating)}, {len(timed_out)} timed out)")
+    print(f"   relayed live:         {answer_relay.delivered_count + answer_relay.timed_out_count} answers and timeouts")
+    if on_hold:
+        print(f"   time on hold:         p50 {statistics.median(on_hold):.1f} ms, max {max(on_hold):.1f} ms "
+              f"after speech ends")
+    print(f"   speech synthesized:   {agent.tts.provider.calls} times")
+    print(f"   calls with mismatch:  {mismatches}")
+    print(f"   wall time:            {elapsed:.2f}s")
+    print("\n✅ No interference between calls" if not mismatches else "\n❌ Calls interfered")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test voice calls run on a thread and event loop each")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=20, help="calls running at once")
+    parser.add_argument("--escalate-every", type=int, default=2, help="every Nth caller asks something unknown")
+    parser.add_argument("--reply-delay", type=float, default=0.2, help="simulated assistant response time")
+    parser.add_argument("--timeout-every", type=int, default=0, help="time out every Nth caller's request")
+    parser.add_argument("--think-seconds", type=float, default=0.2, help="simulated supervisor answer time")
+    parser.add_argument("--endpoint-seconds", type=float, default=0.3, help="simulated STT end-of-speech delay")
+    parser.add_argument("--talk-seconds", type=float, default=0.5, help="how long answered callers stay on")
+    parser.add_argument("--hold-seconds", type=float, default=30, help="how long escalated callers wait")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,8 +17,8 @@ logger = logging.getLogger(__name__)
 class InteractiveVoiceDemo:
     """Interactive voice demo for real-time testing"""
     
-    def __init__(self):
-        self.knowledge_base = KnowledgeBase()
+    def __init__(self, knowledge_base: KnowledgeBase = None):
+        self.knowledge_base = knowledge_base or KnowledgeBase()
         self.supervisor_notifier = SupervisorNotifier()
         self.request_count = 0
         
@@ -80,10 +80,10 @@ class InteractiveVoiceDemo:
                 status="PENDING"
             )
             
-            with get_db_session() as db:
+            async with get_db_session() as db:
                 db.add(request)
-                db.commit()
-                db.refresh(request)
+                await db.commit()
+                await db.refresh(request)
             
             # Notify supervisor
             await self.supervisor_notifier.notify_supervisor(
@@ -97,8 +97,16 @@ class InteractiveVoiceDemo:
 
 async def main():
     """Main function"""
-    demo = InteractiveVoiceDemo()
-    await demo.start_interactive_demo()
+    knowledge_base = KnowledgeBase()
+    await knowledge_base.start()
+    
+    demo = InteractiveVoiceDemo(knowledge_base)
+    try:
+        await demo.start_interactive_demo()
+    finally:
+        # Deliver any supervisor notifications still queued before exiting
+        await demo.supervisor_notifier.close()
+        await knowledge_base.close()
 
 if __name__ == "__main__":
     print("Starting interactive voice demo...")
@@ -0,0 +1,76 @@
+"""
+Bulk import and export knowledge base entries
+
+Usage:
+    python knowledge_cli.py import faq.jsonl [--format csv] [--batch-size 1000]
+    python knowledge_cli.py export knowledge.jsonl [--include-inactive]
+
+Imports read JSONL or CSV with question, answer and optional context fields;
+use "-" to import from stdin.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from src.database import init_db
+from src.knowledge_base import KnowledgeBase
+from src.knowledge_io import detect_format, entry_to_json, read_entries, FORMATS
+
+
+async def import_file(path: str, fmt: str, batch_size: int):
+    """Stream a file into the knowledge base"""
+    fmt = fmt or detect_format(path)
+    start = time.perf_counter()
+    
+    def report(counts):
+        elapsed = time.perf_counter() - start
+        print(f"   {counts['read']:,} read, {counts['inserted']:,} inserted, {counts['updated']:,} updated "
+              f"({counts['read'] / max(elapsed, 1e-9):,.0f}/s)", file=sys.stderr)
+    
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        counts = await KnowledgeBase().bulk_import(read_entries(source, fmt), batch_size, report)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    
+    print(f"Imported {path} in {time.perf_counter() - start:.1f}s: {counts['inserted']:,} inserted, "
+          f"{counts['updated']:,} updated, {counts['duplicates']:,} duplicates, {counts['invalid']:,} invalid",
+          file=sys.stderr)
+
+
+async def export_file(path: str, include_inactive: bool):
+    """Stream knowledge entries out as JSONL"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as target:
+        async for entry in KnowledgeBase().export_knowledge(include_inactive):
+            target.write(entry_to_json(entry))
+            count += 1
+    print(f"Exported {count:,} entries to {path}", file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export knowledge entries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    import_parser = commands.add_parser("import", help="Import entries from JSONL or CSV")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+    
+    export_parser = commands.add_parser("export", help="Export entries as JSONL")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--include-inactive", action="store_true")
+    
+    args = parser.parse_args()
+    await init_db()
+    
+    if args.command == "import":
+        await import_file(args.path, args.format, args.batch_size)
+    else:
+        await export_file(args.path, args.include_inactive)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
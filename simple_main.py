@@ -3,21 +3,46 @@ Simplified main script without LiveKit dependencies
 """
 import asyncio
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from contextlib import asynccontextmanager
 
-from src.database import init_db
+from src.database import init_db, async_engine
+from src.knowledge_base import KnowledgeBase
+from src.metrics import registry, CONTENT_TYPE
+from src.notifications import get_dispatcher
+from src.outbox import OutboxDispatcher, create_handlers
+from src.timeout_scheduler import TimeoutScheduler
 from src.supervisor_ui_simple import create_supervisor_app
 from src.config import settings
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
+    """Initialize database and start background services on startup"""
     await init_db()
     print("✅ Database initialized")
-    yield
+    
+    notification_dispatcher = get_dispatcher()
+    notification_dispatcher.start()
+    print(f"📨 Notifications via: {', '.join(channel.name for channel in notification_dispatcher.channels)}")
+    
+    # One knowledge base for the whole app, injected into handlers from lifespan state
+    knowledge_base = KnowledgeBase()
+    await knowledge_base.start()
+    
+    outbox_dispatcher = OutboxDispatcher(create_handlers(knowledge_base))
+    await outbox_dispatcher.start()
+    
+    timeout_scheduler = TimeoutScheduler()
+    await timeout_scheduler.start()
+    print(f"⏱️ Timeout scheduler watching {len(timeout_scheduler)} pending requests")
+    yield {"knowledge_base": knowledge_base}
     print("Shutting down...")
+    await timeout_scheduler.stop()
+    await outbox_dispatcher.stop()
+    await notification_dispatcher.stop()
+    await knowledge_base.close()
+    await async_engine.dispose()
 
 
 def create_app():
@@ -45,6 +70,11 @@ def create_app():
     async def health_check():
         return {"status": "healthy"}
     
+    @app.get("/api/metrics")
+    async def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+    
     return app
 
 
@@ -3,10 +3,16 @@ Simple test script to verify the system works
 """
 import sys
 import os
+import tempfile
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
+# Tests write to a scratch database, never ./ai_supervisor.db; set before settings are read
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'simple_test.db')}"
+# Randomly sampled statement logs would make the output differ from run to run
+os.environ.setdefault("DB_LOG_SAMPLE_RATE", "0")
+
 def test_imports():
     """Test if all modules can be imported"""
     print("🧪 Testing imports...")
@@ -81,6 +87,43 @@ def test_knowledge_base():
                 print("❌ No answer found for known question")
                 return False
             
+            # Asked word for word, it is confident enough for the voice fast path
+            match = await kb.get_match("What are your hours?")
+            if match["answer"] != answer or match["score"] < 0.99:
+                print(f"❌ Unexpected match for known question: {match}")
+                return False
+            
+            # A second instance (e.g. the voice worker) sees updates and deactivations
+            from src.config import settings
+            sync_seconds, settings.KB_SYNC_SECONDS = settings.KB_SYNC_SECONDS, 0
+            try:
+                other = KnowledgeBase()
+                entry_id = await kb.add_knowledge("Do you sell gift cards for the spa?", "Yes, in any amount.")
+                await other.get_answer("Do you sell gift cards for the spa?")
+                await kb.add_knowledge("Do you sell gift cards for the spa?", "Yes, from $25.")
+                if await other.get_answer("Do you sell gift cards for the spa?") != "Yes, from $25.":
+                    print("❌ Updated answer did not reach another instance")
+                    return False
+                await kb.deactivate_knowledge(entry_id)
+                if await other.get_answer("Do you sell gift cards for the spa?") is not None:
+                    print("❌ Deactivated answer still served by another instance")
+                    return False
+                
+                # A lookup syncs the index once, even when it misses the cache
+                syncs = []
+                sync_index = other._sync_index
+                async def counted_sync():
+                    syncs.append(1)
+                    await sync_index()
+                other._sync_index = counted_sync
+                await other.get_match("Is there parking near the salon?")
+                if len(syncs) != 1:
+                    print(f"❌ One lookup synced the index {len(syncs)} times")
+                    return False
+            finally:
+                settings.KB_SYNC_SECONDS = sync_seconds
+            print("✅ Knowledge changes reach other instances")
+            
             return True
         
         return asyncio.run(run_test())
@@ -88,6 +131,1149 @@ def test_knowledge_base():
         print(f"❌ Knowledge base test failed: {e}")
         return False
 
+def test_knowledge_index():
+    """Test the in-memory knowledge index"""
+    print("\n Testing knowledge index...")
+    
+    try:
+        import logging
+        from src.knowledge_index import KnowledgeIndex, create_index
+        
+        index = KnowledgeIndex()
+        index.add(1, "What are your hours?", "9AM-7PM")
+        index.add(2, "Do you take walk-ins?", "Yes")
+        index.add(3, "What are your hours on holidays?", "Closed")
+        
+        matches = index.search("what are the hours?", top_k=2)
+        if [entry_id for entry_id, score in matches] != [1, 3]:
+            print(f"❌ Expected the closest hours entry first, got {matches}")
+            return False
+        
+        if index.search("do you sell gift cards?", min_score=0.6):
+            print("❌ Unrelated question should not match")
+            return False
+        
+        index.remove(1)
+        if 1 in [entry_id for entry_id, score in index.search("what are the hours?")]:
+            print("❌ Removed entry is still returned")
+            return False
+        
+        # A backend whose dependency is missing falls back, naming what failed
+        def missing_encoder():
+            raise ImportError("No module named 'openai'")
+        records = []
+        index_logger = logging.getLogger("src.knowledge_index")
+        handler = logging.Handler()
+        handler.emit = records.append
+        index_logger.addHandler(handler)
+        index_logger.propagate = False
+        try:
+            fallback = create_index("embedding", encoder_factory=missing_encoder)
+        finally:
+            index_logger.removeHandler(handler)
+            index_logger.propagate = True
+        message = records[0].getMessage() if records else ""
+        if type(fallback) is not KnowledgeIndex or "'embedding'" not in message or "openai" not in message:
+            print(f"❌ Wrong fallback for a missing backend dependency: {type(fallback).__name__}, {message!r}")
+            return False
+        
+        print("✅ Knowledge index ranking and add/remove works")
+        return True
+    except Exception as e:
+        print(f"❌ Knowledge index test failed: {e}")
+        return False
+
+def test_answer_cache():
+    """Test the knowledge base answer cache"""
+    print("\n Testing answer cache...")
+    
+    try:
+        from src.answer_cache import AnswerCache, MISS
+        
+        cache = AnswerCache(max_size=2, ttl=60, negative_ttl=0)
+        cache.put("what are your hours", "9AM-7PM")
+        cache.put("do you groom pets", None)
+        
+        if cache.get("what are your hours") != "9AM-7PM":
+            print("❌ Cached answer not returned")
+            return False
+        
+        if cache.get("do you groom pets") is not MISS:
+            print("❌ Expired negative result was returned")
+            return False
+        
+        cache.put("where are you", "Main Street")
+        cache.put("what is your phone", "555")
+        if cache.get("what are your hours") is not MISS:
+            print("❌ Least recently used answer was not evicted")
+            return False
+        
+        print(f"✅ Answer cache works: {cache.stats()}")
+        return True
+    except Exception as e:
+        print(f"❌ Answer cache test failed: {e}")
+        return False
+
+def test_tts_cache():
+    """Test the content-addressed TTS audio cache"""
+    print("\n Testing TTS audio cache...")
+    
+    try:
+        import asyncio
+        import tempfile
+        from src.tts_cache import AudioCache, CachedTTS, StubTTS, TTSProvider, audio_key, create_tts_provider
+        
+        async def run_test():
+            provider = StubTTS(word_seconds=0.01)
+            tts = CachedTTS(provider, AudioCache(tempfile.mkdtemp(), 16 * 1024))
+            
+            first = b"".join([chunk async for chunk in tts.stream("Our hours are 9AM to 7PM.")])
+            second = b"".join([chunk async for chunk in tts.stream("Our hours are 9AM to 7PM.")])
+            if first != second or provider.calls != 1:
+                print(f"❌ Cached audio was not reused ({provider.calls} syntheses)")
+                return False
+            
+            if audio_key("Hello", "alloy", "en") == audio_key("Hello", "echo", "en"):
+                print("❌ Audio key ignores the voice")
+                return False
+            
+            # Each of these is ~5KB of audio, so only the most recent three fit in 16KB
+            for index in range(10):
+                await tts.prewarm([f"Answer number {index} has a few more words in it."])
+            if tts.key("Our hours are 9AM to 7PM.") in tts.cache or tts.cache.size > 16 * 1024:
+                print(f"❌ Cache not bounded: {len(tts.cache)} files, {tts.cache.size} bytes")
+                return False
+            
+            # Writes under the limit do not rescan the directory
+            scans = []
+            rescan = tts.cache._scan
+            tts.cache._scan = lambda: scans.append(1) or rescan()
+            tts.cache.put("small", bytes(100))
+            if scans:
+                print("❌ Cache directory rescanned on a write under the limit")
+                return False
+            
+            # Two processes sharing a directory keep it under the limit between them
+            directory = tempfile.mkdtemp()
+            first_cache, second_cache = AudioCache(directory, 4096, 0), AudioCache(directory, 4096, 0)
+            for index in range(6):
+                (first_cache if index % 2 else second_cache).put(f"key{index}", bytes(1000))
+            on_disk = sum(entry.stat().st_size for entry in os.scandir(directory))
+            if on_disk > 4096 or "key5" not in first_cache or "key0" in second_cache:
+                print(f"❌ Shared cache directory not bounded: {on_disk} bytes")
+                return False
+            
+            # The tone-playing stub is only used when asked for by name
+            try:
+                create_tts_provider("opneai")
+                print("❌ Unknown TTS provider fell back to the stub")
+                return False
+            except ValueError:
+                pass
+            try:
+                TTSProvider()
+                print("❌ TTSProvider without synthesize() could be created")
+                return False
+            except TypeError:
+                pass
+            
+            print(f"✅ TTS cache works: {len(tts.cache)} files, {tts.cache.size} bytes")
+            return True
+        
+        return asyncio.run(run_test())
+    except Exception as e:
+        print(f"❌ TTS cache test failed: {e}")
+        return False
+
+def test_answer_relay():
+    """Test relaying supervisor answers and timeouts into calls on hold"""
+    print("\n Testing answer relay...")
+    
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        from datetime import datetime, timedelta
+        from src.answer_relay import AnswerRelay, answer_relay
+        from src.database import init_db, get_db_session, HelpRequest, REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED
+        from src.voice_agent import CallSession, SalonVoiceAgent, SUPERVISOR_TIMEOUT
+        
+        async def run_test():
+            relay = AnswerRelay()
+            answered, timed_out = relay.subscribe(1), relay.subscribe(2)
+            relay.deliver(1, "Yes, we sell gift cards")
+            relay.deliver_timeout(2, "Sorry, no answer in time")
+            if relay.deliver(2, "Too late"):
+                print("❌ Answer delivered after the timeout")
+                return False
+            if (await answered).timed_out or not (await timed_out).timed_out:
+                print("❌ Answers and timeouts not told apart")
+                return False
+            
+            # A timed out call is told so and can escalate its next question
+            said = []
+            async def say(text):
+                said.append(text)
+            session = CallSession("room", "+15550000000")
+            session.assistant = SimpleNamespace(say=say)
+            
+            # Speech started from a callback is held by the call until it is spoken
+            spoken = session.spawn(say("One moment"))
+            if spoken not in session.tasks:
+                print("❌ Background speech task not kept by the call")
+                return False
+            await spoken
+            await asyncio.sleep(0)
+            if session.tasks or said != ["One moment"]:
+                print(f"❌ Finished speech task still held: {session.tasks}")
+                return False
+            said.clear()
+            session.current_request = HelpRequest(id=2, question="Do you sell gift cards?")
+            agent = SalonVoiceAgent(supervisor_notifier=SimpleNamespace())
+            await agent._handle_event(session, SUPERVISOR_TIMEOUT, (await timed_out).message)
+            if session.current_request is not None or said != ["Sorry, no answer in time"]:
+                print(f"❌ Timeout not relayed to the call: {said}")
+                return False
+            
+            # Answers the event stream missed are read back from the database
+            await init_db()
+            async with get_db_session() as db:
+                missed = HelpRequest(customer_phone="+15550000001", question="Do you do perms?",
+                                     status=REQUEST_STATUS_RESOLVED, supervisor_response="Yes, on Tuesdays")
+                overdue = HelpRequest(customer_phone="+15550000002", question="Do you do nails?",
+                                      status=REQUEST_STATUS_PENDING, timeout_at=datetime.utcnow() - timedelta(seconds=1))
+                db.add_all([missed, overdue])
+                await db.commit()
+            waiting = relay.subscribe(missed.id)
+            await relay.recheck()
+            if (await waiting).message != "Yes, on Tuesdays":
+                print("❌ Missed answer not picked up from the database")
+                return False
+            
+            # A caller still holding past the request's timeout is told no answer came
+            holding = answer_relay.subscribe(overdue.id)
+            await asyncio.wait_for(agent._check_hold(overdue), 5)
+            if not (await holding).timed_out:
+                print("❌ Caller kept on hold past the request's timeout")
+                return False
+            
+            print(f"✅ Answer relay works: {relay.delivered_count} answered, {relay.timed_out_count} timed out")
+            return True
+        
+        return asyncio.run(run_test())
+    except Exception as e:
+        print(f"❌ Answer relay test failed: {e}")
+        return False
+
+def test_request_stats():
+    """Test request counter deltas and histogram percentiles"""
+    print("\n Testing request stats...")
+    
+    try:
+        from datetime import datetime, timedelta
+        from src.database import REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED
+        from src.request_stats import BUCKET_BOUNDS, STATUS_PREFIX, _percentiles, transition_deltas
+        
+        created = datetime(2024, 1, 1, 12, 0, 0)
+        resolved = transition_deltas(REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, created, created + timedelta(seconds=20))
+        expected = {
+            STATUS_PREFIX + REQUEST_STATUS_PENDING: -1, STATUS_PREFIX + REQUEST_STATUS_RESOLVED: 1,
+            "resolution_time:2": 1
+        }
+        if dict(resolved) != expected:
+            print(f"❌ Wrong deltas for a resolved request: {dict(resolved)}")
+            return False
+        
+        timed_out = transition_deltas(REQUEST_STATUS_PENDING, REQUEST_STATUS_UNRESOLVED, created, created + timedelta(hours=2))
+        if dict(timed_out) != {
+            STATUS_PREFIX + REQUEST_STATUS_PENDING: -1, STATUS_PREFIX + REQUEST_STATUS_UNRESOLVED: 1,
+            "resolution_time:12": 1
+        }:
+            print(f"❌ Wrong deltas for a timed out request: {dict(timed_out)}")
+            return False
+        
+        if transition_deltas(REQUEST_STATUS_RESOLVED, REQUEST_STATUS_RESOLVED, created, created) or \
+                dict(transition_deltas(None, REQUEST_STATUS_PENDING, created, None)) != {STATUS_PREFIX + REQUEST_STATUS_PENDING: 1}:
+            print("❌ Wrong deltas for a new or unchanged request")
+            return False
+        
+        buckets = len(BUCKET_BOUNDS) + 1
+        if _percentiles([0] * buckets) != {"p50": None, "p90": None, "p99": None}:
+            print("❌ Percentiles of an empty histogram should be None")
+            return False
+        
+        # 100 requests answered in 5-15 seconds, interpolated within the bucket
+        counts = [0] * buckets
+        counts[1] = 100
+        if _percentiles(counts) != {"p50": 10.0, "p90": 14.0, "p99": 14.9}:
+            print(f"❌ Wrong interpolated percentiles: {_percentiles(counts)}")
+            return False
+        
+        # The last bucket has no upper bound, so its lower bound is reported
+        counts = [0] * buckets
+        counts[-1] = 1
+        if _percentiles(counts)["p50"] != float(BUCKET_BOUNDS[-1]):
+            print(f"❌ Wrong percentile for the unbounded bucket: {_percentiles(counts)}")
+            return False
+        
+        # Counters are created by the first delta and added to afterwards
+        from sqlalchemy import create_engine, select
+        from src.database import RequestStat
+        from src.request_stats import apply_stat_deltas
+        engine = create_engine("sqlite://")
+        RequestStat.__table__.create(engine)
+        with engine.begin() as conn:
+            apply_stat_deltas(conn, {"a": 1, "b": 2, "c": 0})
+            apply_stat_deltas(conn, {"a": 3, "b": -2, "d": 5})
+            stored = dict(conn.execute(select(RequestStat.name, RequestStat.value)).all())
+        engine.dispose()
+        if stored != {"a": 4, "b": 0, "d": 5}:
+            print(f"❌ Wrong stored counters: {stored}")
+            return False
+        
+        print("✅ Request stat deltas and percentiles work")
+        return True
+    except Exception as e:
+        print(f"❌ Request stats test failed: {e}")
+        return False
+
+def test_timeout_scheduler():
+    """Test expiring pending requests, leaving ones answered meanwhile alone"""
+    print("\n Testing timeout scheduler...")
+    
+    try:
+        import asyncio
+        import json
+        from datetime import datetime, timedelta
+        from types import SimpleNamespace
+        from sqlalchemy import func, select
+        from src.database import (
+            get_db_session, HelpRequest, OutboxMessage, RequestStat,
+            REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED,
+        )
+        from src.outbox import CUSTOMER_FOLLOWUP
+        from src.request_stats import STATUS_PREFIX
+        from src.timeout_scheduler import ESCALATIONS, TimeoutScheduler
+        
+        async def unresolved_count(db):
+            return await db.scalar(select(RequestStat.value).where(
+                RequestStat.name == STATUS_PREFIX + REQUEST_STATUS_UNRESOLVED
+            )) or 0
+        
+        async def run_test():
+            timed_out = []
+            async def notify_timeout(request_id):
+                timed_out.append(request_id)
+            scheduler = TimeoutScheduler(notifier=SimpleNamespace(notify_timeout=notify_timeout))
+            
+            async with get_db_session() as db:
+                requests = [
+                    HelpRequest(customer_phone="+15550009999", question=f"Timeout test {index}?",
+                                status=REQUEST_STATUS_PENDING)
+                    for index in range(2)
+                ]
+                db.add_all(requests)
+                await db.commit()
+                answered, expiring = (request.id for request in requests)
+                unresolved_before = await unresolved_count(db)
+                
+                # The supervisor answers one just before its deadline fires
+                requests[0].status = REQUEST_STATUS_RESOLVED
+                requests[0].resolved_at = datetime.utcnow()
+                await db.commit()
+            
+            try:
+                expired = await scheduler.expire([answered, expiring])
+                async with get_db_session() as db:
+                    statuses = dict((await db.execute(select(HelpRequest.id, HelpRequest.status).where(
+                        HelpRequest.id.in_([answered, expiring])
+                    ))).all())
+                    followups = [
+                        json.loads(message.payload) for message in (await db.execute(select(OutboxMessage).where(
+                            OutboxMessage.topic == CUSTOMER_FOLLOWUP
+                        ))).scalars()
+                    ]
+                    followups = [payload for payload in followups if payload["request_id"] in (answered, expiring)]
+                    unresolved_after = await unresolved_count(db)
+                
+                if expired != [expiring] or timed_out != [expiring]:
+                    print(f"❌ Expired {expired}, expected only #{expiring}")
+                    return False
+                if statuses != {answered: REQUEST_STATUS_RESOLVED, expiring: REQUEST_STATUS_UNRESOLVED}:
+                    print(f"❌ Answered request was reopened or expiring one left pending: {statuses}")
+                    return False
+                if [(payload["request_id"], payload.get("timed_out")) for payload in followups] != [(expiring, True)]:
+                    print(f"❌ Wrong customer follow-ups: {followups}")
+                    return False
+                if unresolved_after != unresolved_before + 1:
+                    print(f"❌ Unresolved count went from {unresolved_before} to {unresolved_after}")
+                    return False
+                
+                # Expiring again changes nothing
+                if await scheduler.expire([answered, expiring]):
+                    print("❌ Already expired request expired twice")
+                    return False
+            finally:
+                async with get_db_session() as db:
+                    for message in (await db.execute(select(OutboxMessage).where(
+                        OutboxMessage.topic == CUSTOMER_FOLLOWUP
+                    ))).scalars():
+                        if json.loads(message.payload)["request_id"] in (answered, expiring):
+                            await db.delete(message)
+                    for request in (await db.execute(select(HelpRequest).where(
+                        HelpRequest.id.in_([answered, expiring])
+                    ))).scalars():
+                        await db.delete(request)
+                    await db.commit()
+            
+            # A lower id committed after a higher one has been scanned is still scheduled, once
+            scanner = TimeoutScheduler(notifier=SimpleNamespace())
+            await scanner.rebuild()
+            async with get_db_session() as db:
+                top = await db.scalar(select(func.max(HelpRequest.id))) or 0
+                db.add(HelpRequest(id=top + 100, customer_phone="+15550009998", question="Scan test first?",
+                                   status=REQUEST_STATUS_PENDING))
+                await db.commit()
+            await scanner._scan_new_requests()
+            async with get_db_session() as db:
+                # Its transaction began, setting created_at, before that scan
+                db.add(HelpRequest(id=top + 50, customer_phone="+15550009998", question="Scan test late?",
+                                   status=REQUEST_STATUS_PENDING, created_at=datetime.utcnow() - timedelta(seconds=10)))
+                await db.commit()
+            escalations = ESCALATIONS.value()
+            try:
+                await scanner._scan_new_requests()
+                await scanner._scan_new_requests()
+                if top + 50 not in scanner._scheduled or ESCALATIONS.value() != escalations + 1:
+                    print(f"❌ Late committed request #{top + 50} not scheduled exactly once")
+                    return False
+            finally:
+                async with get_db_session() as db:
+                    for request in (await db.execute(select(HelpRequest).where(
+                        HelpRequest.id.in_([top + 50, top + 100])
+                    ))).scalars():
+                        await db.delete(request)
+                    await db.commit()
+            
+            print(f"✅ Timeout scheduler expires only pending requests (#{expiring}, not #{answered})")
+            return True
+        
+        return asyncio.run(run_test())
+    except Exception as e:
+        print(f"❌ Timeout scheduler test failed: {e}")
+        return False
+
+def test_outbox_retries():
+    """Test outbox messages retrying with backoff and going DEAD after max attempts"""
+    print("\n Testing outbox retries...")
+    
+    try:
+        import asyncio
+        import json
+        import logging
+        from datetime import datetime
+        from src.database import OutboxMessage, OUTBOX_STATUS_PENDING, OUTBOX_STATUS_DONE, OUTBOX_STATUS_DEAD
+        from src.outbox import OutboxDispatcher
+        
+        async def run_test():
+            calls = []
+            async def flaky(payload):
+                calls.append(payload)
+                if len(calls) == 1:
+                    raise RuntimeError("SMS gateway unavailable")
+            async def broken(payload):
+                raise RuntimeError("always fails")
+            dispatcher = OutboxDispatcher({"flaky": flaky, "broken": broken}, max_attempts=2)
+            
+            def message(topic):
+                return OutboxMessage(topic=topic, payload=json.dumps({"request_id": 1}),
+                                     status=OUTBOX_STATUS_PENDING, attempts=0, available_at=datetime.utcnow())
+            
+            # Fails once, is put off with backoff, then succeeds
+            retried = message("flaky")
+            await dispatcher._process(retried)
+            if retried.status != OUTBOX_STATUS_PENDING or retried.available_at <= datetime.utcnow() \
+                    or "unavailable" not in retried.last_error:
+                print(f"❌ Failed message not scheduled for retry: {retried.status}, {retried.last_error}")
+                return False
+            await dispatcher._process(retried)
+            if retried.status != OUTBOX_STATUS_DONE or retried.last_error or retried.attempts != 2:
+                print(f"❌ Retried message not done: {retried.status} after {retried.attempts} attempts")
+                return False
+            
+            # Gives up after max_attempts, as it does for topics with no handler
+            dead, unknown = message("broken"), message("no_such_topic")
+            for _ in range(2):
+                await dispatcher._process(dead)
+                await dispatcher._process(unknown)
+            if dead.status != OUTBOX_STATUS_DEAD or unknown.status != OUTBOX_STATUS_DEAD:
+                print(f"❌ Messages not dead after max attempts: {dead.status}, {unknown.status}")
+                return False
+            if dispatcher.processed_count != 1 or dispatcher.failed_count != 2:
+                print(f"❌ Wrong counts: {dispatcher.processed_count} processed, {dispatcher.failed_count} failed")
+                return False
+            
+            print("✅ Outbox retries with backoff and gives up after max attempts")
+            return True
+        
+        # The failures are expected, so keep their log lines out of the output
+        outbox_logger = logging.getLogger("src.outbox")
+        level = outbox_logger.level
+        outbox_logger.setLevel(logging.CRITICAL)
+        try:
+            return asyncio.run(run_test())
+        finally:
+            outbox_logger.setLevel(level)
+    except Exception as e:
+        print(f"❌ Outbox retry test failed: {e}")
+        return False
+
+def test_question_dedupe():
+    """Test the question hash migration and that rephrased questions update one entry"""
+    print("\n Testing question dedupe...")
+    
+    try:
+        import asyncio
+        import tempfile
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.exc import IntegrityError
+        from src.knowledge_base import KnowledgeBase
+        from src.knowledge_index import question_hash
+        from src.migrations import backfill_question_norm_hash
+        
+        # Knowledge entries as they were before migration 5, with duplicates
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'before_hash.db')}")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE knowledge_entries (id INTEGER PRIMARY KEY, question TEXT NOT NULL, "
+                "answer TEXT NOT NULL, context TEXT, source_request_id INTEGER, created_at DATETIME, is_active BOOLEAN)"
+            ))
+            conn.execute(text("INSERT INTO knowledge_entries (id, question, answer, is_active) VALUES (:id, :q, 'a', :active)"), [
+                {"id": 1, "q": "What are your hours?", "active": True},
+                {"id": 2, "q": "what are your HOURS", "active": True},
+                {"id": 3, "q": "Do you sell gift cards?", "active": False},
+                {"id": 4, "q": "Do you sell gift cards", "active": True},
+                {"id": 5, "q": "Where are you located?", "active": True},
+            ])
+        
+        with engine.begin() as conn:
+            backfill_question_norm_hash(conn)
+        with engine.begin() as conn:
+            # Run twice, as on a restart part way through; nothing more changes
+            backfill_question_norm_hash(conn)
+            rows = {row.id: row for row in conn.execute(text("SELECT * FROM knowledge_entries"))}
+        
+        if any(row.question_norm_hash != question_hash(row.question) for row in rows.values()):
+            print("❌ Question hashes not backfilled")
+            return False
+        # Only the older of two active duplicates is deactivated
+        if {entry_id: bool(row.is_active) for entry_id, row in rows.items()} != {1: False, 2: True, 3: False, 4: True, 5: True}:
+            print(f"❌ Wrong duplicates deactivated: {[(r.id, r.is_active) for r in rows.values()]}")
+            return False
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO knowledge_entries (question, answer, is_active, question_norm_hash) VALUES ('x', 'a', 1, :h)"
+                ), {"h": question_hash("What are your hours?")})
+            print("❌ Second active entry for the same question was allowed")
+            return False
+        except IntegrityError:
+            pass
+        engine.dispose()
+        
+        async def run_test():
+            kb = KnowledgeBase()
+            first = await kb.add_knowledge("Do you do bridal makeup trials?", "Yes, book a week ahead.")
+            second = await kb.add_knowledge("do you do Bridal makeup trials", "Yes, book two weeks ahead.")
+            try:
+                if first is None or second != first:
+                    print(f"❌ Rephrased question made a new entry ({first}, {second})")
+                    return False
+                if await kb.get_answer("Do you do bridal makeup trials?") != "Yes, book two weeks ahead.":
+                    print("❌ Rephrased question did not update the answer")
+                    return False
+            finally:
+                if first:
+                    await kb.deactivate_knowledge(first)
+            return True
+        
+        if not asyncio.run(run_test()):
+            return False
+        
+        print("✅ Duplicate questions are found by hash and deactivated by the migration")
+        return True
+    except Exception as e:
+        print(f"❌ Question dedupe test failed: {e}")
+        return False
+
+def test_call_threads():
+    """Test calls on separate threads and event loops sharing one agent, as LiveKit runs them"""
+    print("\n Testing calls on separate threads...")
+    
+    try:
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import select
+        from src.database import async_engine, current_engine, get_db_session, own_engine, HelpRequest
+        from src.knowledge_base import KnowledgeBase
+        from src.voice_agent import CallSlots
+        
+        kb = KnowledgeBase()
+        asyncio.run(kb.initialize())
+        slots = CallSlots(2)
+        active = []
+        
+        async def call():
+            async with own_engine() as engine:
+                if engine is async_engine or current_engine() is not engine:
+                    return False
+                async with slots:
+                    active.append(slots.active)
+                    match = await kb.get_match("What are your hours?")
+                    await asyncio.sleep(0.05)
+                    async with get_db_session() as db:
+                        await db.execute(select(HelpRequest.id).limit(1))
+                return match is not None
+        
+        with ThreadPoolExecutor(6) as pool:
+            results = list(pool.map(lambda _: asyncio.run(call()), range(6)))
+        if not all(results):
+            print(f"❌ Calls on separate loops failed: {results}")
+            return False
+        if max(active) > 2 or slots.active != 0:
+            print(f"❌ Call slots not shared across loops: {active}, {slots.active} still held")
+            return False
+        
+        print("✅ Calls on separate threads share the knowledge base and call slots, each with its own engine")
+        return True
+    except Exception as e:
+        print(f"❌ Call thread test failed: {e}")
+        return False
+
+def test_outbox_claims():
+    """Test concurrent outbox dispatchers running each message exactly once"""
+    print("\n Testing outbox claims...")
+    
+    try:
+        import asyncio
+        import logging
+        from collections import Counter
+        from sqlalchemy import select
+        from src.database import init_db, get_db_session, OutboxMessage, OUTBOX_STATUS_DONE
+        from src.outbox import CUSTOMER_FOLLOWUP, LEARN_KNOWLEDGE, OutboxDispatcher, add_message
+        
+        async def run_test():
+            await init_db()
+            async with get_db_session() as db:
+                messages = [add_message(db, "count", number=number) for number in range(40)]
+                await db.commit()
+            ids = {message.id for message in messages}
+            
+            runs = Counter()
+            async def count(payload):
+                runs[payload["number"]] += 1
+                await asyncio.sleep(0)
+            async def ignore(payload):
+                pass
+            handlers = {"count": count, LEARN_KNOWLEDGE: ignore, CUSTOMER_FOLLOWUP: ignore}
+            
+            # Two dispatchers, as two web app processes would run, draining at the same time
+            first, second = OutboxDispatcher(handlers, batch_size=7), OutboxDispatcher(handlers, batch_size=7)
+            await asyncio.gather(first.drain(), second.drain(), first.drain())
+            if set(runs) != set(range(40)) or any(times != 1 for times in runs.values()):
+                print(f"❌ Messages run more than once or not at all: {sorted(runs.items())}")
+                return False
+            
+            async with get_db_session() as db:
+                result = await db.execute(select(OutboxMessage.status).where(OutboxMessage.id.in_(ids)))
+                statuses = set(result.scalars())
+            if statuses != {OUTBOX_STATUS_DONE}:
+                print(f"❌ Claimed messages not marked done: {statuses}")
+                return False
+            
+            print(f"✅ Concurrent dispatchers split the outbox: {first.processed_count} + {second.processed_count} messages")
+            return True
+        
+        # Messages left by earlier tests may fail here; that is not what this checks
+        outbox_logger = logging.getLogger("src.outbox")
+        level = outbox_logger.level
+        outbox_logger.setLevel(logging.CRITICAL)
+        try:
+            return asyncio.run(run_test())
+        finally:
+            outbox_logger.setLevel(level)
+    except Exception as e:
+        print(f"❌ Outbox claim test failed: {e}")
+        return False
+
+def test_notifications():
+    """Test notification digests, retries and the webhook, SMTP and SMS channels against local servers"""
+    print("\n Testing notifications...")
+    
+    try:
+        import asyncio
+        import json
+        import logging
+        import socket
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import parse_qs
+        from aiosmtpd.controller import Controller
+        from src.notifications import (
+            HELP_REQUEST, Notification, NotificationChannel, NotificationDispatcher,
+            SMSChannel, SMTPChannel, WebhookChannel
+        )
+        
+        # The retries and the give-up are expected, so keep their log lines out of the output
+        quiet = [logging.getLogger(name) for name in ("src.notifications", "httpx", "mail.log")]
+        levels = [logger.level for logger in quiet]
+        for logger in quiet:
+            logger.setLevel(logging.CRITICAL)
+        
+        # HTTP sink standing in for the webhook receiver and Twilio; fails the first webhook POST
+        posts = []
+        class Sink(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+                posts.append((self.path, self.headers.get("Authorization"), body))
+                failing = self.path == "/down" or (self.path == "/hook" and len([p for p in posts if p[0] == "/hook"]) == 1)
+                self.send_response(500 if failing else 200)
+                self.end_headers()
+            
+            def log_message(self, *args):
+                pass
+        
+        http = ThreadingHTTPServer(("127.0.0.1", 0), Sink)
+        threading.Thread(target=http.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{http.server_address[1]}"
+        
+        emails = []
+        class Mailbox:
+            async def handle_DATA(self, server, session, envelope):
+                emails.append(envelope)
+                return "250 OK"
+        
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            smtp_port = s.getsockname()[1]
+        smtp = Controller(Mailbox(), hostname="127.0.0.1", port=smtp_port)
+        smtp.start()
+        
+        async def run_test():
+            webhook = WebhookChannel(f"{base}/hook")
+            mail = SMTPChannel("127.0.0.1", smtp_port, "alerts@salon.test", ["boss@salon.test"])
+            sms = SMSChannel("AC123", "secret", "+15550001111", "+15550002222", api_url=base)
+            dispatcher = NotificationDispatcher([webhook, mail, sms], workers=2, digest_window=0.2,
+                                                max_attempts=3, backoff_base=0.01)
+            
+            # Arriving within the digest window, these go out as one digest per channel
+            for request_id in (1, 2, 3):
+                dispatcher.enqueue(Notification(HELP_REQUEST, request_id, customer_name="Ann", question=f"Question {request_id}?"))
+            await dispatcher.stop()
+            
+            if dispatcher.digests != 1 or dict(dispatcher.delivered) != {"webhook": 3, "smtp": 3, "sms": 3}:
+                print(f"❌ Digest not delivered to every channel: {dispatcher.stats()}")
+                return False
+            if dispatcher.retries["webhook"] != 1:
+                print(f"❌ Failed webhook delivery not retried: {dict(dispatcher.retries)}")
+                return False
+            
+            hook = json.loads([body for path, _, body in posts if path == "/hook"][-1])
+            text = [parse_qs(body) for path, _, body in posts if path.endswith("/Messages.json")]
+            if not hook["digest"] or len(hook["notifications"]) != 3:
+                print(f"❌ Webhook digest malformed: {hook}")
+                return False
+            if len(text) != 1 or text[0]["To"] != ["+15550002222"] or not text[0]["Body"][0].startswith("3 supervisor"):
+                print(f"❌ SMS digest malformed: {text}")
+                return False
+            if len(emails) != 1 or emails[0].rcpt_tos != ["boss@salon.test"] or b"Question 3?" not in emails[0].content:
+                print(f"❌ Email digest not received: {[email.content for email in emails]}")
+                return False
+            
+            # A channel that keeps failing gives up after max_attempts and counts the batch as failed
+            down = WebhookChannel(f"{base}/down")
+            dispatcher = NotificationDispatcher([down], digest_window=0, max_attempts=2, backoff_base=0.01)
+            dispatcher.enqueue(Notification(HELP_REQUEST, 4, question="Anyone there?"))
+            await dispatcher.stop()
+            if dispatcher.failed["webhook"] != 1 or dispatcher.retries["webhook"] != 1:
+                print(f"❌ Undeliverable notification not given up on: {dispatcher.stats()}")
+                return False
+            
+            try:
+                NotificationChannel()
+                print("❌ NotificationChannel without send() could be created")
+                return False
+            except TypeError:
+                pass
+            
+            print(f"✅ Notifications work: 1 digest to 3 channels, {len(posts)} HTTP posts, {len(emails)} email")
+            return True
+        
+        try:
+            return asyncio.run(run_test())
+        finally:
+            for logger, level in zip(quiet, levels):
+                logger.setLevel(level)
+            smtp.stop()
+            http.shutdown()
+    except Exception as e:
+        print(f"❌ Notification test failed: {e}")
+        return False
+
+def test_knowledge_vectors():
+    """Test the numpy and embedding knowledge indexes against the inverted index"""
+    print("\n Testing knowledge vector indexes...")
+    
+    try:
+        import asyncio
+        from src.config import settings
+        from src.embeddings import HashingEncoder
+        from src.knowledge_base import KnowledgeBase
+        from src.knowledge_index import KnowledgeIndex
+        from src.knowledge_vectors import EmbeddingIndex, HashedKnowledgeIndex
+        
+        corpus = [
+            (1, "What are your hours?", "9AM-7PM"),
+            (2, "Do you take walk-ins?", "Yes"),
+            (3, "What are your hours on holidays?", "Closed"),
+            (4, "How much is a haircut?", "$40"),
+            (5, "How much does hair coloring cost?", "From $80"),
+            (6, "Do you sell gift cards?", "Yes, in any amount"),
+            (7, "Where is the salon located?", "Main Street"),
+            (8, "Is there parking near the salon?", "Behind the building"),
+            (9, "Can I book an appointment online?", "Yes, on our website"),
+            (10, "Do you offer manicures and pedicures?", "Both"),
+            (11, "What is your cancellation policy?", "24 hours notice"),
+            (12, "Do you have stylists for curly hair?", "Two"),
+        ]
+        queries = [
+            "what are the hours", "how much is hair coloring", "is there parking", "book an appointment online",
+            "gift cards for sale", "what is the cancellation policy", "where is the salon", "curly hair stylists",
+        ]
+        
+        inverted = KnowledgeIndex()
+        inverted.build(corpus)
+        # Wide enough that hash collisions only nudge scores
+        hashed = HashedKnowledgeIndex(4096)
+        hashed.build(corpus)
+        encoder = HashingEncoder(256)
+        embedded = EmbeddingIndex(encoder)
+        embedded.build([(entry_id, question, answer, encoder.encode(question)) for entry_id, question, answer in corpus])
+        
+        # The hashed index ranks like the inverted index; embeddings agree on the best match
+        for query in queries:
+            expected = inverted.search(query, top_k=3, min_score=0.1)
+            ranked = hashed.search(query, top_k=3, min_score=0.1)
+            if [entry_id for entry_id, _ in ranked] != [entry_id for entry_id, _ in expected] or \
+                    any(abs(score - other) > 0.05 for (_, score), (_, other) in zip(ranked, expected)):
+                print(f"❌ Hashed index disagrees on '{query}': {ranked} vs {expected}")
+                return False
+            best = embedded.search(query, top_k=1, min_score=0.1)
+            if not best or best[0][0] != expected[0][0]:
+                print(f"❌ Embedding index disagrees on '{query}': {best} vs {expected[0]}")
+                return False
+        
+        for index in (hashed, embedded):
+            name = type(index).__name__
+            index.add(13, "Do you do eyebrow threading?", "Yes, walk-ins welcome")
+            if index.search("eyebrow threading", top_k=1, min_score=0.5)[0][0] != 13:
+                print(f"❌ {name} does not find an added entry")
+                return False
+            index.add(13, "Do you do eyelash extensions?", "By appointment")
+            if index.search("eyebrow threading", min_score=0.5) or \
+                    index.entries[13] != ("Do you do eyelash extensions?", "By appointment"):
+                print(f"❌ {name} still serves the old version of an updated entry")
+                return False
+            # Removing the first row moves the last one into its place
+            index.remove(1)
+            if 1 in [entry_id for entry_id, _ in index.search("what are your hours", min_score=0.1)] or \
+                    index.search("eyelash extensions", top_k=1, min_score=0.5)[0][0] != 13 or len(index) != 12:
+                print(f"❌ {name} wrong after removing an entry")
+                return False
+        
+        # Through the knowledge base, each backend picks up another instance's changes
+        async def run_backend(backend: str, question: str) -> bool:
+            other = KnowledgeBase()
+            kb = KnowledgeBase()
+            # Loaded first, so the new entry reaches it through a sync
+            await other.start()
+            entry_id = await kb.add_knowledge(question, "Yes, on weekdays.")
+            if await other.get_answer(question) != "Yes, on weekdays.":
+                print(f"❌ {backend} index does not find an added entry")
+                return False
+            await kb.add_knowledge(question, "Yes, every day.")
+            if await other.get_answer(question) != "Yes, every day.":
+                print(f"❌ Updated answer did not reach another {backend} index")
+                return False
+            await kb.deactivate_knowledge(entry_id)
+            if await other.get_answer(question) is not None:
+                print(f"❌ Deactivated answer still served by another {backend} index")
+                return False
+            return True
+        
+        saved = settings.KB_INDEX_BACKEND, settings.KB_SYNC_SECONDS
+        settings.KB_SYNC_SECONDS = 0
+        try:
+            for backend, question in (("numpy", "Do you offer scalp treatments?"), ("embedding", "Do you do beard trims?")):
+                settings.KB_INDEX_BACKEND = backend
+                if not asyncio.run(run_backend(backend, question)):
+                    return False
+        finally:
+            settings.KB_INDEX_BACKEND, settings.KB_SYNC_SECONDS = saved
+        
+        print("✅ Vector indexes match the inverted index and stay in sync")
+        return True
+    except Exception as e:
+        print(f"❌ Knowledge vector test failed: {e}")
+        return False
+
+def test_event_hub():
+    """Test fanning dashboard events out to subscribers"""
+    print("\n Testing event hub...")
+    
+    try:
+        import asyncio
+        import json
+        from src.event_hub import EventHub, RESYNC, REQUEST_CREATED, REQUEST_RESOLVED
+        
+        async def run_test():
+            # Every subscriber gets every event, in order
+            hub = EventHub(max_queue=3)
+            fast, slow = hub.subscribe(), hub.subscribe()
+            received = []
+            for request_id in range(1, 6):
+                hub.publish(REQUEST_CREATED, request_id=request_id)
+                received.append(fast.queue.get_nowait())
+            if [event["data"]["request_id"] for event in received] != [1, 2, 3, 4, 5] or hub.published_count != 5:
+                print(f"❌ Events not fanned out in order: {received}")
+                return False
+            
+            # A subscriber that stops reading loses its backlog to one resync event
+            backlog = [slow.queue.get_nowait() for _ in range(slow.queue.qsize())]
+            if [event["type"] for event in backlog] != [RESYNC, REQUEST_CREATED] or \
+                    backlog[0]["data"] != {"dropped": 4} or backlog[1]["data"]["request_id"] != 5:
+                print(f"❌ Full queue not collapsed into a resync: {backlog}")
+                return False
+            
+            # A dashboard that disconnects is unsubscribed
+            hub = EventHub()
+            subscription = hub.subscribe()
+            lines = []
+            async def read():
+                async for line in hub.stream(subscription):
+                    lines.append(line)
+            reader = asyncio.create_task(read())
+            await asyncio.sleep(0)
+            hub.publish(REQUEST_RESOLVED, request_id=7, response="Yes")
+            await asyncio.sleep(0.01)
+            reader.cancel()
+            await asyncio.gather(reader, return_exceptions=True)
+            if len(hub) != 0:
+                print("❌ Disconnected dashboard still subscribed")
+                return False
+            event_type, data = lines[1].split("\n")[:2]
+            if lines[0] != "retry: 3000\n\n" or event_type != f"event: {REQUEST_RESOLVED}" or \
+                    json.loads(data[len("data: "):])["data"] != {"request_id": 7, "response": "Yes"}:
+                print(f"❌ Wrong event stream: {lines}")
+                return False
+            
+            return True
+        
+        if not asyncio.run(run_test()):
+            return False
+        print("✅ Events reach every dashboard, slow ones resync, closed ones unsubscribe")
+        return True
+    except Exception as e:
+        print(f"❌ Event hub test failed: {e}")
+        return False
+
+def test_knowledge_io():
+    """Test bulk knowledge import and export through the CLI"""
+    print("\n Testing knowledge import and export...")
+    
+    try:
+        import asyncio
+        import contextlib
+        import csv
+        import io
+        import logging
+        import os
+        import tempfile
+        import knowledge_cli
+        from src.knowledge_base import KnowledgeBase
+        from src.knowledge_io import detect_format, read_entries
+        
+        # Blank lines are skipped; malformed lines and non-objects count as invalid
+        lines = ['{"question": "Q1", "answer": "A1"}', "", "{not json", "[1, 2]"]
+        logging.getLogger("src.knowledge_io").setLevel(logging.CRITICAL)
+        entries = list(read_entries(lines))
+        logging.getLogger("src.knowledge_io").setLevel(logging.NOTSET)
+        if entries != [{"question": "Q1", "answer": "A1"}, {}, {}]:
+            print(f"❌ Wrong JSONL entries: {entries}")
+            return False
+        if (detect_format("faq.CSV"), detect_format("faq.ndjson"), detect_format("faq.txt")) != ("csv", "jsonl", "jsonl"):
+            print("❌ Wrong format detected from file names")
+            return False
+        
+        rows = [
+            {"question": "Is the zqx1 facial vegan?", "answer": "Yes, fully", "context": "Menu"},
+            {"question": "Is the zqx2 facial vegan?", "answer": 'Mostly, ask for the "plant" serum', "context": ""},
+            {"question": "is the ZQX1 facial vegan", "answer": "Repeated", "context": ""},
+            {"question": "Is the zqx3 facial vegan?", "answer": "No,\nit uses beeswax", "context": ""},
+            {"question": "Is the zqx4 facial vegan?", "answer": "", "context": ""},
+            {"question": "Is the zqx5 facial vegan?", "answer": "Yes", "context": ""},
+            {"question": "Is the zqx6 facial vegan?", "answer": "Yes", "context": ""},
+        ]
+        # The repeat of zqx1 and the entry without an answer are not stored
+        expected = {
+            row["question"]: (row["answer"], row["context"] or None)
+            for row in rows if row["answer"] and "ZQX" not in row["question"]
+        }
+        
+        async def run_test(directory):
+            csv_path = os.path.join(directory, "faq.csv")
+            with open(csv_path, "w", encoding="utf-8", newline="") as target:
+                writer = csv.DictWriter(target, ["question", "answer", "context"])
+                writer.writeheader()
+                writer.writerows(rows)
+            
+            # The CLI reports progress after every batch of two unique entries
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                await knowledge_cli.import_file(csv_path, None, 2)
+            reports = [line.split()[0] for line in stderr.getvalue().splitlines() if line.startswith("   ")]
+            if reports != ["2", "6", "7"] or "5 inserted, 0 updated, 1 duplicates, 1 invalid" not in stderr.getvalue():
+                print(f"❌ Wrong import batches or counts: {stderr.getvalue()}")
+                return False
+            
+            export_path = os.path.join(directory, "knowledge.jsonl")
+            with contextlib.redirect_stderr(io.StringIO()):
+                await knowledge_cli.export_file(export_path, False)
+            with open(export_path, encoding="utf-8") as source:
+                exported = [entry for entry in read_entries(source) if "zqx" in entry["question"]]
+            if {entry["question"]: (entry["answer"], entry["context"]) for entry in exported} != expected:
+                print(f"❌ Exported entries differ from the import: {exported}")
+                return False
+            
+            # Importing the export again updates every entry in place
+            kb = KnowledgeBase()
+            with open(export_path, encoding="utf-8") as source:
+                counts = await kb.bulk_import(read_entries(source), batch_size=2)
+            if counts["inserted"] or counts["updated"] != counts["read"]:
+                print(f"❌ Re-importing an export should only update: {counts}")
+                return False
+            
+            for entry in exported:
+                await kb.deactivate_knowledge(entry["id"])
+            return True
+        
+        with tempfile.TemporaryDirectory() as directory:
+            if not asyncio.run(run_test(directory)):
+                return False
+        print("✅ Knowledge import and export round trip")
+        return True
+    except Exception as e:
+        print(f"❌ Knowledge import/export test failed: {e}")
+        return False
+
+def test_metrics():
+    """Test Prometheus exposition and the SQL statement timing hooks"""
+    print("\n Testing metrics...")
+    
+    try:
+        import json
+        import logging
+        from sqlalchemy import create_engine, text
+        from sqlalchemy.exc import OperationalError
+        from src.metrics import Registry
+        from src.sql_metrics import SQL_DURATION, SQL_ERRORS, SQL_SLOW, instrument_engine, statement_operation
+        
+        registry = Registry()
+        calls = registry.counter("calls_total", "Calls handled", ("result",))
+        calls.inc(result="answered")
+        calls.inc(2, result="answered")
+        calls.inc(result='say "hi"\n')
+        active = registry.gauge("active_calls", "Calls in progress")
+        active.set(3)
+        active.dec()
+        latency = registry.histogram("lookup_seconds", "Lookup time", buckets=(5, 1))
+        for seconds in (0.5, 1, 3, 7.25):
+            latency.observe(seconds)
+        if registry.counter("calls_total", "Registered again") is not calls:
+            print("❌ Registering an existing name should return it")
+            return False
+        
+        expected = "\n".join([
+            "# HELP calls_total Calls handled",
+            "# TYPE calls_total counter",
+            'calls_total{result="answered"} 3',
+            'calls_total{result="say \\"hi\\"\\n"} 1',
+            "# HELP active_calls Calls in progress",
+            "# TYPE active_calls gauge",
+            "active_calls 2",
+            "# HELP lookup_seconds Lookup time",
+            "# TYPE lookup_seconds histogram",
+            'lookup_seconds_bucket{le="1"} 2',
+            'lookup_seconds_bucket{le="5"} 3',
+            'lookup_seconds_bucket{le="+Inf"} 4',
+            "lookup_seconds_sum 11.75",
+            "lookup_seconds_count 4",
+        ]) + "\n"
+        if registry.render() != expected:
+            print(f"❌ Wrong exposition text:\n{registry.render()}")
+            return False
+        
+        # Every statement is timed by operation; parameters never reach the log
+        records = []
+        sql_logger = logging.getLogger("src.sql_metrics")
+        handler = logging.Handler()
+        handler.emit = records.append
+        sql_logger.addHandler(handler)
+        sql_logger.propagate = False
+        try:
+            sampled = create_engine("sqlite://")
+            instrument_engine(sampled, slow_query_ms=60000, sample_rate=1)
+            slow = create_engine("sqlite://")
+            instrument_engine(slow, slow_query_ms=0, sample_rate=0)
+            
+            selects, slow_inserts = SQL_DURATION.count(operation="SELECT"), SQL_SLOW.value(operation="INSERT")
+            errors = SQL_ERRORS.value(operation="SELECT")
+            with sampled.connect() as conn:
+                conn.execute(text("SELECT :phone"), {"phone": "+15551234567"})
+                try:
+                    conn.execute(text("SELECT * FROM missing_table"))
+                except OperationalError:
+                    pass
+            with slow.begin() as conn:
+                conn.execute(text("CREATE TABLE calls (id INTEGER)"))
+                conn.execute(text("INSERT INTO calls VALUES (1)"))
+            sampled.dispose()
+            slow.dispose()
+        finally:
+            sql_logger.removeHandler(handler)
+            sql_logger.propagate = True
+        
+        logged = [json.loads(record.getMessage()) for record in records]
+        queries = [entry for entry in logged if entry["event"] == "query"]
+        slow_logged = {entry["operation"] for entry in logged if entry["event"] == "slow_query"}
+        if SQL_DURATION.count(operation="SELECT") != selects + 1 or SQL_ERRORS.value(operation="SELECT") != errors + 1:
+            print("❌ SQL statements and errors not counted by operation")
+            return False
+        if SQL_SLOW.value(operation="INSERT") != slow_inserts + 1 or not {"CREATE", "INSERT"} <= slow_logged:
+            print(f"❌ Slow statements not counted and logged: {logged}")
+            return False
+        if not any(entry["statement"] == "SELECT ?" for entry in queries) or "15551234567" in json.dumps(logged):
+            print(f"❌ Sampled statements not logged without parameters: {queries}")
+            return False
+        if (statement_operation("  with x as (select 1) select * from x"), statement_operation("VACUUM")) != ("WITH", "OTHER"):
+            print("❌ Wrong statement operation labels")
+            return False
+        
+        print("✅ Metrics render in the Prometheus format and SQL statements are timed")
+        return True
+    except Exception as e:
+        print(f"❌ Metrics test failed: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("Frontdesk AI Supervisor System - Simple Test")
@@ -108,6 +1294,66 @@ def main():
         print("\n❌ Knowledge base tests failed.")
         return False
     
+    if not test_knowledge_index():
+        print("\n❌ Knowledge index tests failed.")
+        return False
+    
+    if not test_answer_cache():
+        print("\n❌ Answer cache tests failed.")
+        return False
+    
+    if not test_tts_cache():
+        print("\n❌ TTS cache tests failed.")
+        return False
+    
+    if not test_answer_relay():
+        print("\n❌ Answer relay tests failed.")
+        return False
+    
+    if not test_request_stats():
+        print("\n❌ Request stats tests failed.")
+        return False
+    
+    if not test_timeout_scheduler():
+        print("\n❌ Timeout scheduler tests failed.")
+        return False
+    
+    if not test_outbox_retries():
+        print("\n❌ Outbox retry tests failed.")
+        return False
+    
+    if not test_question_dedupe():
+        print("\n❌ Question dedupe tests failed.")
+        return False
+    
+    if not test_call_threads():
+        print("\n❌ Call thread tests failed.")
+        return False
+    
+    if not test_outbox_claims():
+        print("\n❌ Outbox claim tests failed.")
+        return False
+    
+    if not test_notifications():
+        print("\n❌ Notification tests failed.")
+        return False
+    
+    if not test_knowledge_vectors():
+        print("\n❌ Knowledge vector index tests failed.")
+        return False
+    
+    if not test_event_hub():
+        print("\n❌ Event hub tests failed.")
+        return False
+    
+    if not test_knowledge_io():
+        print("\n❌ Knowledge import/export tests failed.")
+        return False
+    
+    if not test_metrics():
+        print("\n❌ Metrics tests failed.")
+        return False
+    
     print("\n All tests passed!")
     print("\n Next steps:")
     print("1. Run: python main.py")
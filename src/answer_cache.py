@@ -0,0 +1,69 @@
+"""
+Bounded LRU cache of knowledge base answers with per-entry expiry
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+# Returned by get() when a question is not cached, since None is a valid cached answer
+MISS = object()
+
+
+class AnswerCache:
+    """Caches answers by normalized question, including "no answer" results
+
+    Answers expire after ttl seconds and negative results after negative_ttl
+    seconds; the least recently used question is evicted once max_size is
+    reached.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0, negative_ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str):
+        """Return the cached answer (possibly None), or MISS"""
+        cached = self._entries.get(key)
+        if cached is not None:
+            expires_at, answer = cached
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return answer
+            del self._entries[key]
+
+        self.misses += 1
+        return MISS
+
+    def put(self, key: str, answer: Any):
+        """Cache an answer, or None for a question with no answer"""
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if answer is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Invalidate every cached answer"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,139 @@
+"""
+Relay of supervisor answers into voice calls that are still connected
+
+A call that escalates a question subscribes to its help request here and
+keeps the caller on hold. When the supervisor answers, or the request times
+out, the customer follow-up handler offers the message to the relay first:
+if a live call is waiting it is woken with it straight away, otherwise the
+follow-up falls back to the callback message.
+
+The registry is per process. A voice worker running apart from the web app
+follows the supervisor event stream instead, so answers still reach its
+calls within milliseconds; the callback message is then sent as well, since
+the web app cannot see calls in another process. Anything published while
+the stream was down is picked up from the database when it reconnects.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, NamedTuple, Optional
+
+import httpx
+
+from .database import get_db_session, HelpRequest, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED
+from .event_hub import REQUEST_RESOLVED, REQUEST_TIMED_OUT
+
+logger = logging.getLogger(__name__)
+
+
+class RelayedReply(NamedTuple):
+    """What a call on hold is told: the supervisor's answer, or that none came in time"""
+    message: str
+    timed_out: bool = False
+
+
+def _resolve(future: asyncio.Future, reply: RelayedReply):
+    if not future.done():
+        future.set_result(reply)
+
+
+class AnswerRelay:
+    """Live calls waiting on supervisor answers, keyed by help request id"""
+
+    def __init__(self):
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self.delivered_count = 0
+        self.timed_out_count = 0
+
+    def __contains__(self, request_id: int) -> bool:
+        return request_id in self._waiters
+
+    def subscribe(self, request_id: int) -> asyncio.Future:
+        """Future resolved with the RelayedReply to request_id"""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = future
+        return future
+
+    def unsubscribe(self, request_id: int):
+        """Stop waiting, e.g. because the caller hung up"""
+        future = self._waiters.pop(request_id, None)
+        if future and not future.done():
+            future.get_loop().call_soon_threadsafe(future.cancel)
+
+    def deliver(self, request_id: int, answer: str) -> bool:
+        """Hand an answer to the waiting call; False if no call is waiting"""
+        if not self._resolve(request_id, RelayedReply(answer)):
+            return False
+        self.delivered_count += 1
+        return True
+
+    def deliver_timeout(self, request_id: int, message: str) -> bool:
+        """Tell the waiting call its request timed out; False if no call is waiting"""
+        if not self._resolve(request_id, RelayedReply(message, timed_out=True)):
+            return False
+        self.timed_out_count += 1
+        return True
+
+    def _resolve(self, request_id: int, reply: RelayedReply) -> bool:
+        future = self._waiters.pop(request_id, None)
+        if future is None or future.done():
+            return False
+        # Handlers may run on another thread's loop (e.g. the web app's)
+        future.get_loop().call_soon_threadsafe(_resolve, future, reply)
+        return True
+
+    async def check(self, request_id: int) -> bool:
+        """Settle a waiting call from the request's status in the database; True unless still pending"""
+        from .outbox import timeout_message  # the outbox relays through this module
+
+        async with get_db_session() as db:
+            request = await db.get(HelpRequest, request_id)
+        if request is None:
+            return True
+        if request.status == REQUEST_STATUS_RESOLVED:
+            self.deliver(request_id, request.supervisor_response)
+        elif request.status == REQUEST_STATUS_UNRESOLVED:
+            self.deliver_timeout(request_id, timeout_message())
+        else:
+            return False
+        return True
+
+    async def recheck(self):
+        """Check every waiting call, for answers published while the event stream was down"""
+        for request_id in list(self._waiters):
+            try:
+                await self.check(request_id)
+            except Exception as e:
+                logger.warning(f"Could not check help request #{request_id}: {e}")
+
+    async def follow(self, events_url: str, reconnect_seconds: float = 3.0):
+        """Deliver answers and timeouts from the supervisor app's event stream until cancelled"""
+        async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+            while True:
+                try:
+                    async with client.stream("GET", events_url) as response:
+                        response.raise_for_status()
+                        logger.info(f"Following supervisor answers from {events_url}")
+                        await self.recheck()
+                        event_type: Optional[str] = None
+                        async for line in response.aiter_lines():
+                            if line.startswith("event:"):
+                                event_type = line[6:].strip()
+                            elif line.startswith("data:") and event_type == REQUEST_RESOLVED:
+                                event = json.loads(line[5:])["data"]
+                                self.deliver(event["request_id"], event["response"])
+                            elif line.startswith("data:") and event_type == REQUEST_TIMED_OUT:
+                                event = json.loads(line[5:])["data"]
+                                self.deliver_timeout(event["request_id"], event["message"])
+                            elif not line:
+                                event_type = None
+
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Supervisor event stream interrupted, reconnecting: {e}")
+                await asyncio.sleep(reconnect_seconds)
+
+
+# Shared by the voice agent and the customer follow-up handler
+answer_relay = AnswerRelay()
@@ -15,8 +15,51 @@ class Settings:
     # OpenAI Configuration (required for voice AI)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     
+    # Calls one voice worker runs at once, each on its own thread and event loop under LiveKit
+    VOICE_MAX_CONCURRENT_CALLS: int = int(os.getenv("VOICE_MAX_CONCURRENT_CALLS", "100"))
+    # Voice calls speak knowledge base matches scoring at least this without the LLM
+    VOICE_FAST_PATH_SCORE: float = float(os.getenv("VOICE_FAST_PATH_SCORE", "0.8"))
+    # Supervisor app event stream, followed by voice workers to relay answers into live calls
+    SUPERVISOR_EVENTS_URL: str = os.getenv(
+        "SUPERVISOR_EVENTS_URL", f"http://localhost:{os.getenv('PORT', '8000')}/supervisor/api/events"
+    )
+    # Callers on hold also have their request checked in the database this often, for answers the stream missed
+    VOICE_HOLD_CHECK_SECONDS: float = float(os.getenv("VOICE_HOLD_CHECK_SECONDS", "15"))
+    
+    # Speech recognition: "openai" (Whisper, transcribes once speech ends) or "deepgram"
+    # (streams interim transcripts, so knowledge base lookups start while the caller talks)
+    STT_PROVIDER: str = os.getenv("STT_PROVIDER", "openai")
+    
+    # Speech synthesis: "openai" or "stub" (local tones, for testing)
+    TTS_PROVIDER: str = os.getenv("TTS_PROVIDER", "openai")
+    TTS_VOICE: str = os.getenv("TTS_VOICE", "alloy")
+    TTS_LANGUAGE: str = os.getenv("TTS_LANGUAGE", "en")
+    # Synthesized audio cache; an empty directory disables it
+    TTS_CACHE_DIR: str = os.getenv("TTS_CACHE_DIR", "tts_cache")
+    TTS_CACHE_MAX_MB: float = float(os.getenv("TTS_CACHE_MAX_MB", "512"))
+    # Synthesize every active knowledge base answer when the voice worker starts
+    TTS_CACHE_PREWARM: bool = os.getenv("TTS_CACHE_PREWARM", "false").lower() == "true"
+    
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./ai_supervisor.db")
+    # Log every SQL statement (debugging only; very verbose)
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+    # Statements at least this slow are logged as warnings
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "250"))
+    # Fraction of other statements logged as JSON at INFO
+    DB_LOG_SAMPLE_RATE: float = float(os.getenv("DB_LOG_SAMPLE_RATE", "0.01"))
+    # SQLite pragmas set on every connection (empty to leave SQLite's default)
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # negative is KiB
+    # Connection pool for server databases such as Postgres
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
     
     # Server Configuration
     HOST: str = os.getenv("HOST", "0.0.0.0")
@@ -28,8 +71,57 @@ class Settings:
     SALON_PHONE: str = "(555) 123-4567"
     SALON_ADDRESS: str = "123 Main Street, Downtown"
     
+    # Knowledge base matching
+    KB_MATCH_THRESHOLD: float = float(os.getenv("KB_MATCH_THRESHOLD", "0.6"))
+    KB_SEARCH_TOP_K: int = int(os.getenv("KB_SEARCH_TOP_K", "5"))
+    KB_INDEX_BACKEND: str = os.getenv("KB_INDEX_BACKEND", "inverted")  # "inverted", "numpy" or "embedding"
+    KB_VECTOR_DIM: int = int(os.getenv("KB_VECTOR_DIM", "512"))
+    KB_EMBEDDING_PROVIDER: str = os.getenv("KB_EMBEDDING_PROVIDER", "hashing")  # or "sentence-transformers"
+    KB_EMBEDDING_MODEL: str = os.getenv("KB_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    KB_EMBEDDING_DIM: int = int(os.getenv("KB_EMBEDDING_DIM", "256"))
+    
+    # Knowledge base answer cache (0 disables it)
+    KB_CACHE_SIZE: int = int(os.getenv("KB_CACHE_SIZE", "1024"))
+    KB_CACHE_TTL_SECONDS: float = float(os.getenv("KB_CACHE_TTL_SECONDS", "300"))
+    KB_CACHE_NEGATIVE_TTL_SECONDS: float = float(os.getenv("KB_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+    # How often lookups check for entries other processes added, updated or deactivated
+    KB_SYNC_SECONDS: float = float(os.getenv("KB_SYNC_SECONDS", "1"))
+    
+    # Supervisor notifications: comma separated channels from log, webhook, smtp, sms
+    NOTIFY_CHANNELS: list = [
+        channel.strip() for channel in os.getenv("NOTIFY_CHANNELS", "log").split(",") if channel.strip()
+    ]
+    NOTIFY_WORKERS: int = int(os.getenv("NOTIFY_WORKERS", "4"))
+    NOTIFY_QUEUE_SIZE: int = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+    # Notifications arriving this close together are sent as one digest
+    NOTIFY_DIGEST_WINDOW_SECONDS: float = float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "1"))
+    NOTIFY_MAX_ATTEMPTS: int = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+    NOTIFY_WEBHOOK_URL: str = os.getenv("NOTIFY_WEBHOOK_URL", "")
+    SUPERVISOR_EMAIL: str = os.getenv("SUPERVISOR_EMAIL", "")
+    SMTP_HOST: str = os.getenv("SMTP_HOST", "")
+    SMTP_PORT: int = int(os.getenv("SMTP_PORT", "25"))
+    SMTP_FROM: str = os.getenv("SMTP_FROM", "supervisor-alerts@localhost")
+    SMTP_USERNAME: str = os.getenv("SMTP_USERNAME", "")
+    SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "")
+    SMTP_USE_TLS: bool = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+    SUPERVISOR_PHONE: str = os.getenv("SUPERVISOR_PHONE", "")
+    TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
+    TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
+    TWILIO_FROM_NUMBER: str = os.getenv("TWILIO_FROM_NUMBER", "")
+    TWILIO_API_URL: str = os.getenv("TWILIO_API_URL", "https://api.twilio.com")
+    
+    # Outbox dispatcher for knowledge learning and customer follow-ups
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    
     # Request timeout (in minutes)
-    REQUEST_TIMEOUT_MINUTES: int = 30
+    REQUEST_TIMEOUT_MINUTES: int = int(os.getenv("REQUEST_TIMEOUT_MINUTES", "30"))
+    # Supervisor reminders, in minutes before a request times out
+    REQUEST_REMINDER_MINUTES: list = [
+        int(minutes) for minutes in os.getenv("REQUEST_REMINDER_MINUTES", "10,5").split(",") if minutes.strip()
+    ]
+    # How often the timeout scheduler picks up requests created by other processes
+    REQUEST_SCAN_SECONDS: float = float(os.getenv("REQUEST_SCAN_SECONDS", "5"))
 
 
 settings = Settings()
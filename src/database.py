@@ -1,18 +1,130 @@
 """
 Database models and initialization
 """
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean
+import asyncio
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Text, Boolean, ForeignKey, LargeBinary, Index, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.orm import sessionmaker, column_property
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from .config import settings, Settings
+from .sql_metrics import instrument_engine
+
+
+def get_async_database_url(url: str) -> str:
+    """Map a database URL onto its asyncio driver"""
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    return url
+
+
+def sqlite_pragmas(config: Settings = settings) -> List[Tuple[str, Any]]:
+    """PRAGMA statements applied to each new SQLite connection"""
+    pragmas = [
+        # WAL lets the dashboard read while the agent writes
+        ("journal_mode", config.SQLITE_JOURNAL_MODE),
+        # NORMAL is durable across app crashes in WAL mode, only not across power loss
+        ("synchronous", config.SQLITE_SYNCHRONOUS),
+        # Wait for a competing writer instead of failing with "database is locked"
+        ("busy_timeout", config.SQLITE_BUSY_TIMEOUT_MS),
+        ("mmap_size", config.SQLITE_MMAP_SIZE),
+        ("cache_size", config.SQLITE_CACHE_SIZE),
+    ]
+    return [(name, value) for name, value in pragmas if value not in ("", None)]
+
+
+def engine_options(url: str, config: Settings = settings) -> Dict[str, Any]:
+    """Keyword arguments for create_engine / create_async_engine for this URL"""
+    if make_url(url).get_backend_name() == "sqlite":
+        # The server pool settings do not apply: SQLAlchemy's default SQLite pool
+        # is used, and SQLite serializes writers itself
+        return {}
+    return {
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+    }
+
+
+def _install_sqlite_pragmas(sync_engine, pragmas: List[Tuple[str, Any]]):
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_db_engine(url: str = None, config: Settings = settings, echo: bool = None):
+    """Synchronous engine tuned for the database in url (default DATABASE_URL)"""
+    url = url or config.DATABASE_URL
+    echo = config.DB_ECHO if echo is None else echo
+    db_engine = create_engine(url, echo=echo, **engine_options(url, config))
+    if db_engine.dialect.name == "sqlite":
+        _install_sqlite_pragmas(db_engine, sqlite_pragmas(config))
+    instrument_engine(db_engine, config.DB_SLOW_QUERY_MS, config.DB_LOG_SAMPLE_RATE)
+    return db_engine
+
+
+def create_async_db_engine(url: str = None, config: Settings = settings, echo: bool = None):
+    """Async engine tuned for the database in url (default DATABASE_URL)"""
+    url = get_async_database_url(url or config.DATABASE_URL)
+    echo = config.DB_ECHO if echo is None else echo
+    db_engine = create_async_engine(url, echo=echo, **engine_options(url, config))
+    if db_engine.dialect.name == "sqlite":
+        _install_sqlite_pragmas(db_engine.sync_engine, sqlite_pragmas(config))
+    instrument_engine(db_engine.sync_engine, config.DB_SLOW_QUERY_MS, config.DB_LOG_SAMPLE_RATE)
+    return db_engine
 
-from .config import settings
 
 # Database setup
-engine = create_engine(settings.DATABASE_URL, echo=True)
+# Async engine for the API and knowledge base; the sync engine serves scripts
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+# Engines of event loops inside own_engine(); every other loop uses async_engine
+_loop_engines: Dict[asyncio.AbstractEventLoop, AsyncEngine] = {}
+
+
+def current_engine() -> AsyncEngine:
+    """The async engine sessions on the running event loop use"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return async_engine
+    return _loop_engines.get(loop, async_engine)
+
+
+@asynccontextmanager
+async def own_engine():
+    """Give the running event loop an engine of its own until the block exits
+
+    Pooled connections belong to the loop that opened them, so a loop that
+    ends while the process carries on, like a LiveKit job thread's, must not
+    leave its connections in the shared async_engine.
+    """
+    loop = asyncio.get_running_loop()
+    loop_engine = _loop_engines[loop] = create_async_db_engine()
+    try:
+        yield loop_engine
+    finally:
+        del _loop_engines[loop]
+        await loop_engine.dispose()
+
 
 # Request status constants
 REQUEST_STATUS_PENDING = "PENDING"
@@ -20,28 +132,62 @@ REQUEST_STATUS_RESOLVED = "RESOLVED"
 REQUEST_STATUS_UNRESOLVED = "UNRESOLVED"
 
 
+def default_timeout_at() -> datetime:
+    """Deadline for a help request created now"""
+    return datetime.utcnow() + timedelta(minutes=settings.REQUEST_TIMEOUT_MINUTES)
+
+
 class HelpRequest(Base):
     """Help request model"""
     __tablename__ = "help_requests"
+    __table_args__ = (
+        # Dashboard and stats queries filter on status and sort by time
+        Index("ix_help_requests_status_created_at", "status", "created_at"),
+        Index("ix_help_requests_status_resolved_at", "status", "resolved_at"),
+        # Keyset pagination on the requests page, unfiltered or by phone
+        Index("ix_help_requests_created_at_id", "created_at", "id"),
+        Index("ix_help_requests_customer_phone_created_at", "customer_phone", "created_at"),
+        # Timeout scheduler rebuilds its heap from pending deadlines
+        Index("ix_help_requests_status_timeout_at", "status", "timeout_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     customer_phone = Column(String, nullable=False)
     customer_name = Column(String, nullable=True)
     question = Column(Text, nullable=False)
     context = Column(Text, nullable=True)
-    status = Column(String(20), default="PENDING")
+    # active_history keeps the previous status available to the stats listener
+    status = column_property(Column(String(20), default="PENDING"), active_history=True)
     supervisor_response = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     resolved_at = Column(DateTime, nullable=True)
-    timeout_at = Column(DateTime, nullable=True)
+    timeout_at = Column(DateTime, nullable=True, default=default_timeout_at)
     
     def __repr__(self):
         return f"<HelpRequest(id={self.id}, status={self.status}, question='{self.question[:50]}...')>"
 
 
+def default_question_norm_hash(context) -> str:
+    """Fill question_norm_hash from the inserted question"""
+    from .knowledge_index import question_hash
+    return question_hash(context.get_current_parameters()["question"])
+
+
 class KnowledgeEntry(Base):
     """Knowledge base entry model"""
     __tablename__ = "knowledge_entries"
+    __table_args__ = (
+        Index("ix_knowledge_entries_is_active_created_at", "is_active", "created_at"),
+        # Other processes poll for entries changed since their last sync
+        Index("ix_knowledge_entries_updated_at", "updated_at"),
+        # At most one active entry per canonical question; also the dedupe lookup
+        Index(
+            "uq_knowledge_entries_active_question_norm_hash", "question_norm_hash",
+            unique=True,
+            sqlite_where=text("is_active = 1"),
+            postgresql_where=text("is_active")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     question = Column(Text, nullable=False)
@@ -50,26 +196,87 @@ class KnowledgeEntry(Base):
     source_request_id = Column(Integer, nullable=True)  # Links to HelpRequest
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    question_norm_hash = Column(String(40), nullable=True, default=default_question_norm_hash)
+    # Set on every insert and update, including deactivation
+    updated_at = Column(DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
         return f"<KnowledgeEntry(id={self.id}, question='{self.question[:50]}...')>"
 
 
+class KnowledgeEmbedding(Base):
+    """Question embedding for a knowledge entry, stored as float32 bytes"""
+    __tablename__ = "knowledge_embeddings"
+    
+    # One vector per entry and provider, so processes using different providers can share a database
+    entry_id = Column(Integer, ForeignKey("knowledge_entries.id"), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    vector = Column(LargeBinary, nullable=False)
+    
+    def __repr__(self):
+        return f"<KnowledgeEmbedding(entry_id={self.entry_id}, model='{self.model}')>"
+
+
+class RequestStat(Base):
+    """Running counter maintained alongside help request status changes"""
+    __tablename__ = "request_stats"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<RequestStat(name='{self.name}', value={self.value})>"
+
+
+OUTBOX_STATUS_PENDING = "PENDING"
+OUTBOX_STATUS_DONE = "DONE"
+OUTBOX_STATUS_DEAD = "DEAD"
+
+
+class OutboxMessage(Base):
+    """Side effect recorded in the same transaction as the change that caused it"""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        # Dispatchers claim due pending messages in id order
+        Index("ix_outbox_messages_status_available_at", "status", "available_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)  # JSON
+    status = Column(String(10), nullable=False, default=OUTBOX_STATUS_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, topic='{self.topic}', status={self.status})>"
+
+
 async def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    """Initialize database tables and apply pending schema migrations"""
+    from .migrations import run_migrations
+    
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        applied = await conn.run_sync(run_migrations)
     print("Database tables created")
+    if applied:
+        print(f"Applied schema migrations: {applied}")
 
 
-def get_db():
+async def get_db():
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal(bind=current_engine()) as db:
         yield db
-    finally:
-        db.close()
 
 
 def get_db_session():
-    """Get database session context manager"""
-    return SessionLocal()
+    """Get database session async context manager"""
+    return AsyncSessionLocal(bind=current_engine())
+
+
+# Registers the flush listener that keeps request_stats current
+from . import request_stats  # noqa: E402,F401
@@ -0,0 +1,86 @@
+"""
+Offline embedding providers for semantic knowledge search
+
+Both providers run on CPU without network access once installed. The hashing
+encoder is deterministic and dependency-free apart from numpy, which makes it
+suitable for tests; sentence-transformers is used when a real model is wanted.
+"""
+import logging
+import zlib
+from typing import List
+
+import numpy as np
+
+from .knowledge_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class HashingEncoder:
+    """Encodes text as hashed word and character trigram features"""
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def encode(self, text: str) -> np.ndarray:
+        """Encode text as a unit-length float32 vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in tokenize(text):
+            self._add(vector, f"w:{word}", 1.0)
+            padded = f"<{word}>"
+            for start in range(len(padded) - 2):
+                self._add(vector, padded[start:start + 3], 0.5)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode several texts into a (len(texts), dim) matrix"""
+        return np.stack([self.encode(text) for text in texts]) if texts else np.zeros((0, self.dim), dtype=np.float32)
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        digest = zlib.crc32(feature.encode("utf-8"))
+        vector[digest % self.dim] += weight if digest & 0x80000000 else -weight
+
+
+class SentenceTransformerEncoder:
+    """Encodes text with a local sentence-transformers model on CPU"""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def encode(self, text: str) -> np.ndarray:
+        """Encode text as a unit-length float32 vector"""
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encode several texts into a (len(texts), dim) matrix"""
+        return self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32)
+
+
+def vector_to_bytes(vector: np.ndarray) -> bytes:
+    """Serialize a vector for storage in a BLOB column"""
+    return vector.astype(np.float32).tobytes()
+
+
+def vector_from_bytes(data: bytes) -> np.ndarray:
+    """Deserialize a vector stored with vector_to_bytes"""
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def create_encoder(provider: str = "hashing", model: str = "", dim: int = 256):
+    """Create an embedding provider ("hashing" or "sentence-transformers")"""
+    if provider == "sentence-transformers":
+        try:
+            return SentenceTransformerEncoder(model or "all-MiniLM-L6-v2")
+        except ImportError:
+            logger.warning("sentence-transformers is not installed, falling back to the hashing encoder")
+    elif provider != "hashing":
+        logger.warning(f"Unknown embedding provider '{provider}', using the hashing encoder")
+
+    return HashingEncoder(dim)
@@ -0,0 +1,87 @@
+"""
+In-process broadcast hub for supervisor dashboard events
+
+Publishers never wait: each subscriber has its own bounded queue, and when a
+slow client's queue is full its backlog is replaced by a single resync
+event. Open dashboards therefore cost one queue each and no database queries.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CREATED = "request_created"
+REQUEST_RESOLVED = "request_resolved"
+REQUEST_TIMED_OUT = "request_timed_out"
+KNOWLEDGE_CHANGED = "knowledge_changed"
+# Sent in place of dropped events; the client should reload its state
+RESYNC = "resync"
+
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    """One client's bounded event queue"""
+
+    def __init__(self, max_queue: int):
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, event: Dict[str, Any]):
+        """Queue an event without blocking, collapsing a full backlog into a resync"""
+        if self.queue.full():
+            # The queued events and this one are all lost
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": RESYNC, "data": {"dropped": self.dropped}})
+            return
+        self.queue.put_nowait(event)
+
+
+class EventHub:
+    """Fans published events out to every subscribed dashboard"""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self.published_count = 0
+        self._subscribers: Set[Subscription] = set()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, event_type: str, **data):
+        """Send an event to every subscriber; never blocks"""
+        event = {"type": event_type, "data": data, "timestamp": datetime.utcnow().isoformat()}
+        self.published_count += 1
+        for subscription in list(self._subscribers):
+            subscription.offer(event)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        """Yield a subscription's events as Server-Sent Events, with heartbeats"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+
+# Shared by the API handlers, notifier, scheduler and knowledge base
+event_hub = EventHub()
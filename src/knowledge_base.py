@@ -1,21 +1,83 @@
 """
 Knowledge base management system
 """
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import threading
+import time
+import weakref
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Iterable
+from datetime import datetime, timedelta
 
-from .database import SessionLocal, KnowledgeEntry
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .database import get_db_session, KnowledgeEntry, KnowledgeEmbedding
 from .config import settings
+from .knowledge_index import create_index, normalize_question, question_hash
+from .answer_cache import AnswerCache, MISS
+from .event_hub import event_hub, KNOWLEDGE_CHANGED
+from .metrics import registry
 
 logger = logging.getLogger(__name__)
 
+KB_LOOKUPS = registry.counter(
+    "kb_lookups_total", "Knowledge base answer lookups by result (hit/miss) and source (cache/index)",
+    ("result", "source")
+)
+KB_LOOKUP_SECONDS = registry.histogram(
+    "kb_lookup_duration_seconds", "Time to answer a question from the knowledge base", ("source",)
+)
+KB_CANDIDATES = registry.histogram(
+    "kb_candidates_scored", "Knowledge entries scored per index lookup",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+)
+KB_ENTRIES = registry.gauge("kb_entries", "Active knowledge entries in this process's index")
+KB_CHANGES = registry.counter("kb_entries_changed_total", "Knowledge entries written, by action", ("action",))
+
+# Each sync re-reads entries changed this long before the previous one, so a
+# write that committed late (or on a slightly different clock) is not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def _create_encoder():
+    """Create the configured embedding provider"""
+    from .embeddings import create_encoder
+    return create_encoder(settings.KB_EMBEDDING_PROVIDER, settings.KB_EMBEDDING_MODEL, settings.KB_EMBEDDING_DIM)
+
 
 class KnowledgeBase:
-    """Manages the AI agent's knowledge base"""
+    """Manages the AI agent's knowledge base
+    
+    One instance is shared per process: the web app creates it in its
+    lifespan and injects it into handlers, and a voice worker's calls share
+    one across their threads. Every operation opens its own
+    short-lived session, so the instance holds no connections between calls.
+    """
     
     def __init__(self):
-        self.db = SessionLocal()
+        self.index = create_index(settings.KB_INDEX_BACKEND, settings.KB_VECTOR_DIM, _create_encoder)
+        # Set when the index searches stored question embeddings
+        self.encoder = getattr(self.index, "encoder", None)
+        self.cache = AnswerCache(
+            settings.KB_CACHE_SIZE,
+            settings.KB_CACHE_TTL_SECONDS,
+            settings.KB_CACHE_NEGATIVE_TTL_SECONDS
+        )
+        # Index loads are serialized per event loop (LiveKit runs each call on its
+        # own loop and thread); the index itself is only touched under _index_guard
+        self._index_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self._index_guard = threading.Lock()
+        self._synced_at = 0.0
+        self._synced_through: Optional[datetime] = None  # updated_at covered by the index
+    
+    @property
+    def _index_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._index_locks.get(loop)
+        if lock is None:
+            lock = self._index_locks[loop] = asyncio.Lock()
+        return lock
     
     async def initialize(self):
         """Initialize knowledge base with default salon information"""
@@ -54,100 +116,385 @@ class KnowledgeBase:
                 }
             ]
             
-            for knowledge in default_knowledge:
-                await self.add_knowledge(
-                    question=knowledge["question"],
-                    answer=knowledge["answer"],
-                    context=knowledge["context"]
-                )
-            
+            await self.bulk_import(default_knowledge)
+            await self._load_index()
             logger.info("Knowledge base initialized with default information")
             
         except Exception as e:
             logger.error(f" Error initializing knowledge base: {e}")
     
+    async def start(self):
+        """Load the in-memory index so the first lookup does not pay for it"""
+        async with self._index_lock:
+            if not self.index.loaded:
+                await self._load_index()
+        logger.info(f"Knowledge base index loaded with {len(self.index.entries)} entries")
+    
+    async def close(self):
+        """Release the in-memory index and cached answers"""
+        with self._index_guard:
+            self.index.clear()
+        self.cache.clear()
+    
     async def get_answer(self, question: str) -> Optional[str]:
         """Get answer for a question from knowledge base"""
+        match = await self.get_match(question)
+        return match["answer"] if match else None
+    
+    async def get_match(self, question: str) -> Optional[Dict[str, Any]]:
+        """Best matching entry for a question (id, question, answer, score), or None"""
+        # Repeated questions are served from the cache, including misses, until
+        # it expires or the knowledge base changes
+        start = time.perf_counter()
+        # Other processes' changes clear the cache, so pick them up before reading it
         try:
-            # Simple keyword matching for now
-            # In a real implementation, we'd use semantic search or embeddings
+            await self._refresh_index()
+        except Exception as e:
+            logger.error(f"Error syncing knowledge index: {e}")
+        key = normalize_question(question)
+        match = self.cache.get(key)
+        if match is not MISS:
+            KB_LOOKUPS.inc(result="hit" if match else "miss", source="cache")
+            KB_LOOKUP_SECONDS.observe(time.perf_counter() - start, source="cache")
+            return match
+        
+        matches = self._ranked(question, 1, settings.KB_MATCH_THRESHOLD)
+        match = matches[0] if matches else None
+        self.cache.put(key, match)
+        KB_LOOKUPS.inc(result="hit" if match else "miss", source="index")
+        KB_LOOKUP_SECONDS.observe(time.perf_counter() - start, source="index")
+        # The dense indexes score every entry
+        KB_CANDIDATES.observe(getattr(self.index, "last_candidates", len(self.index)))
+        
+        if match:
+            logger.info(f"📖 Found knowledge match: {match['question']} (score {match['score']:.2f})")
+        else:
+            logger.info(f"No knowledge found for: {question}")
+        return match
+    
+    async def search(self, question: str, top_k: int = None, min_score: float = None) -> List[Dict[str, Any]]:
+        """Rank knowledge entries by similarity to a question, best first"""
+        try:
+            if top_k is None:
+                top_k = settings.KB_SEARCH_TOP_K
+            if min_score is None:
+                min_score = settings.KB_MATCH_THRESHOLD
             
-            # Normalize question
-            question_lower = question.lower().strip()
+            await self._refresh_index()
+            return self._ranked(question, top_k, min_score)
             
-            # Search for matching knowledge entries
-            entries = self.db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.is_active == True
-            ).all()
+        except Exception as e:
+            logger.error(f"Error searching knowledge: {e}")
+            return []
+    
+    def _ranked(self, question: str, top_k: int, min_score: float) -> List[Dict[str, Any]]:
+        """Rank indexed entries as they are now; callers refresh the index first"""
+        results = []
+        with self._index_guard:
+            for entry_id, score in self.index.search(question, top_k, min_score):
+                entry_question, answer = self.index.entries[entry_id]
+                results.append({
+                    "id": entry_id,
+                    "question": entry_question,
+                    "answer": answer,
+                    "score": round(score, 4)
+                })
+        return results
+    
+    def discard(self, knowledge_id: int):
+        """Drop a deactivated entry from the index and invalidate cached answers"""
+        with self._index_guard:
+            self.index.remove(knowledge_id)
+        self.cache.clear()
+        KB_CHANGES.inc(action="deactivated")
+        KB_ENTRIES.set(len(self.index))
+        event_hub.publish(KNOWLEDGE_CHANGED, action="deactivated", knowledge_id=knowledge_id)
+    
+    async def _refresh_index(self):
+        """Load the index on first use, then sync other processes' changes at most once per interval"""
+        if not self.index.loaded:
+            async with self._index_lock:
+                if not self.index.loaded:
+                    await self._load_index()
+        elif time.monotonic() - self._synced_at >= settings.KB_SYNC_SECONDS:
+            # Changes made by this process are applied to the index directly
+            self._synced_at = time.monotonic()
+            await self._sync_index()
+    
+    async def _load_index(self):
+        """Build the in-memory index from all active entries"""
+        started = datetime.utcnow()
+        rows = await self._index_rows(self._active_entries())
+        with self._index_guard:
+            self.index.build(rows)
+        self._synced_through = started
+        self.cache.clear()
+        KB_ENTRIES.set(len(self.index))
+    
+    async def _sync_index(self):
+        """Apply entries added, updated or deactivated since the last sync, e.g. by another process"""
+        started = datetime.utcnow()
+        since = self._synced_through - SYNC_OVERLAP
+        async with get_db_session() as db:
+            result = await db.execute(select(KnowledgeEntry.id).where(
+                KnowledgeEntry.updated_at >= since,
+                KnowledgeEntry.is_active == False
+            ))
+            deactivated = [entry_id for entry_id in result.scalars() if entry_id in self.index.entries]
+        changed = [
+            row for row in await self._index_rows(self._active_entries().where(KnowledgeEntry.updated_at >= since))
+            # Rows re-read because of the overlap are usually unchanged
+            if self.index.entries.get(row[0]) != (row[1], row[2])
+        ]
+        self._synced_through = started
+        
+        if not deactivated and not changed:
+            return
+        with self._index_guard:
+            for entry_id in deactivated:
+                self.index.remove(entry_id)
+            for row in changed:
+                self.index.add(*row)
+        self.cache.clear()
+        KB_ENTRIES.set(len(self.index))
+        logger.info(f"Knowledge index synced: {len(changed)} added or updated, {len(deactivated)} deactivated")
+    
+    def _active_entries(self):
+        """Select active entries as (id, question, answer) rows in insertion order"""
+        return select(
+            KnowledgeEntry.id, KnowledgeEntry.question, KnowledgeEntry.answer
+        ).where(
+            KnowledgeEntry.is_active == True
+        ).order_by(KnowledgeEntry.id)
+    
+    async def _index_rows(self, query) -> List[tuple]:
+        """Load index rows, with stored embeddings when the index uses them"""
+        async with get_db_session() as db:
+            if not self.encoder:
+                result = await db.execute(query)
+                return [(row.id, row.question, row.answer) for row in result]
             
-            for entry in entries:
-                # Simple keyword matching
-                if self._questions_match(question_lower, entry.question.lower()):
-                    logger.info(f"📖 Found knowledge match: {entry.question}")
-                    return entry.answer
+            from .embeddings import vector_from_bytes, vector_to_bytes
             
-            logger.info(f"No knowledge found for: {question}")
-            return None
+            result = await db.execute(query.add_columns(KnowledgeEmbedding.vector).outerjoin(
+                KnowledgeEmbedding,
+                and_(
+                    KnowledgeEmbedding.entry_id == KnowledgeEntry.id,
+                    KnowledgeEmbedding.model == self.encoder.name
+                )
+            ))
+            rows = result.all()
             
-        except Exception as e:
-            logger.error(f"Error getting answer: {e}")
-            return None
-    
-    def _questions_match(self, question1: str, question2: str) -> bool:
-        """Simple question matching logic"""
-        # Extract key words from both questions
-        words1 = set(question1.split())
-        words2 = set(question2.split())
+            # Entries stored before this provider was configured are encoded once
+            missing = [row for row in rows if row.vector is None]
+            encoded = {}
+            if missing:
+                vectors = self.encoder.encode_batch([row.question for row in missing])
+                for row, vector in zip(missing, vectors):
+                    encoded[row.id] = vector
+                    await db.merge(KnowledgeEmbedding(
+                        entry_id=row.id,
+                        model=self.encoder.name,
+                        vector=vector_to_bytes(vector)
+                    ))
+                await db.commit()
+                logger.info(f"Stored {self.encoder.name} embeddings for {len(missing)} knowledge entries")
         
-        # Remove common words
-        common_words = {"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"}
-        words1 = words1 - common_words
-        words2 = words2 - common_words
+        return [
+            (row.id, row.question, row.answer,
+             encoded[row.id] if row.vector is None else vector_from_bytes(row.vector))
+            for row in rows
+        ]
+    
+    async def add_knowledge(self, question: str, answer: str, context: str = None, source_request_id: int = None,
+                            *, retry_conflict: bool = True) -> Optional[int]:
+        """Add new knowledge to the knowledge base, returning the entry id or None on failure"""
+        async with get_db_session() as db:
+            try:
+                vector = None
+                
+                # Same question asked differently, found through the unique hash index
+                result = await db.execute(select(KnowledgeEntry).where(
+                    KnowledgeEntry.question_norm_hash == question_hash(question),
+                    KnowledgeEntry.is_active == True
+                ))
+                existing = result.scalars().first()
+                
+                if existing:
+                    # Update existing entry
+                    existing.answer = answer
+                    existing.context = context
+                    existing.source_request_id = source_request_id
+                    logger.info(f"Updated existing knowledge entry: {existing.id}")
+                else:
+                    # Create new entry
+                    entry = KnowledgeEntry(
+                        question=question,
+                        answer=answer,
+                        context=context,
+                        source_request_id=source_request_id
+                    )
+                    db.add(entry)
+                    
+                    # Embeddings are computed once here rather than on every lookup
+                    if self.encoder:
+                        from .embeddings import vector_to_bytes
+                        await db.flush()
+                        vector = self.encoder.encode(question)
+                        db.add(KnowledgeEmbedding(
+                            entry_id=entry.id,
+                            model=self.encoder.name,
+                            vector=vector_to_bytes(vector)
+                        ))
+                    logger.info(f"Added new knowledge entry: {question[:50]}...")
+                
+                await db.commit()
+                self.cache.clear()
+                
+                indexed = existing or entry
+                KB_CHANGES.inc(action="updated" if existing else "added")
+                event_hub.publish(
+                    KNOWLEDGE_CHANGED,
+                    action="updated" if existing else "added",
+                    knowledge_id=indexed.id,
+                    question=indexed.question
+                )
+                
+                if self.index.loaded:
+                    with self._index_guard:
+                        if indexed.is_active and vector is not None:
+                            self.index.add(indexed.id, indexed.question, indexed.answer, vector)
+                        elif indexed.is_active:
+                            self.index.add(indexed.id, indexed.question, indexed.answer)
+                    KB_ENTRIES.set(len(self.index))
+                
+                return indexed.id
+                
+            except IntegrityError as e:
+                await db.rollback()
+                # Only a clash on the question hash index is a concurrent add; anything
+                # else (e.g. a missing answer) would fail the same way again
+                if not (retry_conflict and "question_norm_hash" in str(e.orig)):
+                    logger.error(f"Error adding knowledge: {e}")
+                    return None
+                logger.info(f"Knowledge entry added concurrently, retrying as update: {question[:50]}")
+                
+            except Exception as e:
+                logger.error(f"Error adding knowledge: {e}")
+                await db.rollback()
+                return None
         
-        # Check for overlap
-        overlap = len(words1.intersection(words2))
-        total_words = len(words1.union(words2))
+        # Another writer added the same question first; the retry finds and updates theirs
+        return await self.add_knowledge(question, answer, context, source_request_id, retry_conflict=False)
+    
+    async def bulk_import(self, entries: Iterable[Dict[str, Any]], batch_size: int = 1000,
+                          progress: Callable[[Dict[str, int]], None] = None) -> Dict[str, int]:
+        """Insert or update many entries in one transaction, deduplicated by normalized question
         
-        # If more than 50% of words overlap, consider it a match
-        return overlap / total_words > 0.5 if total_words > 0 else False
+        Entries whose question matches an active entry update its answer and
+        context; repeats of a question within the import are skipped. Each
+        batch is checked against the question hash index and written with
+        executemany statements, and progress is called with the running
+        counts after each batch.
+        """
+        counts = {"read": 0, "inserted": 0, "updated": 0, "duplicates": 0, "invalid": 0}
+        pending = {}  # normalized question hash -> entry values, in arrival order
+        
+        async with get_db_session() as db:
+            try:
+                async def write_batch():
+                    # One indexed lookup finds which questions already exist
+                    result = await db.execute(select(
+                        KnowledgeEntry.question_norm_hash, KnowledgeEntry.id
+                    ).where(
+                        KnowledgeEntry.question_norm_hash.in_(pending),
+                        KnowledgeEntry.is_active == True
+                    ))
+                    existing = dict(result.all())
+                    
+                    inserts, updates = [], []
+                    for norm_hash, values in pending.items():
+                        if norm_hash in existing:
+                            updates.append({"id": existing[norm_hash], "answer": values["answer"], "context": values["context"]})
+                        else:
+                            inserts.append({**values, "question_norm_hash": norm_hash})
+                    if inserts:
+                        await db.execute(insert(KnowledgeEntry), inserts)
+                        counts["inserted"] += len(inserts)
+                    if updates:
+                        await db.execute(update(KnowledgeEntry), updates)
+                        counts["updated"] += len(updates)
+                    pending.clear()
+                    if progress:
+                        progress(dict(counts))
+                
+                seen = set()
+                for entry in entries:
+                    counts["read"] += 1
+                    question = (entry.get("question") or "").strip()
+                    answer = (entry.get("answer") or "").strip()
+                    if not question or not answer:
+                        counts["invalid"] += 1
+                        continue
+                    
+                    norm_hash = question_hash(question)
+                    if norm_hash in seen:
+                        counts["duplicates"] += 1
+                        continue
+                    seen.add(norm_hash)
+                    
+                    pending[norm_hash] = {"question": question, "answer": answer, "context": entry.get("context") or None}
+                    if len(pending) >= batch_size:
+                        await write_batch()
+                
+                if pending:
+                    await write_batch()
+                await db.commit()
+                
+            except Exception as e:
+                logger.error(f"Error importing knowledge: {e}")
+                await db.rollback()
+                raise
+        
+        self.cache.clear()
+        if self.index.loaded:
+            async with self._index_lock:
+                await self._load_index()
+        KB_CHANGES.inc(counts["inserted"], action="imported")
+        KB_CHANGES.inc(counts["updated"], action="updated")
+        event_hub.publish(KNOWLEDGE_CHANGED, action="imported", inserted=counts["inserted"], updated=counts["updated"])
+        logger.info(f"Imported knowledge: {counts}")
+        return counts
     
-    async def add_knowledge(self, question: str, answer: str, context: str = None, source_request_id: int = None):
-        """Add new knowledge to the knowledge base"""
-        try:
-            # Check for similar question already exists
-            existing = self.db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.question.ilike(f"%{question}%")
-            ).first()
-            
-            if existing:
-                # Update existing entry
-                existing.answer = answer
-                existing.context = context
-                existing.source_request_id = source_request_id
-                logger.info(f"Updated existing knowledge entry: {existing.id}")
-            else:
-                # Create new entry
-                entry = KnowledgeEntry(
-                    question=question,
-                    answer=answer,
-                    context=context,
-                    source_request_id=source_request_id
-                )
-                self.db.add(entry)
-                logger.info(f"Added new knowledge entry: {question[:50]}...")
-            
-            self.db.commit()
-            
-        except Exception as e:
-            logger.error(f"Error adding knowledge: {e}")
-            self.db.rollback()
+    async def export_knowledge(self, include_inactive: bool = False, batch_size: int = 1000) -> AsyncIterator[Dict[str, Any]]:
+        """Stream knowledge entries in id order without loading them all"""
+        query = select(KnowledgeEntry).order_by(KnowledgeEntry.id)
+        if not include_inactive:
+            query = query.where(KnowledgeEntry.is_active == True)
+        
+        async with get_db_session() as db:
+            result = await db.stream_scalars(query.execution_options(yield_per=batch_size))
+            async for entry in result:
+                yield {
+                    "id": entry.id,
+                    "question": entry.question,
+                    "answer": entry.answer,
+                    "context": entry.context,
+                    "source_request_id": entry.source_request_id,
+                    "created_at": entry.created_at,
+                    "is_active": entry.is_active
+                }
+                # Streamed rows are not needed once written out
+                db.expunge(entry)
     
     async def get_all_knowledge(self) -> List[Dict[str, Any]]:
         """Get all knowledge entries"""
         try:
-            entries = self.db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.is_active == True
-            ).order_by(KnowledgeEntry.created_at.desc()).all()
+            async with get_db_session() as db:
+                result = await db.execute(select(KnowledgeEntry).where(
+                    KnowledgeEntry.is_active == True
+                ).order_by(KnowledgeEntry.created_at.desc()))
+                entries = result.scalars().all()
             
             return [
                 {
@@ -167,16 +514,16 @@ class KnowledgeBase:
     
     async def deactivate_knowledge(self, knowledge_id: int):
         """Deactivate a knowledge entry"""
-        try:
-            entry = self.db.query(KnowledgeEntry).filter(
-                KnowledgeEntry.id == knowledge_id
-            ).first()
-            
-            if entry:
-                entry.is_active = False
-                self.db.commit()
-                logger.info(f"Deactivated knowledge entry: {knowledge_id}")
-            
-        except Exception as e:
-            logger.error(f"Error deactivating knowledge: {e}")
-            self.db.rollback()
+        async with get_db_session() as db:
+            try:
+                entry = await db.get(KnowledgeEntry, knowledge_id)
+                
+                if entry:
+                    entry.is_active = False
+                    await db.commit()
+                    self.discard(knowledge_id)
+                    logger.info(f"Deactivated knowledge entry: {knowledge_id}")
+                
+            except Exception as e:
+                logger.error(f"Error deactivating knowledge: {e}")
+                await db.rollback()
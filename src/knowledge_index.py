@@ -0,0 +1,212 @@
+"""
+In-memory inverted index over knowledge base questions
+"""
+import hashlib
+import heapq
+import logging
+import math
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Common words ignored when matching questions
+STOPWORDS = frozenset({"the", "a", "an", "and", "or", "but", "in", "on", "at", "to", "for", "of", "with", "by"})
+
+# Re-weight all entries once the corpus size drifts this far from the size
+# their IDF weights were computed against
+REWEIGHT_DRIFT = 0.1
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> Set[str]:
+    """Split a question into its set of non-stopword tokens"""
+    return set(_TOKEN_PATTERN.findall(text.lower())) - STOPWORDS
+
+
+def normalize_question(text: str) -> str:
+    """Lower-case a question and collapse punctuation and whitespace"""
+    return " ".join(_TOKEN_PATTERN.findall(text.lower()))
+
+
+def canonicalize_question(text: str) -> str:
+    """Reduce a question to the words that distinguish it from others
+
+    Lower-cases, drops punctuation (including apostrophes, so "what's" and
+    "whats" agree), removes stopwords and collapses whitespace, keeping word
+    order.
+    """
+    words = _TOKEN_PATTERN.findall(text.lower().replace("'", ""))
+    return " ".join(word for word in words if word not in STOPWORDS)
+
+
+def question_hash(text: str) -> str:
+    """Hash of a canonicalized question, stored to find duplicates with an index lookup"""
+    return hashlib.sha1(canonicalize_question(text).encode()).hexdigest()
+
+
+def _idf(doc_freq: int, total: int) -> float:
+    """Smoothed inverse document frequency"""
+    return math.log((1 + total) / (1 + doc_freq)) + 1
+
+
+class KnowledgeIndex:
+    """TF-IDF weighted inverted index over active knowledge entries
+
+    Each entry's question is stored as a unit-length sparse vector of token
+    weights, and every token maps to the entries containing it with that
+    entry's weight. A query is scored by cosine similarity against only the
+    entries sharing a token with it.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}  # token -> {entry id: weight}
+        self.vectors: Dict[int, Dict[str, float]] = {}  # entry id -> {token: weight}
+        self.entries: Dict[int, Tuple[str, str]] = {}  # entry id -> (question, answer)
+        self.loaded = False
+        self.last_candidates = 0  # entries scored by the latest search
+        self._weighted_size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """Drop all indexed entries"""
+        self.postings.clear()
+        self.vectors.clear()
+        self.entries.clear()
+        self.loaded = False
+        self._weighted_size = 0
+
+    def build(self, rows: Iterable[Tuple[int, str, str]]):
+        """Replace the index contents with (entry id, question, answer) rows"""
+        self.clear()
+        for entry_id, question, answer in rows:
+            self.entries[entry_id] = (question, answer)
+            tokens = tokenize(question)
+            self.vectors[entry_id] = dict.fromkeys(tokens, 0.0)
+            for token in tokens:
+                self.postings.setdefault(token, {})[entry_id] = 0.0
+
+        self._reweigh_all()
+        self.loaded = True
+
+    def add(self, entry_id: int, question: str, answer: str):
+        """Index an entry, replacing any previous version of it"""
+        if entry_id in self.entries:
+            self.remove(entry_id)
+
+        self.entries[entry_id] = (question, answer)
+
+        tokens = tokenize(question)
+        for token in tokens:
+            self.postings.setdefault(token, {})[entry_id] = 0.0
+        self._weigh(entry_id, tokens)
+        self._check_drift()
+
+    def remove(self, entry_id: int):
+        """Remove an entry from the index"""
+        if self.entries.pop(entry_id, None) is None:
+            return
+
+        for token in self.vectors.pop(entry_id):
+            posting = self.postings[token]
+            del posting[entry_id]
+            if not posting:
+                del self.postings[token]
+        self._check_drift()
+
+    def search(self, question: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Return up to top_k (entry id, score) pairs scoring at least min_score, best first"""
+        self.last_candidates = 0
+        tokens = tokenize(question)
+        if not tokens or not self.entries:
+            return []
+
+        total = len(self.entries)
+        weights = {token: _idf(len(self.postings.get(token, ())), total) for token in tokens}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        terms = sorted(
+            (weight / norm, token) for token, weight in weights.items() if token in self.postings
+        )
+
+        # An entry sharing only the lowest-weight terms scores at most the norm
+        # of those terms, so they need not generate candidates of their own
+        split = 0
+        bound = 0.0
+        while split < len(terms):
+            bound += terms[split][0] ** 2
+            if math.sqrt(bound) >= min_score:
+                break
+            split += 1
+
+        scores: Dict[int, float] = {}
+        for weight, token in terms[split:]:
+            for entry_id, entry_weight in self.postings[token].items():
+                scores[entry_id] = scores.get(entry_id, 0.0) + weight * entry_weight
+
+        for weight, token in terms[:split]:
+            posting = self.postings[token]
+            if len(posting) < len(scores):
+                for entry_id, entry_weight in posting.items():
+                    if entry_id in scores:
+                        scores[entry_id] += weight * entry_weight
+            else:
+                for entry_id in scores:
+                    entry_weight = posting.get(entry_id)
+                    if entry_weight:
+                        scores[entry_id] += weight * entry_weight
+
+        self.last_candidates = len(scores)
+        # Ties go to the oldest entry
+        matches = ((entry_id, score) for entry_id, score in scores.items() if score >= min_score)
+        return heapq.nlargest(top_k, matches, key=lambda match: (match[1], -match[0]))
+
+    def _weigh(self, entry_id: int, tokens: Set[str]):
+        """Compute an entry's unit-length TF-IDF vector against the current corpus"""
+        total = len(self.entries)
+        weights = {token: _idf(len(self.postings[token]), total) for token in tokens}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+
+        vector = {token: weight / norm for token, weight in weights.items()}
+        self.vectors[entry_id] = vector
+        for token, weight in vector.items():
+            self.postings[token][entry_id] = weight
+
+    def _check_drift(self):
+        """Re-weight every entry once IDF values have drifted too far"""
+        total = len(self.entries)
+        if abs(total - self._weighted_size) <= REWEIGHT_DRIFT * self._weighted_size:
+            return
+
+        self._reweigh_all()
+
+    def _reweigh_all(self):
+        """Recompute every entry's vector against the current corpus"""
+        self._weighted_size = len(self.entries)
+        for entry_id, vector in self.vectors.items():
+            self._weigh(entry_id, set(vector))
+
+
+def create_index(backend: str = "inverted", dim: int = 512, encoder_factory=None):
+    """Create the knowledge index for a backend name ("inverted", "numpy" or "embedding")
+
+    encoder_factory is called to build the embedding provider for the
+    "embedding" backend.
+    """
+    try:
+        if backend == "numpy":
+            from .knowledge_vectors import HashedKnowledgeIndex
+            return HashedKnowledgeIndex(dim)
+        if backend == "embedding":
+            from .knowledge_vectors import EmbeddingIndex
+            return EmbeddingIndex(encoder_factory())
+    except ImportError as e:
+        logger.warning(f"Knowledge index backend '{backend}' is unavailable ({e}), falling back to the inverted index")
+        return KnowledgeIndex()
+
+    if backend != "inverted":
+        logger.warning(f"Unknown knowledge index backend '{backend}', using the inverted index")
+
+    return KnowledgeIndex()
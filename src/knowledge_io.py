@@ -0,0 +1,48 @@
+"""
+Reading and writing knowledge entries as JSONL or CSV
+
+Entries are streamed one line at a time in both directions, so files of any
+size are handled in constant memory.
+"""
+import csv
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("jsonl", "csv")
+
+def detect_format(filename: str, default: str = "jsonl") -> str:
+    """Pick the format from a file name's extension"""
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return default
+
+
+def read_entries(lines: Iterable[str], fmt: str = "jsonl") -> Iterator[Dict[str, Any]]:
+    """Yield one dict per JSONL line or CSV row; malformed lines yield an empty dict"""
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+        return
+    if fmt != "jsonl":
+        raise ValueError(f"Unknown knowledge file format: {fmt}")
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Skipping malformed line {line_number}: {e}")
+            entry = {}
+        yield entry if isinstance(entry, dict) else {}
+
+
+def entry_to_json(entry: Dict[str, Any]) -> str:
+    """Serialize an exported entry as one JSONL line"""
+    return json.dumps(entry, default=str, ensure_ascii=False) + "\n"
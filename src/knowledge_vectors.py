@@ -0,0 +1,238 @@
+"""
+NumPy-backed knowledge indexes using dense vectors
+
+Optional backends for the knowledge base (KB_INDEX_BACKEND=numpy or
+embedding). Requires numpy.
+"""
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .knowledge_index import REWEIGHT_DRIFT, tokenize
+
+# Rows are allocated in chunks of this size as the index grows
+_MIN_CAPACITY = 1024
+
+
+def hash_tokens(tokens: Iterable[str], dim: int) -> np.ndarray:
+    """Project tokens onto a signed hashed feature vector"""
+    vector = np.zeros(dim, dtype=np.float32)
+    for token in tokens:
+        digest = zlib.crc32(token.encode("utf-8"))
+        vector[digest % dim] += 1.0 if digest & 0x80000000 else -1.0
+    return vector
+
+
+class _DenseIndex:
+    """Row storage shared by the dense indexes: one matrix row per active entry"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.entries: Dict[int, Tuple[str, str]] = {}  # entry id -> (question, answer)
+        self.loaded = False
+        self._rows: Dict[int, int] = {}  # entry id -> matrix row
+        self._clear_arrays()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """Drop all indexed entries"""
+        self.entries.clear()
+        self._rows.clear()
+        self.loaded = False
+        self._clear_arrays()
+
+    def _clear_arrays(self):
+        self._matrix = np.zeros((_MIN_CAPACITY, self.dim), dtype=np.float32)
+        self._ids = np.zeros(_MIN_CAPACITY, dtype=np.int64)
+
+    def _append(self, entry_id: int, question: str, answer: str, vector: np.ndarray) -> int:
+        """Store an entry's vector in the next free row"""
+        row = len(self.entries)
+        if row == len(self._matrix):
+            self._grow()
+
+        self.entries[entry_id] = (question, answer)
+        self._rows[entry_id] = row
+        self._ids[row] = entry_id
+        self._matrix[row] = vector
+        return row
+
+    def _grow(self):
+        """Double the row capacity"""
+        capacity = len(self._matrix) * 2
+        self._matrix = np.resize(self._matrix, (capacity, self.dim))
+        self._matrix[len(self.entries):] = 0.0
+        self._ids = np.resize(self._ids, capacity)
+
+    def _pop(self, entry_id: int) -> Optional[Tuple[int, int]]:
+        """Remove an entry by moving the last row into its slot
+
+        Returns the (freed row, last row) pair so subclasses can move their own
+        per-row data, or None if the entry was not indexed.
+        """
+        if self.entries.pop(entry_id, None) is None:
+            return None
+
+        row = self._rows.pop(entry_id)
+        last = len(self.entries)
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = moved_id
+            self._rows[moved_id] = row
+
+        self._matrix[last] = 0.0
+        return row, last
+
+    def _top_k(self, scores: np.ndarray, top_k: int, min_score: float) -> List[Tuple[int, float]]:
+        """Pick the best-scoring rows as (entry id, score) pairs"""
+        candidates = np.flatnonzero(scores >= min_score)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(scores[candidates], -top_k)[-top_k:]]
+
+        # Ties go to the oldest entry
+        matches = [(int(self._ids[row]), float(scores[row])) for row in candidates]
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+
+class HashedKnowledgeIndex(_DenseIndex):
+    """Scores a question against every active entry in one matrix-vector product
+
+    Each row of the matrix holds an entry's hashed token counts. Queries are
+    weighted by per-feature IDF and scored by cosine similarity, so scores are
+    comparable to KnowledgeIndex apart from hash collisions.
+    """
+
+    def __init__(self, dim: int = 512):
+        super().__init__(dim)
+
+    def build(self, rows: Iterable[Tuple[int, str, str]]):
+        """Replace the index contents with (entry id, question, answer) rows"""
+        self.clear()
+        for entry_id, question, answer in rows:
+            self._append_hashed(entry_id, question, answer)
+
+        self._reweigh_all()
+        self.loaded = True
+
+    def add(self, entry_id: int, question: str, answer: str):
+        """Index an entry, replacing any previous version of it"""
+        if entry_id in self.entries:
+            self.remove(entry_id)
+
+        row = self._append_hashed(entry_id, question, answer)
+        self._norms[row] = self._row_norm(row)
+        self._check_drift()
+
+    def remove(self, entry_id: int):
+        """Remove an entry from the index"""
+        row = self._rows.get(entry_id)
+        if row is None:
+            return
+
+        self._doc_freq -= self._matrix[row] != 0
+        row, last = self._pop(entry_id)
+        self._norms[row] = self._norms[last]
+        self._norms[last] = 0.0
+        self._check_drift()
+
+    def search(self, question: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Return up to top_k (entry id, score) pairs scoring at least min_score, best first"""
+        size = len(self.entries)
+        tokens = tokenize(question)
+        if not tokens or not size:
+            return []
+
+        query = hash_tokens(tokens, self.dim) * self._idf
+        query_norm = float(np.linalg.norm(query))
+        if not query_norm:
+            return []
+
+        scores = self._matrix[:size] @ (query * self._idf)
+        scores /= self._norms[:size] * query_norm
+        return self._top_k(scores, top_k, min_score)
+
+    def _clear_arrays(self):
+        super()._clear_arrays()
+        self._norms = np.zeros(_MIN_CAPACITY, dtype=np.float32)
+        self._doc_freq = np.zeros(self.dim, dtype=np.int64)
+        self._idf = np.ones(self.dim, dtype=np.float32)
+        self._weighted_size = 0
+
+    def _grow(self):
+        super()._grow()
+        self._norms = np.resize(self._norms, len(self._matrix))
+
+    def _append_hashed(self, entry_id: int, question: str, answer: str) -> int:
+        row = self._append(entry_id, question, answer, hash_tokens(tokenize(question), self.dim))
+        self._doc_freq += self._matrix[row] != 0
+        return row
+
+    def _row_norm(self, row: int) -> float:
+        return float(np.linalg.norm(self._matrix[row] * self._idf)) or 1.0
+
+    def _check_drift(self):
+        """Recompute IDF weights once the corpus size has drifted too far"""
+        size = len(self.entries)
+        if abs(size - self._weighted_size) > REWEIGHT_DRIFT * self._weighted_size:
+            self._reweigh_all()
+
+    def _reweigh_all(self):
+        """Recompute feature IDF weights and every row's weighted norm"""
+        size = len(self.entries)
+        self._weighted_size = size
+        self._idf = (np.log((1 + size) / (1 + self._doc_freq)) + 1).astype(np.float32)
+
+        rows = self._matrix[:size]
+        norms = np.sqrt(np.einsum("ij,ij,j->i", rows, rows, self._idf * self._idf))
+        norms[norms == 0] = 1.0
+        self._norms[:size] = norms
+
+
+class EmbeddingIndex(_DenseIndex):
+    """Brute-force nearest-neighbour search over unit-length question embeddings
+
+    Vectors are computed once when an entry is stored and loaded back from the
+    database, so a lookup costs one encode plus one matrix-vector product.
+    """
+
+    def __init__(self, encoder):
+        super().__init__(encoder.dim)
+        self.encoder = encoder
+
+    def build(self, rows: Iterable[Tuple[int, str, str, np.ndarray]]):
+        """Replace the index contents with (entry id, question, answer, vector) rows"""
+        self.clear()
+        for entry_id, question, answer, vector in rows:
+            self._append(entry_id, question, answer, vector)
+        self.loaded = True
+
+    def add(self, entry_id: int, question: str, answer: str, vector: Optional[np.ndarray] = None):
+        """Index an entry, encoding its question only if it changed and no vector is given"""
+        if vector is None:
+            row = self._rows.get(entry_id)
+            if row is not None and self.entries[entry_id][0] == question:
+                vector = self._matrix[row].copy()
+            else:
+                vector = self.encoder.encode(question)
+
+        if entry_id in self.entries:
+            self.remove(entry_id)
+        self._append(entry_id, question, answer, vector)
+
+    def remove(self, entry_id: int):
+        """Remove an entry from the index"""
+        self._pop(entry_id)
+
+    def search(self, question: str, top_k: int = 5, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Return up to top_k (entry id, score) pairs scoring at least min_score, best first"""
+        size = len(self.entries)
+        if not question.strip() or not size:
+            return []
+
+        scores = self._matrix[:size] @ self.encoder.encode(question)
+        return self._top_k(scores, top_k, min_score)
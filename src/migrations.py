@@ -0,0 +1,181 @@
+"""
+Versioned schema migrations for existing databases
+
+create_all only creates missing tables, so changes to tables that already
+exist are applied here. Each migration runs once, in order, inside the
+init_db transaction, and is recorded in the schema_migrations table.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple, Union
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Integer, MetaData, String, Table, bindparam, inspect, insert, select, text, update
+)
+from sqlalchemy.engine import Connection
+
+from .config import settings
+from .database import HelpRequest, KnowledgeEmbedding, KnowledgeEntry, REQUEST_STATUS_PENDING
+from .knowledge_index import question_hash
+from .request_stats import backfill_request_stats
+
+logger = logging.getLogger(__name__)
+
+def backfill_timeout_at(conn: Connection):
+    """Give pending requests created before timeout_at was set a deadline"""
+    timeout = timedelta(minutes=settings.REQUEST_TIMEOUT_MINUTES)
+    pending = conn.execute(select(HelpRequest.id, HelpRequest.created_at).where(
+        HelpRequest.status == REQUEST_STATUS_PENDING,
+        HelpRequest.timeout_at.is_(None)
+    )).all()
+    for request_id, created_at in pending:
+        conn.execute(update(HelpRequest).where(HelpRequest.id == request_id).values(
+            timeout_at=(created_at or datetime.utcnow()) + timeout
+        ))
+
+
+def backfill_question_norm_hash(conn: Connection):
+    """Add and fill question_norm_hash, keeping only the newest active entry per question"""
+    columns = {column["name"] for column in inspect(conn).get_columns("knowledge_entries")}
+    if "question_norm_hash" not in columns:
+        conn.execute(text("ALTER TABLE knowledge_entries ADD COLUMN question_norm_hash VARCHAR(40)"))
+
+    rows = conn.execute(
+        select(KnowledgeEntry.id, KnowledgeEntry.question, KnowledgeEntry.is_active).order_by(
+            KnowledgeEntry.id.desc()
+        ).execution_options(yield_per=5000)
+    )
+    active_hashes = set()
+    updates, duplicates = [], []
+    for entry_id, question, is_active in rows:
+        norm_hash = question_hash(question)
+        updates.append({"entry_id": entry_id, "norm_hash": norm_hash})
+        if is_active:
+            # Rows are newest first, so an older active duplicate is superseded
+            if norm_hash in active_hashes:
+                duplicates.append({"entry_id": entry_id})
+            active_hashes.add(norm_hash)
+
+    # Only the columns this migration touches: the model's updated_at (and its
+    # onupdate) is added by a later migration and may not exist yet
+    table = Table(
+        "knowledge_entries",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("question_norm_hash", String(40)),
+        Column("is_active", Boolean),
+    )
+    if updates:
+        conn.execute(
+            update(table).where(table.c.id == bindparam("entry_id")).values(question_norm_hash=bindparam("norm_hash")),
+            updates
+        )
+    if duplicates:
+        conn.execute(update(table).where(table.c.id == bindparam("entry_id")).values(is_active=False), duplicates)
+        logger.warning(f"Deactivated {len(duplicates)} older duplicate knowledge entries")
+
+    # Created from the model so the partial index predicate matches each dialect's queries
+    for index in KnowledgeEntry.__table__.indexes:
+        if index.name == "uq_knowledge_entries_active_question_norm_hash":
+            index.create(conn, checkfirst=True)
+
+
+def add_knowledge_updated_at(conn: Connection):
+    """Add updated_at to knowledge entries, starting from each entry's creation time"""
+    columns = {column["name"] for column in inspect(conn).get_columns("knowledge_entries")}
+    if "updated_at" not in columns:
+        conn.execute(text("ALTER TABLE knowledge_entries ADD COLUMN updated_at TIMESTAMP"))
+    conn.execute(text(
+        "UPDATE knowledge_entries SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"
+    ))
+
+
+def key_embeddings_by_model(conn: Connection):
+    """Make (entry_id, model) the primary key of knowledge_embeddings"""
+    if inspect(conn).get_pk_constraint("knowledge_embeddings")["constrained_columns"] == ["entry_id", "model"]:
+        return
+
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            "ALTER TABLE knowledge_embeddings DROP CONSTRAINT knowledge_embeddings_pkey, "
+            "ADD PRIMARY KEY (entry_id, model)"
+        ))
+        return
+
+    # SQLite cannot change a primary key in place, so the table is rebuilt
+    conn.execute(text("ALTER TABLE knowledge_embeddings RENAME TO knowledge_embeddings_old"))
+    KnowledgeEmbedding.__table__.create(conn)
+    conn.execute(text(
+        "INSERT INTO knowledge_embeddings (entry_id, model, vector) "
+        "SELECT entry_id, model, vector FROM knowledge_embeddings_old"
+    ))
+    conn.execute(text("DROP TABLE knowledge_embeddings_old"))
+
+
+# A step is either a SQL statement or a callable taking the connection
+Step = Union[str, Callable[[Connection], None]]
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "Index help request and knowledge entry hot queries", [
+        "CREATE INDEX IF NOT EXISTS ix_help_requests_status_created_at ON help_requests (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_help_requests_status_resolved_at ON help_requests (status, resolved_at)",
+        "CREATE INDEX IF NOT EXISTS ix_knowledge_entries_is_active_created_at ON knowledge_entries (is_active, created_at)",
+    ]),
+    (2, "Backfill request status counters and latency histograms", [
+        backfill_request_stats,
+    ]),
+    (3, "Index help requests for keyset pagination", [
+        "CREATE INDEX IF NOT EXISTS ix_help_requests_created_at_id ON help_requests (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_help_requests_customer_phone_created_at ON help_requests (customer_phone, created_at)",
+    ]),
+    (4, "Index and backfill pending request deadlines", [
+        "CREATE INDEX IF NOT EXISTS ix_help_requests_status_timeout_at ON help_requests (status, timeout_at)",
+        backfill_timeout_at,
+    ]),
+    (5, "Deduplicate knowledge entries by normalized question hash", [
+        backfill_question_norm_hash,
+    ]),
+    (6, "Track knowledge entry changes for index sync across processes", [
+        add_knowledge_updated_at,
+        "CREATE INDEX IF NOT EXISTS ix_knowledge_entries_updated_at ON knowledge_entries (updated_at)",
+    ]),
+    (7, "Key knowledge embeddings by entry and model", [
+        key_embeddings_by_model,
+    ]),
+    (8, "Drop the response time histogram, which duplicated resolution times", [
+        "DELETE FROM request_stats WHERE name LIKE 'response_time:%'",
+    ]),
+]
+
+
+def run_migrations(conn: Connection) -> List[int]:
+    """Apply pending migrations and return the versions applied"""
+    schema_migrations.create(conn, checkfirst=True)
+    applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    newly_applied = []
+    for version, name, steps in MIGRATIONS:
+        if version in applied:
+            continue
+
+        for step in steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(text(step))
+
+        conn.execute(insert(schema_migrations).values(
+            version=version, name=name, applied_at=datetime.utcnow()
+        ))
+        newly_applied.append(version)
+        logger.info(f"Applied schema migration {version}: {name}")
+
+    return newly_applied
@@ -0,0 +1,410 @@
+"""
+Asynchronous supervisor notification pipeline
+
+Notifications are queued without waiting and delivered by background
+workers to each configured channel (log, webhook, SMTP, SMS). Notifications
+arriving within the digest window are coalesced into one digest, failed
+deliveries are retried with exponential backoff, and delivery latency and
+drops are counted for monitoring.
+"""
+import abc
+import asyncio
+import logging
+import random
+import smtplib
+import time
+from collections import Counter, deque
+from datetime import datetime
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HELP_REQUEST = "help_request"
+REMINDER = "reminder"
+TIMEOUT = "timeout"
+
+# Recent delivery latencies kept for percentile estimates
+LATENCY_SAMPLES = 1000
+
+
+class Notification:
+    """A single supervisor notification"""
+
+    def __init__(self, kind: str, request_id: int, **data):
+        self.kind = kind
+        self.request_id = request_id
+        self.data = data
+        self.timestamp = datetime.utcnow()
+        self.queued_at = time.monotonic()
+
+    def summary(self) -> str:
+        """One-line description, used in digests, SMS and email subjects"""
+        if self.kind == HELP_REQUEST:
+            return f"Request #{self.request_id} from {self.data.get('customer_name') or 'Unknown'}: {self.data.get('question')}"
+        if self.kind == REMINDER:
+            return f"Request #{self.request_id} has {self.data.get('minutes_remaining')} minutes remaining"
+        return f"Request #{self.request_id} has timed out"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "request_id": self.request_id,
+            "timestamp": self.timestamp.isoformat(),
+            **self.data
+        }
+
+
+def digest_text(batch: List[Notification]) -> str:
+    """Plain text body for one notification or a digest of several"""
+    if len(batch) == 1:
+        return batch[0].summary()
+    lines = [f"{len(batch)} supervisor notifications:"]
+    lines.extend(f"- {notification.summary()}" for notification in batch)
+    return "\n".join(lines)
+
+
+class NotificationChannel(abc.ABC):
+    """Delivers a batch of notifications; raise to have the batch retried"""
+
+    name = "channel"
+
+    @abc.abstractmethod
+    async def send(self, batch: List[Notification]):
+        """Deliver the batch, as a digest if it holds more than one notification"""
+
+    async def close(self):
+        pass
+
+
+class LogChannel(NotificationChannel):
+    """Prints notifications to stdout, as the notifier always has"""
+
+    name = "log"
+
+    async def send(self, batch: List[Notification]):
+        if len(batch) > 1:
+            print(f"\n SUPERVISOR DIGEST ({len(batch)} notifications)")
+            for notification in batch:
+                print(f"   - {notification.summary()}")
+            print(f"   Action: Please check the supervisor UI at /supervisor\n")
+            return
+
+        notification = batch[0]
+        if notification.kind == HELP_REQUEST:
+            print(f"\n SUPERVISOR NOTIFICATION #{notification.data.get('notification_id')}")
+            print(f"   Request ID: {notification.request_id}")
+            print(f"   Customer: {notification.data.get('customer_name')}")
+            print(f"   Question: {notification.data.get('question')}")
+            print(f"   Time: {notification.timestamp}")
+            print(f"   Action: Please check the supervisor UI at /supervisor")
+            print(f"   Status: PENDING\n")
+        elif notification.kind == REMINDER:
+            print(f"\n REMINDER: Request #{notification.request_id} has {notification.data.get('minutes_remaining')} minutes remaining")
+            print(f"   Please respond soon to avoid timeout\n")
+        else:
+            print(f"\n TIMEOUT: Request #{notification.request_id} has timed out")
+            print(f"   Customer will be notified that we couldn't get back to them\n")
+
+
+class WebhookChannel(NotificationChannel):
+    """POSTs each batch as JSON to a URL"""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        import httpx
+        self.url = url
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def send(self, batch: List[Notification]):
+        response = await self.client.post(self.url, json={
+            "digest": len(batch) > 1,
+            "text": digest_text(batch),
+            "notifications": [notification.to_dict() for notification in batch]
+        })
+        response.raise_for_status()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SMTPChannel(NotificationChannel):
+    """Emails each batch to the supervisor"""
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, sender: str, recipients: List[str],
+                 username: str = "", password: str = "", use_tls: bool = False, timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    async def send(self, batch: List[Notification]):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        if len(batch) > 1:
+            message["Subject"] = f"{settings.SALON_NAME}: {len(batch)} supervisor notifications"
+        else:
+            message["Subject"] = f"{settings.SALON_NAME}: {batch[0].summary()[:80]}"
+        message.set_content(digest_text(batch) + "\n\nSupervisor UI: /supervisor")
+        # smtplib blocks, so it runs off the event loop
+        await asyncio.to_thread(self._deliver, message)
+
+    def _deliver(self, message: EmailMessage):
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            smtp.send_message(message)
+
+
+class SMSChannel(NotificationChannel):
+    """Texts each batch to the supervisor through Twilio's Messages API"""
+
+    name = "sms"
+
+    # SMS bodies longer than this are split by carriers into several messages
+    MAX_LENGTH = 320
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, to_number: str,
+                 api_url: str = "https://api.twilio.com", timeout: float = 10.0):
+        import httpx
+        self.url = f"{api_url.rstrip('/')}/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.from_number = from_number
+        self.to_number = to_number
+        self.client = httpx.AsyncClient(auth=(account_sid, auth_token), timeout=timeout)
+
+    async def send(self, batch: List[Notification]):
+        body = digest_text(batch)
+        if len(body) > self.MAX_LENGTH:
+            body = body[:self.MAX_LENGTH - 3] + "..."
+        response = await self.client.post(self.url, data={
+            "From": self.from_number,
+            "To": self.to_number,
+            "Body": body
+        })
+        response.raise_for_status()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_channels(names: List[str]) -> List[NotificationChannel]:
+    """Build the named channels from settings, skipping unconfigured ones"""
+    channels = []
+    for name in names:
+        if name == "log":
+            channels.append(LogChannel())
+        elif name == "webhook" and settings.NOTIFY_WEBHOOK_URL:
+            channels.append(WebhookChannel(settings.NOTIFY_WEBHOOK_URL))
+        elif name == "smtp" and settings.SMTP_HOST and settings.SUPERVISOR_EMAIL:
+            channels.append(SMTPChannel(
+                settings.SMTP_HOST,
+                settings.SMTP_PORT,
+                settings.SMTP_FROM,
+                [address.strip() for address in settings.SUPERVISOR_EMAIL.split(",")],
+                settings.SMTP_USERNAME,
+                settings.SMTP_PASSWORD,
+                settings.SMTP_USE_TLS
+            ))
+        elif name == "sms" and settings.TWILIO_ACCOUNT_SID and settings.SUPERVISOR_PHONE:
+            channels.append(SMSChannel(
+                settings.TWILIO_ACCOUNT_SID,
+                settings.TWILIO_AUTH_TOKEN,
+                settings.TWILIO_FROM_NUMBER,
+                settings.SUPERVISOR_PHONE,
+                settings.TWILIO_API_URL
+            ))
+        else:
+            logger.warning(f"Notification channel '{name}' is unknown or not configured, skipping")
+    return channels
+
+
+class NotificationDispatcher:
+    """Queues notifications and delivers them to every channel in the background
+
+    A batcher task collects notifications for digest_window seconds after
+    the first one arrives, then hands the batch to a pool of delivery workers,
+    one delivery per channel. enqueue() never waits; when the queue is full the
+    notification is dropped and counted. It may be called from other threads'
+    event loops (a voice worker's calls), which hand the notification over to
+    the loop the dispatcher was started on.
+    """
+
+    def __init__(self, channels: List[NotificationChannel], workers: int = 4, queue_size: int = 1000,
+                 digest_window: float = 1.0, max_digest: int = 50, max_attempts: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
+        self.channels = channels
+        self.workers = workers
+        self.queue_size = queue_size
+        self.digest_window = digest_window
+        self.max_digest = max_digest
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.delivered = Counter()
+        self.failed = Counter()
+        self.retries = Counter()
+        self.digests = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._deliveries: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the batcher and delivery workers on the running event loop"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._deliveries = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._batch_loop())]
+        self._tasks.extend(asyncio.create_task(self._delivery_loop()) for _ in range(self.workers))
+
+    async def stop(self, timeout: float = 10.0):
+        """Deliver what is already queued, within timeout, then stop the workers"""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notification queue not drained before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for channel in self.channels:
+            await channel.close()
+
+    async def _drain(self):
+        await self._queue.join()
+        await self._deliveries.join()
+
+    def enqueue(self, notification: Notification) -> bool:
+        """Queue a notification without waiting; False if it was dropped"""
+        if self.running and self._loop.is_closed():
+            # Started on a loop that has since ended, e.g. by an earlier asyncio.run()
+            self._tasks = []
+        if not self.running:
+            self.start()
+        if self._loop is not asyncio.get_running_loop():
+            # Queued by the dispatcher's own loop; a drop is still counted there
+            self._loop.call_soon_threadsafe(self._put, notification)
+            return True
+        return self._put(notification)
+
+    def _put(self, notification: Notification) -> bool:
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Notification queue full, dropped {notification.kind} for request #{notification.request_id}")
+            return False
+        self.enqueued += 1
+        return True
+
+    async def _batch_loop(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.digest_window
+            while len(batch) < self.max_digest:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            if len(batch) > 1:
+                self.digests += 1
+            for channel in self.channels:
+                self._deliveries.put_nowait((channel, batch))
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _delivery_loop(self):
+        while True:
+            channel, batch = await self._deliveries.get()
+            try:
+                await self._deliver(channel, batch)
+            finally:
+                self._deliveries.task_done()
+
+    async def _deliver(self, channel: NotificationChannel, batch: List[Notification]):
+        """Send a batch to one channel, retrying with exponential backoff and jitter"""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await channel.send(batch)
+                self.delivered[channel.name] += len(batch)
+                now = time.monotonic()
+                self._latencies.extend(now - notification.queued_at for notification in batch)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    self.failed[channel.name] += len(batch)
+                    logger.error(f"Giving up on {channel.name} delivery of {len(batch)} notifications: {e}")
+                    return
+                self.retries[channel.name] += 1
+                delay = min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max)
+                logger.warning(f"{channel.name} delivery failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue, delivery and latency counters for monitoring"""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * p / 100), len(latencies) - 1)], 4)
+
+        return {
+            "channels": [channel.name for channel in self.channels],
+            "queued": self._queue.qsize() if self._queue else 0,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "digests": self.digests,
+            "delivered": dict(self.delivered),
+            "failed": dict(self.failed),
+            "retries": dict(self.retries),
+            "latency_seconds": {"p50": percentile(50), "p95": percentile(95), "max": percentile(100)}
+        }
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def get_dispatcher() -> NotificationDispatcher:
+    """The process-wide dispatcher, built from settings on first use"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher(
+            create_channels(settings.NOTIFY_CHANNELS),
+            workers=settings.NOTIFY_WORKERS,
+            queue_size=settings.NOTIFY_QUEUE_SIZE,
+            digest_window=settings.NOTIFY_DIGEST_WINDOW_SECONDS,
+            max_attempts=settings.NOTIFY_MAX_ATTEMPTS
+        )
+    return _dispatcher
@@ -0,0 +1,198 @@
+"""
+Transactional outbox for work that follows a help request status change
+
+Handlers add outbox messages in the same transaction as the status change,
+so a committed resolution always has its follow-up recorded. A background
+dispatcher then runs each message's handler, retrying failures with
+backoff. Each batch is claimed before it runs, so several dispatchers
+(one per web app process) never run the same message at once. Delivery is
+at least once: a crash after a handler succeeds but before the message is
+marked done runs it again once its claim expires, so handlers must be
+idempotent.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .answer_relay import answer_relay
+from .config import settings
+from .database import (
+    get_db_session, OutboxMessage,
+    OUTBOX_STATUS_PENDING, OUTBOX_STATUS_DONE, OUTBOX_STATUS_DEAD,
+)
+
+logger = logging.getLogger(__name__)
+
+LEARN_KNOWLEDGE = "learn_knowledge"
+CUSTOMER_FOLLOWUP = "customer_followup"
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# Set after a commit that added messages, so they are sent without waiting for the next poll
+_wakeup = asyncio.Event()
+
+
+def add_message(db: AsyncSession, topic: str, **payload) -> OutboxMessage:
+    """Record a message in the caller's transaction; it is sent once that commits"""
+    message = OutboxMessage(topic=topic, payload=json.dumps(payload, default=str))
+    db.add(message)
+    return message
+
+
+def timeout_message() -> str:
+    """What a customer is told when their question could not be answered in time"""
+    return (
+        "Sorry, we couldn't get an answer to your question in time. "
+        f"Please call us at {settings.SALON_PHONE} and we'll be happy to help."
+    )
+
+
+def wake():
+    """Tell the dispatcher in this process that new messages were committed"""
+    _wakeup.set()
+
+
+def create_handlers(knowledge_base) -> Dict[str, Handler]:
+    """Handlers for the topics written by the supervisor endpoints and scheduler"""
+
+    async def learn_knowledge(payload: Dict[str, Any]):
+        # add_knowledge updates an existing entry for the same question, so reruns are harmless
+        entry_id = await knowledge_base.add_knowledge(
+            question=payload["question"],
+            answer=payload["answer"],
+            context=payload.get("context"),
+            source_request_id=payload.get("request_id")
+        )
+        if entry_id is None:
+            raise RuntimeError(f"Could not learn answer for request #{payload.get('request_id')}")
+
+    async def customer_followup(payload: Dict[str, Any]):
+        # A caller still on hold hears the answer (or the timeout) in the call instead
+        if payload.get("relay_to_call"):
+            relay = answer_relay.deliver_timeout if payload.get("timed_out") else answer_relay.deliver
+            if relay(payload["request_id"], payload["message"]):
+                logger.info(f"Follow-up to request #{payload['request_id']} relayed into the live call")
+                return
+        
+        # Simulated SMS to the customer
+        print(f"\n📱 CUSTOMER NOTIFICATION:")
+        print(f"   To: {payload['customer_phone']}")
+        print(f"   Message: {payload['message']}")
+        print(f"   Time: {datetime.utcnow()}\n")
+
+    return {LEARN_KNOWLEDGE: learn_knowledge, CUSTOMER_FOLLOWUP: customer_followup}
+
+
+class OutboxDispatcher:
+    """Runs pending outbox messages in id order, in the background"""
+
+    def __init__(self, handlers: Dict[str, Handler], batch_size: int = 50,
+                 poll_seconds: float = None, max_attempts: int = None, claim_seconds: float = 300.0):
+        self.handlers = handlers
+        self.batch_size = batch_size
+        # Longer than a batch takes to run; a dispatcher that dies mid-batch leaves the rest for others after this
+        self.claim_seconds = claim_seconds
+        self.poll_seconds = settings.OUTBOX_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.max_attempts = settings.OUTBOX_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.processed_count = 0
+        self.failed_count = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start draining, beginning with anything left over from before a restart"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                _wakeup.clear()
+                await self.drain()
+                # Polling picks up messages committed by other processes and retries coming due
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in outbox dispatcher: {e}")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def drain(self) -> int:
+        """Process due messages until none are left; returns how many were handled"""
+        handled = 0
+        while True:
+            async with get_db_session() as db:
+                messages = await self._claim(db)
+
+                for message in messages:
+                    await self._process(message)
+                    # Commit per message so finished work is not repeated after a crash
+                    await db.commit()
+
+            handled += len(messages)
+            if len(messages) < self.batch_size:
+                return handled
+
+    async def _claim(self, db: AsyncSession) -> List[OutboxMessage]:
+        """Claim the next due batch by moving it out of reach of other dispatchers
+
+        The UPDATE only matches messages that are still pending and due, so when
+        dispatchers race for the same batch each message is returned to exactly
+        one of them; the rest of the batch simply is not theirs.
+        """
+        now = datetime.utcnow()
+        due = select(OutboxMessage.id).where(
+            OutboxMessage.status == OUTBOX_STATUS_PENDING,
+            OutboxMessage.available_at <= now
+        ).order_by(OutboxMessage.id).limit(self.batch_size)
+        result = await db.execute(
+            update(OutboxMessage).where(
+                OutboxMessage.id.in_(due.scalar_subquery()),
+                OutboxMessage.status == OUTBOX_STATUS_PENDING,
+                OutboxMessage.available_at <= now
+            ).values(available_at=now + timedelta(seconds=self.claim_seconds))
+            .returning(OutboxMessage)
+            .execution_options(synchronize_session=False)
+        )
+        messages = sorted(result.scalars().all(), key=lambda message: message.id)
+        await db.commit()
+        return messages
+
+    async def _process(self, message: OutboxMessage):
+        handler = self.handlers.get(message.topic)
+        message.attempts += 1
+        try:
+            if handler is None:
+                raise LookupError(f"No outbox handler for topic '{message.topic}'")
+            await handler(json.loads(message.payload))
+            message.status = OUTBOX_STATUS_DONE
+            message.processed_at = datetime.utcnow()
+            message.last_error = None
+            self.processed_count += 1
+
+        except Exception as e:
+            message.last_error = str(e)
+            if message.attempts >= self.max_attempts:
+                message.status = OUTBOX_STATUS_DEAD
+                self.failed_count += 1
+                logger.error(f"Outbox message {message.id} ({message.topic}) failed for good: {e}")
+            else:
+                delay = min(2 ** message.attempts, 300)
+                message.available_at = datetime.utcnow() + timedelta(seconds=delay)
+                logger.warning(f"Outbox message {message.id} ({message.topic}) failed, retrying in {delay}s: {e}")
@@ -0,0 +1,160 @@
+"""
+Materialized help request counters and latency histograms
+
+Request counts per status and a histogram of resolution times are kept in the request_stats table. A flush listener updates them in the
+same transaction as every ORM status change, so reading stats never scans
+request history. Bulk UPDATEs that bypass the ORM must call
+apply_stat_deltas themselves.
+"""
+import bisect
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from .database import (
+    HelpRequest, RequestStat,
+    REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED,
+)
+
+# Histogram bucket upper bounds in seconds; the last bucket is unbounded
+BUCKET_BOUNDS = [5, 15, 30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 7200, 14400, 43200, 86400]
+
+STATUS_PREFIX = "status:"
+RESOLUTION_TIME = "resolution_time"  # created -> closed, answered or timed out
+
+PERCENTILES = (50, 90, 99)
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _bucket_name(metric: str, seconds: float) -> str:
+    return f"{metric}:{bisect.bisect_left(BUCKET_BOUNDS, seconds)}"
+
+
+def transition_deltas(old_status: Optional[str], new_status: Optional[str],
+                      created_at: Optional[datetime], resolved_at: Optional[datetime]) -> Counter:
+    """Counter changes for a request moving from old_status to new_status"""
+    deltas = Counter()
+    if old_status == new_status:
+        return deltas
+
+    if old_status:
+        deltas[STATUS_PREFIX + old_status] -= 1
+    if new_status:
+        deltas[STATUS_PREFIX + new_status] += 1
+
+    if new_status in (REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED) and created_at and resolved_at:
+        seconds = max((resolved_at - created_at).total_seconds(), 0)
+        deltas[_bucket_name(RESOLUTION_TIME, seconds)] += 1
+
+    return deltas
+
+
+def apply_stat_deltas(conn: Connection, deltas: Dict[str, int]):
+    """Add deltas to the stored counters, creating missing ones"""
+    rows = [{"name": name, "value": delta} for name, delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+    # A single upsert, so two transactions creating the same counter cannot
+    # both miss it and collide on the insert
+    statement = UPSERT_INSERTS[conn.dialect.name](RequestStat)
+    conn.execute(
+        statement.on_conflict_do_update(
+            index_elements=[RequestStat.name],
+            set_={"value": RequestStat.value + statement.excluded.value}
+        ),
+        rows
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _track_request_changes(session: Session, flush_context, instances):
+    """Fold help request inserts, status changes and deletes into the counters"""
+    deltas = Counter()
+
+    for obj in session.new:
+        if isinstance(obj, HelpRequest):
+            deltas.update(transition_deltas(None, obj.status or REQUEST_STATUS_PENDING, obj.created_at, obj.resolved_at))
+
+    for obj in session.dirty:
+        if isinstance(obj, HelpRequest):
+            history = inspect(obj).attrs.status.history
+            if history.added and history.deleted:
+                deltas.update(transition_deltas(history.deleted[0], history.added[0], obj.created_at, obj.resolved_at))
+
+    for obj in session.deleted:
+        if isinstance(obj, HelpRequest):
+            deltas[STATUS_PREFIX + (obj.status or REQUEST_STATUS_PENDING)] -= 1
+
+    if deltas:
+        apply_stat_deltas(session.connection(), deltas)
+
+
+def backfill_request_stats(conn: Connection):
+    """Rebuild every counter from request history (run once by a migration)"""
+    deltas = Counter()
+    for status, count in conn.execute(select(HelpRequest.status, func.count()).group_by(HelpRequest.status)):
+        deltas[STATUS_PREFIX + (status or REQUEST_STATUS_PENDING)] += count
+
+    closed = conn.execute(
+        select(HelpRequest.status, HelpRequest.created_at, HelpRequest.resolved_at).where(
+            HelpRequest.status.in_([REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED])
+        ).execution_options(yield_per=10000)
+    )
+    for status, created_at, resolved_at in closed:
+        transition = transition_deltas(None, status, created_at, resolved_at)
+        del transition[STATUS_PREFIX + status]
+        deltas.update(transition)
+
+    conn.execute(RequestStat.__table__.delete())
+    apply_stat_deltas(conn, deltas)
+
+
+def _percentiles(counts: List[int]) -> Dict[str, Optional[float]]:
+    """Estimate percentiles by interpolating within histogram buckets"""
+    total = sum(counts)
+    result = {}
+    for percentile in PERCENTILES:
+        key = f"p{percentile}"
+        if not total:
+            result[key] = None
+            continue
+
+        rank = total * percentile / 100
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                lower = BUCKET_BOUNDS[index - 1] if index else 0
+                if index == len(BUCKET_BOUNDS):
+                    result[key] = float(lower)
+                else:
+                    fraction = (rank - cumulative) / count
+                    result[key] = round(lower + (BUCKET_BOUNDS[index] - lower) * fraction, 1)
+                break
+            cumulative += count
+    return result
+
+
+def summarize(stats: Iterable[RequestStat]) -> Dict[str, object]:
+    """Turn stored counters into status counts and latency percentiles"""
+    statuses = Counter()
+    histograms = {RESOLUTION_TIME: [0] * (len(BUCKET_BOUNDS) + 1)}
+
+    for stat in stats:
+        if stat.name.startswith(STATUS_PREFIX):
+            statuses[stat.name[len(STATUS_PREFIX):]] += stat.value
+            continue
+        metric, _, bucket = stat.name.partition(":")
+        if metric in histograms and bucket.isdigit() and int(bucket) < len(histograms[metric]):
+            histograms[metric][int(bucket)] += stat.value
+
+    return {
+        "statuses": dict(statuses),
+        "resolution_time_seconds": _percentiles(histograms[RESOLUTION_TIME]),
+    }
@@ -0,0 +1,77 @@
+"""
+Statement timing, slow query logging and sampled SQL logs for engines
+
+Replaces echo=True in normal operation. Every statement's duration goes into
+a histogram by operation; statements slower than DB_SLOW_QUERY_MS are logged
+as warnings and a DB_LOG_SAMPLE_RATE fraction of the rest at INFO, both as
+one JSON object per line. Parameters are never logged since they hold
+customer phone numbers and questions.
+"""
+import json
+import logging
+import random
+import time
+
+from sqlalchemy import event
+
+from .config import settings
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SQL_DURATION = registry.histogram(
+    "db_statement_duration_seconds", "Time spent executing SQL statements", ("operation",)
+)
+SQL_SLOW = registry.counter(
+    "db_slow_statements_total", "SQL statements slower than DB_SLOW_QUERY_MS", ("operation",)
+)
+SQL_ERRORS = registry.counter(
+    "db_statement_errors_total", "SQL statements that raised an error", ("operation",)
+)
+
+MAX_LOGGED_STATEMENT = 1000
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "PRAGMA", "CREATE", "ALTER", "DROP"}
+
+
+def statement_operation(statement: str) -> str:
+    """First keyword of a statement, used as the operation label"""
+    keyword = statement[:12].lstrip().split(None, 1)
+    operation = keyword[0].upper() if keyword else ""
+    return operation if operation in _OPERATIONS else "OTHER"
+
+
+def _log_statement(level: int, statement: str, operation: str, seconds: float, executemany: bool, slow: bool):
+    logger.log(level, json.dumps({
+        "event": "slow_query" if slow else "query",
+        "operation": operation,
+        "duration_ms": round(seconds * 1000, 3),
+        "executemany": executemany,
+        "statement": " ".join(statement.split())[:MAX_LOGGED_STATEMENT],
+    }))
+
+
+def instrument_engine(sync_engine, slow_query_ms: float = None, sample_rate: float = None):
+    """Attach timing and logging hooks to a (sync) engine"""
+    slow_seconds = (settings.DB_SLOW_QUERY_MS if slow_query_ms is None else slow_query_ms) / 1000
+    sample_rate = settings.DB_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info.pop("query_start")
+        operation = statement_operation(statement)
+        SQL_DURATION.observe(seconds, operation=operation)
+        if seconds >= slow_seconds:
+            SQL_SLOW.inc(operation=operation)
+            _log_statement(logging.WARNING, statement, operation, seconds, executemany, slow=True)
+        elif sample_rate and random.random() < sample_rate:
+            _log_statement(logging.INFO, statement, operation, seconds, executemany, slow=False)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def record_error(context):
+        if context.connection is not None:
+            context.connection.info.pop("query_start", None)
+        SQL_ERRORS.inc(operation=statement_operation(context.statement or ""))
@@ -2,67 +2,76 @@
 Supervisor notification system
 """
 import logging
+import time
 from typing import Dict, Any
-from datetime import datetime
+
+from .event_hub import event_hub, REQUEST_CREATED
+from .metrics import registry
+from .notifications import get_dispatcher, Notification, NotificationDispatcher, HELP_REQUEST, REMINDER, TIMEOUT
 
 logger = logging.getLogger(__name__)
 
+NOTIFY_SECONDS = registry.histogram(
+    "supervisor_notify_duration_seconds", "Time notify_supervisor takes to hand off a new help request"
+)
+
 
 class SupervisorNotifier:
-    """Handles notifications to human supervisors"""
+    """Handles notifications to human supervisors
     
-    def __init__(self):
+    Notifications are handed to the dispatcher's queue and delivered in the
+    background, so callers never wait on email, SMS or webhook delivery.
+    """
+
+    def __init__(self, dispatcher: NotificationDispatcher = None):
         self.notification_count = 0
+        self.dispatcher = dispatcher or get_dispatcher()
     
     async def notify_supervisor(self, request_id: int, customer_name: str, question: str):
         """Notify supervisor about a new help request"""
+        start = time.perf_counter()
         try:
             self.notification_count += 1
             
-            # Simulate sending notification to supervisor
-            # In a real implementation, this would send SMS, email, or push notification
+            self.dispatcher.enqueue(Notification(
+                HELP_REQUEST,
+                request_id,
+                customer_name=customer_name,
+                question=question,
+                notification_id=self.notification_count
+            ))
             
-            notification = {
-                "request_id": request_id,
-                "customer_name": customer_name,
-                "question": question,
-                "timestamp": datetime.utcnow(),
-                "notification_id": self.notification_count
-            }
-            
-            # Log the notification (simulating supervisor notification)
-            self._log_supervisor_notification(notification)
+            # Push to dashboards open in this process
+            event_hub.publish(REQUEST_CREATED, request_id=request_id, customer_name=customer_name, question=question)
             
             logger.info(f"Supervisor notified about request #{request_id}")
-            
+        
         except Exception as e:
             logger.error(f"Error notifying supervisor: {e}")
-    
-    def _log_supervisor_notification(self, notification: Dict[str, Any]):
-        """Log supervisor notification (simulating real notification)"""
-        print(f"\n SUPERVISOR NOTIFICATION #{notification['notification_id']}")
-        print(f"   Request ID: {notification['request_id']}")
-        print(f"   Customer: {notification['customer_name']}")
-        print(f"   Question: {notification['question']}")
-        print(f"   Time: {notification['timestamp']}")
-        print(f"   Action: Please check the supervisor UI at /supervisor")
-        print(f"   Status: PENDING\n")
+        
+        finally:
+            NOTIFY_SECONDS.observe(time.perf_counter() - start)
     
     async def send_reminder(self, request_id: int, minutes_remaining: int):
         """Send reminder to supervisor about pending request"""
         try:
-            print(f"\n REMINDER: Request #{request_id} has {minutes_remaining} minutes remaining")
-            print(f"   Please respond soon to avoid timeout\n")
-            
+            self.dispatcher.enqueue(Notification(REMINDER, request_id, minutes_remaining=minutes_remaining))
+        
         except Exception as e:
             logger.error(f"Error sending reminder: {e}")
     
     async def notify_timeout(self, request_id: int):
         """Notify about request timeout"""
         try:
-            print(f"\n TIMEOUT: Request #{request_id} has timed out")
-            print(f"   Customer will be notified that we couldn't get back to them\n")
-            
+            self.dispatcher.enqueue(Notification(TIMEOUT, request_id))
+        
         except Exception as e:
             logger.error(f"Error notifying timeout: {e}")
-
+    
+    async def close(self):
+        """Deliver queued notifications and stop the dispatcher"""
+        await self.dispatcher.stop()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Delivery metrics for monitoring"""
+        return self.dispatcher.stats()
@@ -1,15 +1,27 @@
 """
 Simplified Supervisor UI without LiveKit dependencies
 """
-from fastapi import FastAPI, Request, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Form, Depends, HTTPException, File, UploadFile
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import io
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime, timedelta
 
-from .database import get_db, HelpRequest, KnowledgeEntry, REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED
+from .database import get_db, HelpRequest, KnowledgeEntry, RequestStat, REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED
 from .config import settings
+from .knowledge_base import KnowledgeBase
+from .knowledge_io import detect_format, entry_to_json, read_entries, FORMATS
+from .request_stats import summarize
+from .pagination import clamp_page_size, keyset_page, split_page
+from .event_hub import event_hub, REQUEST_RESOLVED, REQUEST_TIMED_OUT
+from .notifications import get_dispatcher
+from .metrics import registry
+from .timeout_scheduler import TIMEOUTS
+from . import outbox
+from .outbox import add_message, LEARN_KNOWLEDGE, CUSTOMER_FOLLOWUP
 
 # Create FastAPI app for supervisor UI
 app = FastAPI(title="Supervisor Dashboard")
@@ -17,28 +29,37 @@ app = FastAPI(title="Supervisor Dashboard")
 # Templates
 templates = Jinja2Templates(directory="templates")
 
+TIME_TO_RESPOND = registry.histogram(
+    "supervisor_response_seconds", "Time from escalation to the supervisor's answer",
+    buckets=(30, 60, 120, 300, 600, 900, 1200, 1800, 3600, 7200)
+)
+
+
+def get_knowledge_base(request: Request) -> KnowledgeBase:
+    """The application's shared knowledge base, created in the lifespan"""
+    return request.state.knowledge_base
+
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+async def dashboard(request: Request, db: AsyncSession = Depends(get_db)):
     """Main supervisor dashboard"""
     try:
         # Get pending requests
-        pending_requests = db.query(HelpRequest).filter(
+        pending_requests = (await db.execute(select(HelpRequest).where(
             HelpRequest.status == REQUEST_STATUS_PENDING
-        ).order_by(HelpRequest.created_at.desc()).all()
+        ).order_by(HelpRequest.created_at.desc()))).scalars().all()
         
         # Get recent resolved requests
-        resolved_requests = db.query(HelpRequest).filter(
+        resolved_requests = (await db.execute(select(HelpRequest).where(
             HelpRequest.status == REQUEST_STATUS_RESOLVED
-        ).order_by(HelpRequest.resolved_at.desc()).limit(10).all()
+        ).order_by(HelpRequest.resolved_at.desc()).limit(10))).scalars().all()
         
         # Get knowledge entries
-        knowledge_entries = db.query(KnowledgeEntry).filter(
+        knowledge_entries = (await db.execute(select(KnowledgeEntry).where(
             KnowledgeEntry.is_active == True
-        ).order_by(KnowledgeEntry.created_at.desc()).limit(20).all()
+        ).order_by(KnowledgeEntry.created_at.desc()).limit(20))).scalars().all()
         
-        return templates.TemplateResponse("dashboard.html", {
-            "request": request,
+        return templates.TemplateResponse(request, "dashboard.html", {
             "pending_requests": pending_requests,
             "resolved_requests": resolved_requests,
             "knowledge_entries": knowledge_entries,
@@ -49,36 +70,137 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _parse_date(value: Optional[str], name: str) -> Optional[date]:
+    """Parse an optional YYYY-MM-DD query parameter"""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+
+
+def _requests_query(status: Optional[str], phone: Optional[str],
+                    created_from: Optional[str], created_to: Optional[str]):
+    """Select help requests matching the page filters"""
+    query = select(HelpRequest)
+    
+    if status:
+        status = status.upper()
+        if status not in (REQUEST_STATUS_PENDING, REQUEST_STATUS_RESOLVED, REQUEST_STATUS_UNRESOLVED):
+            raise HTTPException(status_code=400, detail=f"Invalid status: {status}")
+        query = query.where(HelpRequest.status == status)
+    if phone:
+        query = query.where(HelpRequest.customer_phone == phone)
+    
+    # Date bounds are inclusive calendar days
+    start = _parse_date(created_from, "created_from")
+    end = _parse_date(created_to, "created_to")
+    if start:
+        query = query.where(HelpRequest.created_at >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.where(HelpRequest.created_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    
+    return query
+
+
+async def _fetch_page(db: AsyncSession, query, model, cursor: Optional[str], limit: int):
+    """Run one keyset page of a query, returning the rows and the next cursor"""
+    try:
+        page_query = keyset_page(query, model, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return split_page((await db.execute(page_query)).scalars().all(), limit)
+
+
+def _request_to_dict(help_request: HelpRequest) -> Dict[str, Any]:
+    return {
+        "id": help_request.id,
+        "customer_phone": help_request.customer_phone,
+        "customer_name": help_request.customer_name,
+        "question": help_request.question,
+        "status": help_request.status,
+        "supervisor_response": help_request.supervisor_response,
+        "created_at": help_request.created_at,
+        "resolved_at": help_request.resolved_at
+    }
+
+
+def _knowledge_to_dict(entry: KnowledgeEntry) -> Dict[str, Any]:
+    return {
+        "id": entry.id,
+        "question": entry.question,
+        "answer": entry.answer,
+        "context": entry.context,
+        "source_request_id": entry.source_request_id,
+        "created_at": entry.created_at
+    }
+
+
 @app.get("/requests", response_class=HTMLResponse)
-async def requests_page(request: Request, db: Session = Depends(get_db)):
-    """Requests management page"""
+async def requests_page(
+    request: Request,
+    status: Optional[str] = None,
+    phone: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Requests management page, one page of requests at a time"""
+    limit = clamp_page_size(limit)
+    query = _requests_query(status, phone, created_from, created_to)
+    requests, next_cursor = await _fetch_page(db, query, HelpRequest, cursor, limit)
+    
     try:
-        # Get all requests
-        all_requests = db.query(HelpRequest).order_by(
-            HelpRequest.created_at.desc()
-        ).all()
-        
-        return templates.TemplateResponse("requests.html", {
-            "request": request,
-            "requests": all_requests
+        return templates.TemplateResponse(request, "requests.html", {
+            "requests": requests,
+            "filters": {
+                "status": (status or "").upper(),
+                "phone": phone or "",
+                "created_from": created_from or "",
+                "created_to": created_to or ""
+            },
+            "is_first_page": not cursor,
+            "first_url": request.url.remove_query_params("cursor"),
+            "next_url": request.url.include_query_params(cursor=next_cursor) if next_cursor else None
         })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/requests")
+async def list_requests(
+    status: Optional[str] = None,
+    phone: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Page through help requests, newest first"""
+    limit = clamp_page_size(limit)
+    query = _requests_query(status, phone, created_from, created_to)
+    requests, next_cursor = await _fetch_page(db, query, HelpRequest, cursor, limit)
+    return {
+        "requests": [_request_to_dict(help_request) for help_request in requests],
+        "next_cursor": next_cursor
+    }
+
+
 @app.post("/respond/{request_id}")
 async def respond_to_request(
     request_id: int,
     response: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Handle supervisor response to a help request"""
     try:
         # Get the help request
-        help_request = db.query(HelpRequest).filter(
-            HelpRequest.id == request_id
-        ).first()
+        help_request = await db.get(HelpRequest, request_id)
         
         if not help_request:
             raise HTTPException(status_code=404, detail="Request not found")
@@ -86,140 +208,242 @@ async def respond_to_request(
         if help_request.status != REQUEST_STATUS_PENDING:
             raise HTTPException(status_code=400, detail="Request already processed")
         
-        # Update request status
+        # Update request status; learning the answer and calling the customer
+        # back are recorded in the same commit and run by the outbox dispatcher
         help_request.status = REQUEST_STATUS_RESOLVED
         help_request.supervisor_response = response
         help_request.resolved_at = datetime.utcnow()
-        db.commit()
-        
-        # Add to knowledge base
-        from .knowledge_base import KnowledgeBase
-        kb = KnowledgeBase()
-        await kb.add_knowledge(
+        add_message(
+            db, LEARN_KNOWLEDGE,
+            request_id=request_id,
             question=help_request.question,
             answer=response,
-            context=f"Learned from supervisor response to request #{request_id}",
-            source_request_id=request_id
+            context=f"Learned from supervisor response to request #{request_id}"
         )
-        
-        # Notify customer (simulate)
-        print(f"\n📱 CUSTOMER NOTIFICATION:")
-        print(f"   To: {help_request.customer_phone}")
-        print(f"   Message: {response}")
-        print(f"   Time: {datetime.utcnow()}\n")
+        add_message(
+            db, CUSTOMER_FOLLOWUP,
+            request_id=request_id,
+            customer_phone=help_request.customer_phone,
+            message=response,
+            relay_to_call=True
+        )
+        await db.commit()
+        outbox.wake()
+        event_hub.publish(REQUEST_RESOLVED, request_id=request_id, response=response)
+        if help_request.created_at:
+            TIME_TO_RESPOND.observe((help_request.resolved_at - help_request.created_at).total_seconds())
         
         return {"status": "success", "message": "Response submitted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/timeout/{request_id}")
 async def timeout_request(
     request_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Mark request as unresolved due to timeout"""
     try:
         # Get the help request
-        help_request = db.query(HelpRequest).filter(
-            HelpRequest.id == request_id
-        ).first()
+        help_request = await db.get(HelpRequest, request_id)
         
         if not help_request:
             raise HTTPException(status_code=404, detail="Request not found")
         
-        # Update request status
+        # A resolved request must not be reopened, nor its customer told we have no answer
+        if help_request.status != REQUEST_STATUS_PENDING:
+            raise HTTPException(status_code=400, detail="Request already processed")
+        
+        # Update request status; the customer is told through the outbox follow-up
         help_request.status = REQUEST_STATUS_UNRESOLVED
         help_request.resolved_at = datetime.utcnow()
-        db.commit()
-        
-        # Notify customer about timeout
-        print(f"\n TIMEOUT NOTIFICATION:")
-        print(f"   Request #{request_id} timed out")
-        print(f"   Customer: {help_request.customer_name} ({help_request.customer_phone})")
-        print(f"   Question: {help_request.question}\n")
+        message = outbox.timeout_message()
+        add_message(
+            db, CUSTOMER_FOLLOWUP,
+            request_id=request_id,
+            customer_phone=help_request.customer_phone,
+            message=message,
+            relay_to_call=True,
+            timed_out=True
+        )
+        await db.commit()
+        outbox.wake()
+        event_hub.publish(REQUEST_TIMED_OUT, request_id=request_id, message=message)
+        TIMEOUTS.inc(source="manual")
         
         return {"status": "success", "message": "Request marked as unresolved"}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/knowledge", response_class=HTMLResponse)
-async def knowledge_page(request: Request, db: Session = Depends(get_db)):
-    """Knowledge base management page"""
+async def knowledge_page(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Knowledge base management page, one page of entries at a time"""
+    limit = clamp_page_size(limit)
+    query = select(KnowledgeEntry).where(KnowledgeEntry.is_active == True)
+    knowledge_entries, next_cursor = await _fetch_page(db, query, KnowledgeEntry, cursor, limit)
+    
     try:
-        # Get all knowledge entries
-        knowledge_entries = db.query(KnowledgeEntry).filter(
-            KnowledgeEntry.is_active == True
-        ).order_by(KnowledgeEntry.created_at.desc()).all()
-        
-        return templates.TemplateResponse("knowledge.html", {
-            "request": request,
-            "knowledge_entries": knowledge_entries
+        return templates.TemplateResponse(request, "knowledge.html", {
+            "knowledge_entries": knowledge_entries,
+            "is_first_page": not cursor,
+            "first_url": request.url.remove_query_params("cursor"),
+            "next_url": request.url.include_query_params(cursor=next_cursor) if next_cursor else None
         })
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/knowledge")
+async def list_knowledge(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Page through active knowledge entries, newest first"""
+    limit = clamp_page_size(limit)
+    query = select(KnowledgeEntry).where(KnowledgeEntry.is_active == True)
+    knowledge_entries, next_cursor = await _fetch_page(db, query, KnowledgeEntry, cursor, limit)
+    return {
+        "knowledge": [_knowledge_to_dict(entry) for entry in knowledge_entries],
+        "next_cursor": next_cursor
+    }
+
+
 @app.post("/knowledge/{knowledge_id}/deactivate")
 async def deactivate_knowledge(
     knowledge_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    knowledge_base: KnowledgeBase = Depends(get_knowledge_base)
 ):
     """Deactivate a knowledge entry"""
     try:
         # Get the knowledge entry
-        entry = db.query(KnowledgeEntry).filter(
-            KnowledgeEntry.id == knowledge_id
-        ).first()
+        entry = await db.get(KnowledgeEntry, knowledge_id)
         
         if not entry:
             raise HTTPException(status_code=404, detail="Knowledge entry not found")
         
         # Deactivate entry
         entry.is_active = False
-        db.commit()
+        await db.commit()
+        knowledge_base.discard(knowledge_id)
         
         return {"status": "success", "message": "Knowledge entry deactivated"}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    """Get system statistics"""
+@app.post("/api/knowledge/import")
+async def import_knowledge(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    knowledge_base: KnowledgeBase = Depends(get_knowledge_base)
+):
+    """Bulk import knowledge entries from a JSONL or CSV upload"""
+    fmt = format or detect_format(file.filename)
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    
     try:
-        # Count requests by status
-        pending_count = db.query(HelpRequest).filter(
-            HelpRequest.status == REQUEST_STATUS_PENDING
-        ).count()
+        lines = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+        counts = await knowledge_base.bulk_import(read_entries(lines, fmt))
+        return {"status": "success", **counts}
         
-        resolved_count = db.query(HelpRequest).filter(
-            HelpRequest.status == REQUEST_STATUS_RESOLVED
-        ).count()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/knowledge/export")
+async def export_knowledge(
+    include_inactive: bool = False,
+    knowledge_base: KnowledgeBase = Depends(get_knowledge_base)
+):
+    """Stream knowledge entries as JSONL"""
+    async def lines():
+        async for entry in knowledge_base.export_knowledge(include_inactive):
+            yield entry_to_json(entry)
+    
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=knowledge.jsonl"}
+    )
+
+
+@app.get("/api/knowledge/search")
+async def search_knowledge(
+    q: str,
+    limit: Optional[int] = None,
+    min_score: Optional[float] = None,
+    knowledge_base: KnowledgeBase = Depends(get_knowledge_base)
+):
+    """Rank knowledge entries against a question"""
+    try:
+        results = await knowledge_base.search(q, top_k=limit, min_score=min_score)
+        return {"query": q, "results": results}
         
-        unresolved_count = db.query(HelpRequest).filter(
-            HelpRequest.status == REQUEST_STATUS_UNRESOLVED
-        ).count()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/events")
+async def stream_events():
+    """Server-Sent Events stream of request and knowledge changes for dashboards"""
+    return StreamingResponse(
+        event_hub.stream(event_hub.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/notifications/stats")
+async def get_notification_stats():
+    """Supervisor notification delivery, retry, drop and latency metrics"""
+    return get_dispatcher().stats()
+
+
+@app.get("/api/stats")
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    """Get system statistics"""
+    try:
+        # Request counts and latency histograms are maintained counters, so
+        # reading them does not depend on how much history there is
+        stats = summarize((await db.execute(select(RequestStat))).scalars())
+        statuses = stats["statuses"]
+        pending_count = statuses.get(REQUEST_STATUS_PENDING, 0)
+        resolved_count = statuses.get(REQUEST_STATUS_RESOLVED, 0)
+        unresolved_count = statuses.get(REQUEST_STATUS_UNRESOLVED, 0)
         
         # Count knowledge entries
-        knowledge_count = db.query(KnowledgeEntry).filter(
+        knowledge_count = await db.scalar(select(func.count()).select_from(KnowledgeEntry).where(
             KnowledgeEntry.is_active == True
-        ).count()
+        ))
         
         return {
             "pending_requests": pending_count,
             "resolved_requests": resolved_count,
             "unresolved_requests": unresolved_count,
             "knowledge_entries": knowledge_count,
-            "total_requests": pending_count + resolved_count + unresolved_count
+            "total_requests": pending_count + resolved_count + unresolved_count,
+            "resolution_time_seconds": stats["resolution_time_seconds"]
         }
         
     except Exception as e:
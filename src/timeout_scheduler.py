@@ -0,0 +1,249 @@
+"""
+In-process scheduler for help request reminders and timeouts
+
+Pending deadlines are kept in a min-heap and the scheduler sleeps until the
+earliest one is due. Due timeouts are expired with a single guarded UPDATE,
+so requests answered in the meantime are left alone. The heap is rebuilt from
+the pending requests on startup; requests created later, including by other
+processes, are picked up by scanning pending requests by created_at. Scans
+overlap, so a request committed well after its created_at (or a lower id
+committed after a higher one) is still found; ones already scheduled are
+skipped.
+"""
+import asyncio
+import heapq
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import select, update
+
+from .config import settings
+from .database import (
+    get_db_session, HelpRequest,
+    REQUEST_STATUS_PENDING, REQUEST_STATUS_UNRESOLVED,
+)
+from .event_hub import event_hub, REQUEST_CREATED, REQUEST_TIMED_OUT
+from .metrics import registry
+from . import outbox
+from .request_stats import apply_stat_deltas, transition_deltas
+from .supervisor_notifier import SupervisorNotifier
+
+logger = logging.getLogger(__name__)
+
+REMINDER = "reminder"
+TIMEOUT = "timeout"
+
+# Deadlines this close together are handled in the same batch
+BATCH_WINDOW = timedelta(seconds=1)
+# Upper bound on ids per UPDATE ... WHERE id IN (...)
+MAX_BATCH_SIZE = 500
+# Each scan re-reads requests created this long before the previous one, for slow commits and clock skew
+SCAN_OVERLAP = timedelta(seconds=30)
+
+# Counted here because the scheduler sees requests escalated by every process
+ESCALATIONS = registry.counter("escalations_total", "Help requests escalated to a supervisor")
+TIMEOUTS = registry.counter("request_timeouts_total", "Help requests that timed out unanswered", ("source",))
+
+
+class TimeoutScheduler:
+    """Fires supervisor reminders and expires pending requests at their deadline"""
+
+    def __init__(self, notifier: SupervisorNotifier = None, reminder_minutes: List[int] = None,
+                 scan_seconds: float = None):
+        self.notifier = notifier or SupervisorNotifier()
+        self.reminder_minutes = sorted(
+            settings.REQUEST_REMINDER_MINUTES if reminder_minutes is None else reminder_minutes,
+            reverse=True
+        )
+        self.scan_seconds = settings.REQUEST_SCAN_SECONDS if scan_seconds is None else scan_seconds
+        self.expired_count = 0
+        self.reminder_count = 0
+        # (due_at, kind, request_id, minutes_remaining)
+        self._heap: List[Tuple[datetime, str, int, int]] = []
+        self._scheduled: Set[int] = set()
+        self._scanned_through: Optional[datetime] = None  # created_at covered by the last scan
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    async def start(self):
+        """Rebuild the heap from the database and start the scheduler loop"""
+        await self.rebuild()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Timeout scheduler started with {len(self)} pending requests")
+
+    async def stop(self):
+        """Stop the scheduler loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def rebuild(self):
+        """Load the deadlines of every pending request"""
+        self._heap.clear()
+        self._scheduled.clear()
+        self._scanned_through = datetime.utcnow()
+        async with get_db_session() as db:
+            result = await db.execute(select(
+                HelpRequest.id, HelpRequest.created_at, HelpRequest.timeout_at
+            ).where(HelpRequest.status == REQUEST_STATUS_PENDING))
+            for row in result:
+                self.schedule(row.id, self._deadline(row.created_at, row.timeout_at))
+
+    def schedule(self, request_id: int, timeout_at: datetime):
+        """Add a pending request's timeout and any reminders still ahead of now"""
+        if request_id in self._scheduled:
+            return
+        self._scheduled.add(request_id)
+
+        now = datetime.utcnow()
+        for minutes in self.reminder_minutes:
+            remind_at = timeout_at - timedelta(minutes=minutes)
+            if remind_at > now:
+                heapq.heappush(self._heap, (remind_at, REMINDER, request_id, minutes))
+        heapq.heappush(self._heap, (timeout_at, TIMEOUT, request_id, 0))
+        self._wakeup.set()
+
+    def _deadline(self, created_at: Optional[datetime], timeout_at: Optional[datetime]) -> datetime:
+        if timeout_at:
+            return timeout_at
+        return (created_at or datetime.utcnow()) + timedelta(minutes=settings.REQUEST_TIMEOUT_MINUTES)
+
+    async def _run(self):
+        next_scan = datetime.utcnow() + timedelta(seconds=self.scan_seconds)
+        while True:
+            try:
+                now = datetime.utcnow()
+                if now >= next_scan:
+                    await self._scan_new_requests()
+                    next_scan = now + timedelta(seconds=self.scan_seconds)
+
+                wake_at = next_scan
+                if self._heap and self._heap[0][0] < wake_at:
+                    wake_at = self._heap[0][0]
+                delay = (wake_at - datetime.utcnow()).total_seconds()
+                if delay > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+
+                await self._fire_due()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in timeout scheduler: {e}")
+                await asyncio.sleep(1)
+
+    async def _scan_new_requests(self):
+        """Schedule requests created since the last scan and announce them to dashboards"""
+        started = datetime.utcnow()
+        since = (self._scanned_through or started) - SCAN_OVERLAP
+        async with get_db_session() as db:
+            result = await db.execute(select(
+                HelpRequest.id, HelpRequest.customer_name, HelpRequest.question,
+                HelpRequest.created_at, HelpRequest.timeout_at
+            ).where(
+                HelpRequest.status == REQUEST_STATUS_PENDING,
+                HelpRequest.created_at >= since
+            ).order_by(HelpRequest.created_at, HelpRequest.id))
+            for row in result:
+                # Rows re-read because of the overlap are already scheduled
+                if row.id in self._scheduled:
+                    continue
+                ESCALATIONS.inc()
+                self.schedule(row.id, self._deadline(row.created_at, row.timeout_at))
+                # Requests escalated by the voice agent process are only seen here
+                event_hub.publish(
+                    REQUEST_CREATED, request_id=row.id, customer_name=row.customer_name, question=row.question
+                )
+        self._scanned_through = started
+
+    async def _fire_due(self):
+        """Pop everything due and handle it in batches"""
+        cutoff = datetime.utcnow() + BATCH_WINDOW
+        reminders, timeouts = [], []
+        while self._heap and self._heap[0][0] <= cutoff:
+            _, kind, request_id, minutes = heapq.heappop(self._heap)
+            if kind == TIMEOUT:
+                self._scheduled.discard(request_id)
+                timeouts.append(request_id)
+            elif request_id in self._scheduled:
+                reminders.append((request_id, minutes))
+
+        if reminders:
+            await self._send_reminders(reminders)
+        for start in range(0, len(timeouts), MAX_BATCH_SIZE):
+            await self.expire(timeouts[start:start + MAX_BATCH_SIZE])
+
+    async def _send_reminders(self, reminders: List[Tuple[int, int]]):
+        """Remind the supervisor about requests that are still pending"""
+        async with get_db_session() as db:
+            result = await db.execute(select(HelpRequest.id).where(
+                HelpRequest.id.in_({request_id for request_id, _ in reminders}),
+                HelpRequest.status == REQUEST_STATUS_PENDING
+            ))
+            pending = set(result.scalars())
+
+        for request_id, minutes in reminders:
+            if request_id in pending:
+                self.reminder_count += 1
+                await self.notifier.send_reminder(request_id, minutes)
+
+    async def expire(self, request_ids: List[int]) -> List[int]:
+        """Mark the still-pending requests among request_ids unresolved"""
+        if not request_ids:
+            return []
+
+        now = datetime.utcnow()
+        message = outbox.timeout_message()
+        async with get_db_session() as db:
+            result = await db.execute(
+                update(HelpRequest).where(
+                    HelpRequest.id.in_(request_ids),
+                    HelpRequest.status == REQUEST_STATUS_PENDING
+                ).values(
+                    status=REQUEST_STATUS_UNRESOLVED,
+                    resolved_at=now
+                ).returning(
+                    HelpRequest.id, HelpRequest.created_at, HelpRequest.customer_phone
+                ).execution_options(synchronize_session=False)
+            )
+            expired = result.all()
+
+            # Bulk UPDATEs bypass the flush listener that maintains request stats
+            deltas = Counter()
+            for request_id, created_at, customer_phone in expired:
+                deltas.update(transition_deltas(REQUEST_STATUS_PENDING, REQUEST_STATUS_UNRESOLVED, created_at, now))
+                outbox.add_message(
+                    db, outbox.CUSTOMER_FOLLOWUP,
+                    request_id=request_id,
+                    customer_phone=customer_phone,
+                    message=message,
+                    relay_to_call=True,
+                    timed_out=True
+                )
+            if deltas:
+                await db.run_sync(lambda session: apply_stat_deltas(session.connection(), deltas))
+            await db.commit()
+
+        expired_ids = [request_id for request_id, _, _ in expired]
+        self.expired_count += len(expired_ids)
+        TIMEOUTS.inc(len(expired_ids), source="scheduler")
+        for request_id in expired_ids:
+            event_hub.publish(REQUEST_TIMED_OUT, request_id=request_id, message=message)
+            await self.notifier.notify_timeout(request_id)
+        if expired_ids:
+            outbox.wake()
+            logger.info(f"Timed out {len(expired_ids)} pending requests")
+        return expired_ids
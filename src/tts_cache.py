@@ -0,0 +1,336 @@
+"""
+Content-addressed cache of synthesized speech on local disk
+
+Audio is keyed by a hash of the text, voice and language, so the same
+knowledge base answer is synthesized once and replayed on every call that
+needs it; an entry whose answer changes simply gets a new key, and the old
+audio ages out. Files are raw 16-bit PCM, evicted least recently used once
+the directory grows past its size limit, and played back as slices of a
+memory-mapped file so cached audio is never copied into memory whole.
+"""
+import abc
+import asyncio
+import hashlib
+import logging
+import math
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_LOOKUPS = registry.counter(
+    "tts_cache_lookups_total", "Speech synthesis requests by cache result (hit/miss)", ("result",)
+)
+TTS_CACHE_BYTES = registry.gauge("tts_cache_bytes", "Size of the cached audio on disk")
+TTS_CACHE_EVICTIONS = registry.counter("tts_cache_evictions_total", "Cached audio files evicted to stay under the size limit")
+TTS_FIRST_CHUNK_SECONDS = registry.histogram(
+    "tts_first_chunk_seconds", "Time from a speech request to its first audio chunk", ("result",)
+)
+
+SAMPLE_WIDTH = 2  # bytes per 16-bit sample
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def audio_key(text: str, voice: str, language: str) -> str:
+    """Cache key for speaking text in a voice and language"""
+    return hashlib.sha256(f"{voice}\0{language}\0{text}".encode("utf-8")).hexdigest()
+
+
+def speech_segments(text: str, min_length: int = 20) -> List[str]:
+    """Split text into sentences the way the voice assistant sends it to TTS
+
+    Sentences shorter than min_length are joined to the next one, so cached
+    audio is keyed by what actually gets synthesized.
+    """
+    segments, pending = [], ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        pending = f"{pending} {sentence}" if pending else sentence
+        if len(pending) >= min_length:
+            segments.append(pending)
+            pending = ""
+    if pending:
+        segments.append(pending)
+    return segments
+
+
+class TTSProvider(abc.ABC):
+    """Speech synthesis backend returning mono 16-bit PCM at sample_rate"""
+
+    name = "provider"
+
+    def __init__(self, voice: str = "alloy", language: str = "en", sample_rate: int = 24000):
+        self.voice = voice
+        self.language = language
+        self.sample_rate = sample_rate
+
+    @abc.abstractmethod
+    async def synthesize(self, text: str) -> bytes:
+        """Audio for text"""
+
+
+class OpenAITTS(TTSProvider):
+    """OpenAI text to speech, requested as raw 24kHz PCM"""
+
+    name = "openai"
+
+    def __init__(self, voice: str = "alloy", language: str = "en", model: str = "tts-1"):
+        from openai import AsyncOpenAI
+
+        super().__init__(voice, language, 24000)
+        self.model = model
+        self.client = AsyncOpenAI()
+
+    async def synthesize(self, text: str) -> bytes:
+        response = await self.client.audio.speech.create(
+            model=self.model, voice=self.voice, input=text, response_format="pcm"
+        )
+        return response.content
+
+
+class StubTTS(TTSProvider):
+    """Local stand-in for a real TTS service, for tests and benchmarks
+
+    Produces a short tone per word after a simulated request latency, so the
+    audio is deterministic and its length follows the text.
+    """
+
+    name = "stub"
+
+    def __init__(self, voice: str = "alloy", language: str = "en", sample_rate: int = 24000,
+                 latency: float = 0.0, word_seconds: float = 0.05):
+        super().__init__(voice, language, sample_rate)
+        self.latency = latency
+        self.word_seconds = word_seconds
+        self.calls = 0
+
+    async def synthesize(self, text: str) -> bytes:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        samples = int(self.sample_rate * self.word_seconds)
+        audio = array("h")
+        for word in text.split():
+            step = 2 * math.pi * (200 + sum(word.encode("utf-8")) % 600) / self.sample_rate
+            audio.extend(int(8000 * math.sin(step * n)) for n in range(samples))
+        return audio.tobytes()
+
+
+class AudioCache:
+    """Directory of cached audio files, bounded to max_bytes by LRU eviction
+
+    Recency survives restarts through file modification times, which are
+    bumped on every hit. Several processes may share the directory, so it is
+    rescanned before anything is evicted, and at least every rescan_seconds
+    to count what the others wrote; within a process, calls on different
+    threads share the index under a lock.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, rescan_seconds: float = 30.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.size = 0
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # key -> bytes, least recent first
+        self._loaded = False
+        self._scanned_at = 0.0
+        self._lock = threading.RLock()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._load()
+            return key in self._files
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._files)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def open(self, key: str) -> Optional[mmap.mmap]:
+        """Memory-map the cached audio for key, or None if it is not cached"""
+        if key not in self:
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                audio = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(self.path(key))
+        except (OSError, ValueError):
+            # Removed behind our back (or empty); treat as a miss
+            with self._lock:
+                self._forget(key)
+            return None
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        """Store audio for key, then evict the least recently used files over the limit"""
+        if self.write(key, audio):
+            self.add(key, len(audio))
+
+    def write(self, key: str, audio: bytes) -> bool:
+        """Write the file for key without touching the index; safe to run in a thread"""
+        if not audio or len(audio) > self.max_bytes:
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name so readers never map a partial file
+        temporary = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(audio)
+        os.replace(temporary, self.path(key))
+        return True
+
+    def add(self, key: str, size: int):
+        """Index a written file as most recently used and evict over the limit"""
+        with self._lock:
+            self._load()
+            self._forget(key)
+            self._files[key] = size
+            self.size += size
+            if self.size > self.max_bytes or time.monotonic() - self._scanned_at >= self.rescan_seconds:
+                # Picks up files other processes wrote or evicted, so the limit holds for the directory
+                self._scan()
+                if key in self._files:
+                    self._files.move_to_end(key)
+            while self.size > self.max_bytes:
+                oldest = next(iter(self._files))
+                self._forget(oldest)
+                try:
+                    os.remove(self.path(oldest))
+                except FileNotFoundError:
+                    pass
+                TTS_CACHE_EVICTIONS.inc()
+            TTS_CACHE_BYTES.set(self.size)
+
+    def _forget(self, key: str):
+        size = self._files.pop(key, None)
+        if size is not None:
+            self.size -= size
+
+    def _load(self):
+        """Index files already on disk, the first time the cache is used"""
+        if self._loaded:
+            return
+        self._scan()
+        if self._files:
+            logger.info(f"TTS cache has {len(self._files)} files ({self.size / 1e6:.1f} MB) in {self.directory}")
+
+    def _scan(self):
+        """Rebuild the index from the files on disk, oldest first"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pcm"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process mid-scan
+                    continue
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._files.clear()
+        self.size = 0
+        for _, key, size in sorted(files):
+            self._files[key] = size
+            self.size += size
+        self._loaded = True
+        self._scanned_at = time.monotonic()
+        TTS_CACHE_BYTES.set(self.size)
+
+
+class CachedTTS:
+    """Speaks text through a TTS provider, synthesizing each distinct text once"""
+
+    def __init__(self, provider: TTSProvider, cache: AudioCache, chunk_ms: int = 20):
+        self.provider = provider
+        self.cache = cache
+        self.chunk_bytes = provider.sample_rate * SAMPLE_WIDTH * chunk_ms // 1000
+        # Renders in progress by loop and key, so calls asking for the same text share one request
+        self._rendering: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+
+    def key(self, text: str) -> str:
+        return audio_key(text, self.provider.voice, self.provider.language)
+
+    async def stream(self, text: str) -> AsyncIterator[bytes]:
+        """Audio for text in chunk_ms slices, read from the memory-mapped cache file"""
+        start = time.perf_counter()
+        key = self.key(text)
+        audio = self.cache.open(key)
+        result = "hit" if audio is not None else "miss"
+        TTS_CACHE_LOOKUPS.inc(result=result)
+        if audio is None:
+            rendered = await self._render(key, text)
+            audio = self.cache.open(key)
+            if audio is None:
+                # Served from memory when the cache could not keep it
+                audio = rendered
+
+        try:
+            # Each slice copies one chunk out of the mapping, so only pages being played are read
+            for offset in range(0, len(audio), self.chunk_bytes):
+                if offset == 0:
+                    TTS_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - start, result=result)
+                yield audio[offset:offset + self.chunk_bytes]
+                await asyncio.sleep(0)
+        finally:
+            if isinstance(audio, mmap.mmap):
+                audio.close()
+
+    async def prewarm(self, texts: Iterable[str], concurrency: int = 4) -> int:
+        """Synthesize every sentence of texts not already cached; returns how many were rendered"""
+        missing = {self.key(segment): segment for text in texts for segment in speech_segments(text)}
+        missing = {key: text for key, text in missing.items() if key not in self.cache}
+        slots = asyncio.Semaphore(concurrency)
+
+        async def render(key: str, text: str):
+            async with slots:
+                await self._render(key, text)
+
+        await asyncio.gather(*(render(key, text) for key, text in missing.items()))
+        return len(missing)
+
+    async def _render(self, key: str, text: str) -> bytes:
+        # A task can only be awaited on its own loop, and LiveKit gives each call one
+        rendering = (asyncio.get_running_loop(), key)
+        task = self._rendering.get(rendering)
+        if task is None:
+            task = self._rendering[rendering] = asyncio.create_task(self._synthesize(key, text))
+            task.add_done_callback(lambda _: self._rendering.pop(rendering, None))
+        return await asyncio.shield(task)
+
+    async def _synthesize(self, key: str, text: str) -> bytes:
+        audio = await self.provider.synthesize(text)
+        if await asyncio.to_thread(self.cache.write, key, audio):
+            self.cache.add(key, len(audio))
+        return audio
+
+
+def create_tts_provider(provider: str = "openai", voice: str = "alloy", language: str = "en") -> TTSProvider:
+    """Create a TTS provider ("openai" or "stub")
+
+    The stub only plays tones, so it is never substituted for a provider
+    that is misspelled or not installed; it has to be asked for by name.
+    """
+    if provider == "openai":
+        return OpenAITTS(voice, language)
+    if provider == "stub":
+        return StubTTS(voice, language)
+    raise ValueError(f"Unknown TTS provider: {provider}")
+
+
+def create_tts_cache(provider: TTSProvider, directory: str, max_mb: float) -> Optional[CachedTTS]:
+    """Cached TTS for provider, or None when no cache directory is configured"""
+    if not directory:
+        return None
+    # One directory per provider, since voices are only unique within a provider
+    return CachedTTS(provider, AudioCache(os.path.join(directory, provider.name), int(max_mb * 1024 * 1024)))
@@ -1,47 +1,76 @@
 """
 Voice AI Agent for LiveKit integration
 Handles voice calls and escalates to human supervisors when needed
+
+The worker runs many calls in one process: LiveKit's thread executor gives
+each call (job) a thread and event loop of its own, and every call shares
+the one SalonVoiceAgent, up to VOICE_MAX_CONCURRENT_CALLS at once. Nothing
+about a single call is kept on the agent: it lives in that call's
+CallSession, while the knowledge base, TTS audio cache and notifier are
+shared, and each call's loop opens its own database connections. What
+outlives a call (following the supervisor event stream for answers, and
+delivering notifications) runs on a services thread started by
+prewarm_process. A SalonVoiceAgent can equally run many calls on one event
+loop, as the load test and demos do. A call's loop sleeps on the session's
+event queue, so it reacts to speech and knowledge base misses immediately and
+costs nothing while idle. After an escalation the caller stays on hold and
+hears the supervisor's answer as soon as it is relayed, or is told if the
+request times out first.
+
+The knowledge base answers first: with a streaming STT, lookups start on
+interim transcripts while the caller is still talking, and a match scoring
+at least VOICE_FAST_PATH_SCORE goes straight to TTS without an LLM round
+trip. Weaker matches are left to the LLM, which can call the knowledge base
+as a tool.
+Speech is synthesized through the shared TTS audio cache, so answers the
+salon gives on every call are rendered once and played from disk.
 """
 
 import asyncio
+import itertools
 import logging
-from typing import Optional
-from livekit import rtc
-from livekit.agents import AutoSubscribe, JobContext, WorkerOptions, cli
-from livekit.agents.voice_assistant import VoiceAssistant, VoiceAssistantOptions
-from livekit.plugins import openai
+import threading
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
 
+from .answer_relay import answer_relay
 from .config import settings
-from .database import get_db_session, HelpRequest
+from .database import get_db_session, own_engine, HelpRequest, REQUEST_STATUS_PENDING
 from .knowledge_base import KnowledgeBase
+from .knowledge_index import normalize_question
+from .metrics import registry
+from .outbox import timeout_message
 from .supervisor_notifier import SupervisorNotifier
-from .supervisor_ui_simple import app as supervisor_app
+from .tts_cache import SAMPLE_WIDTH, CachedTTS, create_tts_cache, create_tts_provider
+
+if TYPE_CHECKING:
+    from livekit.agents import JobContext, JobProcess
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class SalonVoiceAgent:
-    """Voice AI agent for salon customer service"""
-    
-    def __init__(self):
-        self.knowledge_base = KnowledgeBase()
-        self.supervisor_notifier = SupervisorNotifier()
-        self.current_request: Optional[HelpRequest] = None
-        
-    async def handle_voice_call(self, ctx: JobContext):
-        """Handle incoming voice calls"""
-        logger.info("Voice call started")
-        
-        # Wait for participant to join
-        await ctx.wait_for_participant_connected()
-        participant = ctx.room.remote_participants[0]
-        logger.info(f"Participant connected: {participant.identity}")
-        
-        # Create voice assistant
-        assistant = VoiceAssistant(
-            options=VoiceAssistantOptions(
-                instructions=f"""
+KB_ANSWERS = registry.counter(
+    "voice_kb_answers_total", "Caller questions answered from the knowledge base without the LLM (fast path)",
+    ("prefetched",)
+)
+
+# Interim lookups kept per call; older ones are dropped as the caller keeps talking
+MAX_PREFETCHES = 8
+
+# The assistant is told to say this when it has to hand a question to a person
+ESCALATION_PHRASE = "connect you with a human supervisor"
+
+# Call events, queued on the session by assistant and room callbacks
+USER_SPEECH = "user_speech"
+AGENT_SPEECH = "agent_speech"
+KB_MISS = "kb_miss"
+SUPERVISOR_ANSWER = "supervisor_answer"
+SUPERVISOR_TIMEOUT = "supervisor_timeout"
+HANG_UP = "hang_up"
+
+INSTRUCTIONS = f"""
                 You are a helpful AI assistant for {settings.SALON_NAME}.
                 You can help customers with:
                 - Business hours: {settings.SALON_HOURS}
@@ -49,80 +78,526 @@ class SalonVoiceAgent:
                 - Address: {settings.SALON_ADDRESS}
                 - Services and pricing
                 - Appointments and walk-ins
-                
+
+                Before saying you don't know, call lookup_knowledge with the
+                customer's question and use its answer if it has one.
                 If you don't know the answer to a question, say:
-                "I don't have that information right now. Let me connect you with a human supervisor who can help you better."
-                """,
-                voice="alloy",  # OpenAI voice
-                language="en",
+                "I don't have that information right now. Let me {ESCALATION_PHRASE} who can help you better."
+                """
+
+
+def create_livekit_tts(cached: CachedTTS):
+    """LiveKit TTS that plays speech from the audio cache, synthesizing on a miss"""
+    from livekit import rtc
+    from livekit.agents import tts, utils
+
+    class CachedStream(tts.ChunkedStream):
+        def __init__(self, text: str):
+            super().__init__()
+            self._text = text
+
+        async def _main_task(self):
+            request_id = utils.shortuuid()
+            async for chunk in cached.stream(self._text):
+                self._event_ch.send_nowait(tts.SynthesizedAudio(
+                    request_id=request_id,
+                    segment_id=request_id,
+                    frame=rtc.AudioFrame(
+                        data=chunk,
+                        sample_rate=cached.provider.sample_rate,
+                        num_channels=1,
+                        samples_per_channel=len(chunk) // SAMPLE_WIDTH,
+                    ),
+                ))
+
+    class CachedTTSAdapter(tts.TTS):
+        def __init__(self):
+            # Not streaming, so the assistant splits speech into sentences first
+            super().__init__(
+                capabilities=tts.TTSCapabilities(streaming=False),
+                sample_rate=cached.provider.sample_rate,
+                num_channels=1,
             )
+
+        def synthesize(self, text: str) -> CachedStream:
+            return CachedStream(text)
+
+    return CachedTTSAdapter()
+
+
+def create_livekit_stt(on_interim: Callable[[str], None]):
+    """LiveKit STT for one call, reporting interim transcripts to on_interim
+    
+    VoiceAssistant reads interim results internally and never emits them, so
+    the speech stream it reads is wrapped instead. Only providers that stream
+    interim results (STT_PROVIDER=deepgram) are wrapped; with OpenAI's Whisper
+    the transcript arrives once speech ends and the lookup starts then.
+    """
+    from livekit.agents import stt
+    
+    if settings.STT_PROVIDER == "deepgram":
+        from livekit.plugins import deepgram
+        provider = deepgram.STT(interim_results=True)
+    else:
+        from livekit.plugins import openai
+        provider = openai.STT()
+    if not provider.capabilities.interim_results:
+        return provider
+    
+    class InterimStream:
+        """The provider's speech stream, reporting interim transcripts as they pass"""
+        
+        def __init__(self, stream):
+            self._stream = stream
+        
+        def __getattr__(self, name):
+            # push_frame, flush, end_input and aclose go straight to the provider
+            return getattr(self._stream, name)
+        
+        def __aiter__(self):
+            return self
+        
+        async def __anext__(self):
+            event = await self._stream.__anext__()
+            if event.type == stt.SpeechEventType.INTERIM_TRANSCRIPT and event.alternatives:
+                on_interim(event.alternatives[0].text)
+            return event
+    
+    class InterimTranscriptsSTT(stt.STT):
+        def __init__(self):
+            super().__init__(capabilities=provider.capabilities)
+        
+        async def recognize(self, *args, **kwargs):
+            return await provider.recognize(*args, **kwargs)
+        
+        def stream(self, *args, **kwargs) -> InterimStream:
+            return InterimStream(provider.stream(*args, **kwargs))
+    
+    return InterimTranscriptsSTT()
+
+
+def create_voice_assistant(agent: "SalonVoiceAgent", session: "CallSession"):
+    """Create the LiveKit voice assistant for one call, with the knowledge base as a tool"""
+    from typing import Annotated
+
+    from livekit.agents import llm
+    from livekit.agents.voice_assistant import VoiceAssistant, VoiceAssistantOptions
+
+    class SalonFunctions(llm.FunctionContext):
+        @llm.ai_callable(description="Look up the salon's answer to a customer question in its knowledge base")
+        async def lookup_knowledge(
+            self, question: Annotated[str, llm.TypeInfo(description="The customer's question")]
+        ) -> str:
+            answer = await agent.knowledge_base.get_answer(question)
+            return answer or "The knowledge base has no answer to this question."
+
+    async def before_llm(assistant, chat_ctx):
+        # A confident knowledge base match is spoken directly instead of generating a reply
+        answer = await agent.answer_from_knowledge(session, chat_ctx.messages[-1].content)
+        if answer:
+            session.spawn(assistant.say(answer))
+            return False
+        return None
+
+    # Interim transcripts start knowledge base lookups while the caller is still talking
+    speech = {"stt": create_livekit_stt(lambda text: agent.prefetch_answer(session, text))}
+    # The audio cache behind it is shared by every call, so each distinct sentence is synthesized once
+    if agent.tts:
+        speech["tts"] = create_livekit_tts(agent.tts)
+
+    return VoiceAssistant(
+        options=VoiceAssistantOptions(
+            instructions=INSTRUCTIONS,
+            voice=settings.TTS_VOICE,  # OpenAI voice
+            language=settings.TTS_LANGUAGE,
+        ),
+        fnc_ctx=SalonFunctions(),
+        before_llm_cb=before_llm,
+        **speech,
+    )
+
+
+class CallSlots:
+    """Semaphore for calls that may run on different threads' event loops
+    
+    asyncio.Semaphore belongs to one loop, while LiveKit's thread executor
+    gives every call its own. A freed slot passes straight to the longest
+    waiting call, on that call's loop.
+    """
+    
+    def __init__(self, size: int):
+        self.size = size
+        self.active = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._lock = threading.Lock()
+    
+    async def __aenter__(self):
+        with self._lock:
+            if self.active < self.size and not self._waiters:
+                self.active += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and waiter.done() and not waiter.cancelled():
+                # Handed a slot just as the call was cancelled
+                self._release()
+            raise
+    
+    async def __aexit__(self, *exc_info):
+        self._release()
+    
+    def _release(self):
+        with self._lock:
+            if not self._waiters:
+                self.active -= 1
+                return
+            waiter = self._waiters.popleft()
+        waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+    
+    def _hand_over(self, waiter: asyncio.Future):
+        if waiter.done():
+            # The waiting call was cancelled meanwhile; the slot goes to the next one
+            self._release()
+        else:
+            waiter.set_result(None)
+
+
+class CallSession:
+    """State of a single voice call, never shared with other calls"""
+    
+    _ids = itertools.count(1)
+    
+    def __init__(self, room_name: str, customer_phone: str, customer_name: str = None):
+        self.call_id = f"call-{next(self._ids)}"
+        self.room_name = room_name
+        self.customer_phone = customer_phone
+        self.customer_name = customer_name or f"Voice caller {customer_phone}"
+        self.started_at = datetime.utcnow()
+        self.transcript: List[Tuple[str, str]] = []  # (speaker, text)
+        self.current_request: Optional[HelpRequest] = None
+        self.hold_check: Optional[asyncio.Task] = None
+        self.assistant = None
+        self.events: asyncio.Queue = asyncio.Queue()
+        # Knowledge base lookups started from interim transcripts, by normalized text
+        self.prefetches: Dict[str, asyncio.Task] = {}
+        # Other background work for the call, held until it finishes
+        self.tasks: Set[asyncio.Task] = set()
+        self.ended = False
+    
+    @property
+    def last_question(self) -> Optional[str]:
+        """The caller's most recent utterance"""
+        for speaker, text in reversed(self.transcript):
+            if speaker == "user":
+                return text
+        return None
+    
+    def post(self, kind: str, data: Any = None):
+        """Queue an event for the call loop; safe to call from sync callbacks"""
+        self.events.put_nowait((kind, data))
+    
+    def spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background for this call, cancelled when the call ends"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+    
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background task failed in voice call {self.call_id}: {task.exception()}")
+
+
+class SalonVoiceAgent:
+    """Voice AI agent for salon customer service"""
+    
+    def __init__(self, knowledge_base: KnowledgeBase = None, supervisor_notifier: SupervisorNotifier = None,
+                 assistant_factory: Callable[["SalonVoiceAgent", CallSession], Any] = None,
+                 max_concurrent_calls: int = None, tts: CachedTTS = None):
+        # Shared by every call this worker handles
+        self.knowledge_base = knowledge_base or KnowledgeBase()
+        self.supervisor_notifier = supervisor_notifier or SupervisorNotifier()
+        self.assistant_factory = assistant_factory or create_voice_assistant
+        self.tts = tts
+        self.sessions: Dict[str, CallSession] = {}
+        self._call_slots = CallSlots(
+            settings.VOICE_MAX_CONCURRENT_CALLS if max_concurrent_calls is None else max_concurrent_calls
         )
+    
+    async def handle_voice_call(self, ctx: "JobContext"):
+        """Handle an incoming voice call; safe to run for many calls at once, on one loop or many"""
+        async with self._call_slots:
+            logger.info("Voice call started")
+            
+            # Wait for participant to join
+            await ctx.wait_for_participant_connected()
+            participant = ctx.room.remote_participants[0]
+            logger.info(f"Participant connected: {participant.identity}")
+            
+            session = CallSession(ctx.room.name, participant.identity, getattr(participant, "name", None))
+            self.sessions[session.call_id] = session
+            try:
+                await self._run_call(ctx, session)
+            finally:
+                del self.sessions[session.call_id]
+    
+    async def _run_call(self, ctx: "JobContext", session: CallSession):
+        # Each call gets its own assistant, wired to its own session
+        assistant = session.assistant = self.assistant_factory(self, session)
+        assistant.on("user_speech_committed", lambda message: session.post(USER_SPEECH, message.content))
+        assistant.on("agent_speech_committed", lambda message: session.post(AGENT_SPEECH, message.content))
+        
+        def on_participant_disconnected(participant):
+            if participant.identity == session.customer_phone:
+                session.post(HANG_UP)
+        ctx.room.on("participant_disconnected", on_participant_disconnected)
         
         # Start the assistant
         await assistant.start(ctx.room)
         
-        # Handle conversation
+        # Handle conversation, waking only when something happens on the call
         try:
-            while True:
-                # Check if we have a pending request that needs escalation
-                if self.current_request and self.current_request.status == "pending":
-                    # Check if we should escalate this request
-                    if await self.should_escalate():
-                        await self.escalate_to_supervisor(participant.identity)
-                        break
-                
-                await asyncio.sleep(1)
-                
+            while not session.ended:
+                kind, data = await session.events.get()
+                await self._handle_event(session, kind, data)
+        
         except Exception as e:
-            logger.error(f"Error in voice call: {e}")
+            logger.error(f"Error in voice call {session.call_id}: {e}")
         finally:
+            # An answer arriving after the caller hung up goes out as a callback instead
+            if session.current_request is not None:
+                answer_relay.unsubscribe(session.current_request.id)
+            if session.hold_check:
+                session.hold_check.cancel()
+            for task in [*session.prefetches.values(), *session.tasks]:
+                task.cancel()
             await assistant.aclose()
-            logger.info("Voice call ended")
+            logger.info(f"Voice call {session.call_id} ended")
+    
+    async def _handle_event(self, session: CallSession, kind: str, data: Any):
+        if kind == HANG_UP:
+            session.ended = True
+        
+        elif kind == USER_SPEECH:
+            session.transcript.append(("user", data))
+        
+        elif kind == AGENT_SPEECH:
+            session.transcript.append(("agent", data))
+            # The assistant could not answer and is handing off to a supervisor
+            if ESCALATION_PHRASE in data.lower():
+                await self._handle_event(session, KB_MISS, session.last_question)
+        
+        elif kind == KB_MISS and session.current_request is None:
+            if await self.should_escalate(session):
+                await self.escalate_to_supervisor(session)
+        
+        elif kind == SUPERVISOR_ANSWER:
+            request = session.current_request
+            session.current_request = None
+            if session.hold_check:
+                session.hold_check.cancel()
+            hold_seconds = (datetime.utcnow() - request.created_at).total_seconds() if request.created_at else 0
+            logger.info(f"Relaying supervisor answer to {session.call_id} after {hold_seconds:.1f}s on hold")
+            await session.assistant.say(f"Thanks for holding. {data}")
+        
+        elif kind == SUPERVISOR_TIMEOUT:
+            # No answer in time; the caller can ask again, and a new question escalates afresh
+            request = session.current_request
+            session.current_request = None
+            if session.hold_check:
+                session.hold_check.cancel()
+            logger.info(f"Help request #{request.id} for {session.call_id} timed out while on hold")
+            await session.assistant.say(data)
     
-    async def should_escalate(self) -> bool:
-        """Determine if current request should be escalated"""
-        if not self.current_request:
+    def prefetch_answer(self, session: CallSession, partial_question: str):
+        """Start looking up an interim transcript so the answer is ready at end of speech
+        
+        Called straight from the STT stream rather than through the event
+        queue, so the lookup begins at once.
+        """
+        key = normalize_question(partial_question)
+        if not key or key in session.prefetches:
+            return
+        if len(session.prefetches) >= MAX_PREFETCHES:
+            oldest = next(iter(session.prefetches))
+            session.prefetches.pop(oldest).cancel()
+        session.prefetches[key] = asyncio.create_task(self.knowledge_base.get_match(partial_question))
+    
+    async def answer_from_knowledge(self, session: CallSession, question: str) -> Optional[str]:
+        """Fast path answer to the caller's final question, from a prefetch if one matches
+        
+        Only matches scoring at least VOICE_FAST_PATH_SCORE are returned; for
+        anything less the LLM decides, with the knowledge base as a tool.
+        """
+        task = session.prefetches.pop(normalize_question(question), None)
+        for stale in session.prefetches.values():
+            stale.cancel()
+        session.prefetches.clear()
+        
+        match = await task if task else await self.knowledge_base.get_match(question)
+        if not match or match["score"] < settings.VOICE_FAST_PATH_SCORE:
+            return None
+        KB_ANSWERS.inc(prefetched="true" if task else "false")
+        return match["answer"]
+    
+    async def prewarm_tts(self) -> int:
+        """Synthesize every active knowledge base answer not already in the audio cache"""
+        answers = [entry["answer"] for entry in await self.knowledge_base.get_all_knowledge()]
+        try:
+            rendered = await self.tts.prewarm(answers)
+        except Exception as e:
+            logger.error(f"Error prewarming TTS cache: {e}")
+            return 0
+        logger.info(f"TTS cache prewarmed: {rendered} sentences synthesized for {len(answers)} answers")
+        return rendered
+    
+    async def should_escalate(self, session: CallSession) -> bool:
+        """Determine if the call's open question should be escalated"""
+        if not session.last_question:
             return False
-            
+        
         # Check if request has been pending for too long
         # or if it's a complex question that needs human help
         return True  # For demo purposes, always escalate
     
-    async def escalate_to_supervisor(self, customer_phone: str):
-        """Escalate current request to human supervisor"""
-        logger.info(f"Escalating request for {customer_phone} to supervisor")
+    def _on_reply(self, session: CallSession, future: asyncio.Future):
+        if future.cancelled():
+            return
+        reply = future.result()
+        session.post(SUPERVISOR_TIMEOUT if reply.timed_out else SUPERVISOR_ANSWER, reply.message)
+    
+    async def _check_hold(self, request: HelpRequest):
+        """Read a held request back from the database, in case the event stream missed its answer
         
-        if self.current_request:
-            # Notify supervisor
-            await self.supervisor_notifier.notify_supervisor(
-                self.current_request.id,
-                f"Voice call escalation from {customer_phone}"
-            )
-            
-            # Update request status
-            with get_db_session() as db:
-                request = db.query(HelpRequest).filter(
-                    HelpRequest.id == self.current_request.id
-                ).first()
-                if request:
-                    request.status = "pending"
-                    db.commit()
-
-# Global agent instance
+        A caller still holding past the request's timeout is told no answer
+        came, even if nothing has marked the request timed out yet.
+        """
+        while request.id in answer_relay:
+            wait = settings.VOICE_HOLD_CHECK_SECONDS
+            if request.timeout_at:
+                wait = max(0.0, min(wait, (request.timeout_at - datetime.utcnow()).total_seconds()))
+            await asyncio.sleep(wait)
+            try:
+                if await answer_relay.check(request.id):
+                    return
+            except Exception as e:
+                logger.warning(f"Could not check help request #{request.id} on hold: {e}")
+            if request.timeout_at and datetime.utcnow() >= request.timeout_at:
+                answer_relay.deliver_timeout(request.id, timeout_message())
+                return
+    
+    async def escalate_to_supervisor(self, session: CallSession):
+        """Open a help request for the call's last question and notify the supervisor"""
+        logger.info(f"Escalating request for {session.customer_phone} to supervisor")
+        
+        question = session.last_question
+        request = HelpRequest(
+            customer_phone=session.customer_phone,
+            customer_name=session.customer_name,
+            question=question,
+            context=f"Voice call {session.call_id} in room {session.room_name}",
+            status=REQUEST_STATUS_PENDING
+        )
+        async with get_db_session() as db:
+            db.add(request)
+            await db.commit()
+            await db.refresh(request)
+        session.current_request = request
+        
+        # Keep the caller on hold until the answer or a timeout is relayed, or they hang up
+        reply = answer_relay.subscribe(request.id)
+        reply.add_done_callback(lambda future: self._on_reply(session, future))
+        session.hold_check = asyncio.create_task(self._check_hold(request))
+        
+        # Notify supervisor
+        await self.supervisor_notifier.notify_supervisor(request.id, session.customer_name, question)
+
+# Global agent instance, shared by every call in this process
 agent = SalonVoiceAgent()
 
-async def entrypoint(ctx: JobContext):
-    """Entry point for LiveKit agent"""
-    await agent.handle_voice_call(ctx)
+_services_lock = threading.Lock()
+_services_ready: Optional[threading.Event] = None
+
+def _open_tts_cache():
+    """Point the agent at the TTS audio cache shared by every process on this machine"""
+    agent.tts = create_tts_cache(
+        create_tts_provider(settings.TTS_PROVIDER, settings.TTS_VOICE, settings.TTS_LANGUAGE),
+        settings.TTS_CACHE_DIR,
+        settings.TTS_CACHE_MAX_MB
+    )
+
+def start_worker_services(timeout: float = 10.0):
+    """Start what outlives a single call on a thread and event loop of its own, once per process
+    
+    Each call's loop ends with the call, so the supervisor event stream and
+    the notification dispatcher run here instead. Returns once the knowledge
+    index is loaded (or after timeout); with TTS_CACHE_PREWARM, answers are
+    then synthesized into the audio cache in the background.
+    """
+    global _services_ready
+    with _services_lock:
+        if _services_ready is None:
+            _services_ready = threading.Event()
+            threading.Thread(
+                target=asyncio.run, args=(_worker_services(_services_ready),), name="voice-worker-services", daemon=True
+            ).start()
+    _services_ready.wait(timeout)
+
+async def _worker_services(ready: threading.Event):
+    async with own_engine():
+        agent.supervisor_notifier.dispatcher.start()
+        try:
+            await agent.knowledge_base.start()
+        except Exception as e:
+            logger.error(f"Error loading knowledge index: {e}")
+        finally:
+            ready.set()
+        if settings.TTS_CACHE_PREWARM and agent.tts:
+            await agent.prewarm_tts()
+        if settings.SUPERVISOR_EVENTS_URL:
+            # Answers given in the supervisor app reach calls on hold from here
+            await answer_relay.follow(settings.SUPERVISOR_EVENTS_URL)
+        else:
+            await asyncio.Event().wait()
+
+def prewarm_process(proc: "JobProcess"):
+    """LiveKit initializer, run before the worker is given calls
+    
+    Opens the TTS audio cache and starts the worker services, so the first
+    call finds the knowledge index loaded. Safe to run more than once.
+    """
+    with _services_lock:
+        if agent.tts is None:
+            _open_tts_cache()
+    start_worker_services()
+
+async def entrypoint(ctx: "JobContext"):
+    """Entry point for LiveKit agent, run on the call's own thread and event loop"""
+    # Database connections belong to the loop that opens them, which ends with the call
+    async with own_engine():
+        await agent.handle_voice_call(ctx)
 
 if __name__ == "__main__":
+    from livekit.agents import AutoSubscribe, JobExecutorType, WorkerOptions, cli
+    from livekit.plugins import openai
+    
     # Configure OpenAI
     openai.api_key = settings.OPENAI_API_KEY
     
-    # Start the agent
+    # Start the agent, running every call in this process on a thread of its own
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm_process,
+            job_executor_type=JobExecutorType.THREAD,
             auto_subscribe=AutoSubscribe.AUDIO_ONLY,
         )
     )